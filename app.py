@@ -1,18 +1,32 @@
-from flask import Flask, render_template, request, jsonify, send_file
-import firebase_admin
-from firebase_admin import credentials, firestore
-from datetime import datetime
+from flask import Flask, Response, g, has_request_context, make_response, render_template, request, jsonify, send_file
+from flask.json.provider import DefaultJSONProvider
+from datetime import datetime, timedelta, timezone
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import base64
+import bisect
 import calendar
+import csv
+import gzip
+import hashlib
+import heapq
 import io
+import itertools
+import math
 import os
+import re
 import json
+import secrets
+import sqlite3
+import multiprocessing
+import tempfile
+import threading
+import time
+import unicodedata
+import zipfile
 from dotenv import load_dotenv
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib import colors
-from reportlab.lib.units import inch
-import xlsxwriter
 
 # Cargar variables de entorno
 load_dotenv()
@@ -20,9 +34,12 @@ load_dotenv()
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'default-secret-key-change-in-production')
 
-# Inicializar Firebase
+# Firebase, ReportLab y XlsxWriter se importan en el primer uso para arrancar rápido
 def init_firebase():
     """Inicializar Firebase con credenciales desde .env o key.json"""
+    import firebase_admin
+    from firebase_admin import credentials
+    
     if not firebase_admin._apps:
         # Intentar cargar desde variables de entorno
         firebase_config = {
@@ -51,8 +68,24 @@ def init_firebase():
         else:
             raise Exception("No se encontraron credenciales de Firebase. Configura las variables de entorno o crea key.json")
 
-init_firebase()
-db = firestore.client()
+_db = None
+_db_lock = threading.Lock()
+
+def get_db():
+    """Cliente de Firestore, creado en el primer uso"""
+    global _db
+    if _db is None:
+        with _db_lock:
+            if _db is None:
+                from firebase_admin import firestore
+                init_firebase()
+                _db = firestore.client()
+    return _db
+
+def ejecutar_transaccion(funcion, *args):
+    """Ejecutar funcion(transaction, *args) en una transacción que se reintenta si hay conflicto"""
+    from firebase_admin import firestore
+    return firestore.transactional(funcion)(get_db().transaction(), *args)
 
 # Nombre de los meses en español
 MESES = [
@@ -60,6 +93,8 @@ MESES = [
     'Julio', 'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre'
 ]
 
+GRUPOS = list(range(1, 7))
+
 ESTADOS = [
     'Publicador',
     'Precursor Auxiliar',
@@ -67,6 +102,1144 @@ ESTADOS = [
     'Precursor Regular'
 ]
 
+# Firestore admite como máximo 500 operaciones por WriteBatch
+BATCH_SIZE = 500
+
+# Formato de los registros mensuales: 'array' (lista hours) o 'map' (months por YYYY-MM)
+HOURS_LAYOUT = os.getenv('HOURS_LAYOUT', 'array')
+
+# Cache de informes agregados por (grupo, mes, año)
+REPORTE_CACHE_TTL = int(os.getenv('REPORTE_CACHE_TTL', '300'))
+REPORTE_CACHE_MAX = int(os.getenv('REPORTE_CACHE_MAX', '64'))
+
+# Réplica en memoria de Publishers mantenida con on_snapshot
+PUBLISHERS_SNAPSHOT = os.getenv('PUBLISHERS_SNAPSHOT', 'false').lower() == 'true'
+SNAPSHOT_CHECK_INTERVAL = int(os.getenv('SNAPSHOT_CHECK_INTERVAL', '30'))
+
+# Exportación Excel en modo constant_memory enviada por partes
+EXCEL_STREAMING = os.getenv('EXCEL_STREAMING', 'true').lower() == 'true'
+XLSX_SPOOL_MAX = int(os.getenv('XLSX_SPOOL_MAX', str(1024 * 1024)))
+EXPORT_CHUNK_SIZE = 64 * 1024
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Tamaño máximo de página de los listados de publishers y campos que se pueden pedir
+PAGINA_MAX = int(os.getenv('PAGINA_MAX', '500'))
+CAMPOS_PUBLISHER = ('name', 'groupID', 'state', 'hours', 'months', 'updatedAt')
+
+# Índice de búsqueda por nombre: se rehace tras las escrituras y, para ver las de otros
+# procesos, como mucho cada BUSQUEDA_TTL segundos. Similitud por trigramas entre 0 y 1
+BUSQUEDA_TTL = int(os.getenv('BUSQUEDA_TTL', '300'))
+BUSQUEDA_MAX = int(os.getenv('BUSQUEDA_MAX', '20'))
+BUSQUEDA_SIMILITUD = float(os.getenv('BUSQUEDA_SIMILITUD', '0.3'))
+DUPLICADO_SIMILITUD = float(os.getenv('DUPLICADO_SIMILITUD', '0.6'))
+
+# Máximo de meses de un informe por rango
+RANGO_MAX_MESES = int(os.getenv('RANGO_MAX_MESES', '36'))
+
+# Cache de PDF ya renderizados, indexada por el hash de los datos del informe
+PDF_CACHE_TTL = int(os.getenv('PDF_CACHE_TTL', '3600'))
+PDF_CACHE_MAX = int(os.getenv('PDF_CACHE_MAX', '32'))
+
+# Trabajos de exportación en segundo plano, renderizados en un pool de procesos
+EXPORT_JOBS_DIR = os.getenv('EXPORT_JOBS_DIR', os.path.join(tempfile.gettempdir(), 'export_jobs'))
+EXPORT_JOBS_WORKERS = int(os.getenv('EXPORT_JOBS_WORKERS', '2'))
+EXPORT_JOBS_TTL = int(os.getenv('EXPORT_JOBS_TTL', '3600'))
+# Un trabajo pendiente más antiguo se da por interrumpido y se vuelve a encolar
+EXPORT_JOBS_TIMEOUT = int(os.getenv('EXPORT_JOBS_TIMEOUT', '600'))
+
+# Almacenamiento: 'firestore' o 'sqlite' (un archivo local, p. ej. en un volumen de Fly.io)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'firestore')
+SQLITE_PATH = os.getenv('SQLITE_PATH', 'reports.db')
+
+# Historial compactado en archivos Arrow IPC (uno por año) para las consultas de varios años
+HISTORIAL_DIR = os.getenv('HISTORIAL_DIR', os.path.join(tempfile.gettempdir(), 'historial'))
+HISTORIAL_CLAVES = ('grupo', 'state', 'year', 'month', 'publisher')
+
+# Pool de hilos para generar a la vez el PDF y el Excel del ZIP de la congregación
+EXPORT_WORKERS = int(os.getenv('EXPORT_WORKERS', '4'))
+export_pool = ThreadPoolExecutor(max_workers=EXPORT_WORKERS)
+
+# Procesos que renderizan a la vez el PDF de cada grupo de la congregación (1 = en serie)
+EXPORT_PROCESOS = int(os.getenv('EXPORT_PROCESOS', str(min(len(GRUPOS), os.cpu_count() or 1))))
+
+# Lecturas de varios grupos: una consulta 'in' por cada FIRESTORE_IN_MAX grupos (Firestore
+# admite 30) y, si hacen falta varias, se leen a la vez en un pool acotado
+FIRESTORE_IN_MAX = int(os.getenv('FIRESTORE_IN_MAX', '30'))
+FIRESTORE_FANOUT = int(os.getenv('FIRESTORE_FANOUT', '6'))
+consulta_pool = ThreadPoolExecutor(max_workers=FIRESTORE_FANOUT)
+
+# Crear el cliente de Firestore y cargar las librerías de exportación en segundo plano al arrancar
+WARMUP_ON_BOOT = os.getenv('WARMUP_ON_BOOT', 'false').lower() == 'true'
+
+# Procesos de gunicorn: con más de uno las versiones de cada proceso solo son fiables con la réplica
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', '1'))
+
+# Compresión de las respuestas JSON grandes (gzip, o brotli si está instalado)
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', '6'))
+
+# Caché del navegador para la lista fija de grupos
+GRUPOS_MAX_AGE = int(os.getenv('GRUPOS_MAX_AGE', '86400'))
+
+# Registrar las peticiones más lentas que este umbral en milisegundos (0 = desactivado)
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', '0'))
+
+# Límites (segundos) de los histogramas de latencia
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Sincronización del almacén offline del navegador: margen para escrituras en vuelo
+# y relojes desfasados entre procesos, y días que se conservan las eliminaciones
+SYNC_MARGEN_MS = int(os.getenv('SYNC_MARGEN_MS', '60000'))
+SYNC_TOMBSTONE_DIAS = int(os.getenv('SYNC_TOMBSTONE_DIAS', '30'))
+
+# Máximo de filas de un archivo de importación (CSV o XLSX)
+IMPORT_MAX_FILAS = int(os.getenv('IMPORT_MAX_FILAS', '50000'))
+
+class CacheLRU:
+    """Cache LRU en memoria con expiración por TTL, segura entre hilos"""
+
+    def __init__(self, max_items, ttl):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, clave):
+        with self._lock:
+            item = self._datos.get(clave)
+            if item is None:
+                return None
+            expira, valor = item
+            if expira < time.monotonic():
+                del self._datos[clave]
+                return None
+            self._datos.move_to_end(clave)
+            return valor
+
+    def set(self, clave, valor):
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + self.ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_items:
+                self._datos.popitem(last=False)
+
+    def invalidar(self, predicado=None):
+        """Eliminar las entradas que cumplan el predicado (o todas)"""
+        with self._lock:
+            if predicado is None:
+                self._datos.clear()
+                return
+            for clave in [c for c in self._datos if predicado(c)]:
+                del self._datos[clave]
+
+reporte_cache = CacheLRU(REPORTE_CACHE_MAX, REPORTE_CACHE_TTL)
+pdf_cache = CacheLRU(PDF_CACHE_MAX, PDF_CACHE_TTL)
+
+def formato_etiquetas(etiquetas):
+    """Etiquetas {a="x",b="y"} en el formato de texto de Prometheus"""
+    if not etiquetas:
+        return ''
+    partes = []
+    for nombre, valor in etiquetas:
+        valor = str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        partes.append(f'{nombre}="{valor}"')
+    return '{' + ','.join(partes) + '}'
+
+class Metricas:
+    """Contadores e histogramas en memoria del proceso, exportados para Prometheus"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self._tipos = {}
+        self._contadores = {}
+        self._histogramas = {}
+        self._lock = threading.Lock()
+
+    def describir(self, nombre, tipo, ayuda):
+        self._tipos[nombre] = (tipo, ayuda)
+
+    def incrementar(self, nombre, etiquetas, valor=1):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            self._contadores[clave] = self._contadores.get(clave, 0) + valor
+
+    def observar(self, nombre, etiquetas, valor):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            histograma = self._histogramas.get(clave)
+            if histograma is None:
+                # Cuentas por intervalo (la última es +Inf), suma y total
+                histograma = self._histogramas[clave] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            histograma[0][bisect.bisect_left(self.buckets, valor)] += 1
+            histograma[1] += valor
+            histograma[2] += 1
+
+    def exportar(self):
+        """Todas las métricas en el formato de texto de Prometheus"""
+        with self._lock:
+            contadores = sorted(self._contadores.items())
+            histogramas = sorted((clave, (list(h[0]), h[1], h[2])) for clave, h in self._histogramas.items())
+        
+        lineas = []
+        for nombre, (tipo, ayuda) in self._tipos.items():
+            lineas.append(f'# HELP {nombre} {ayuda}')
+            lineas.append(f'# TYPE {nombre} {tipo}')
+            if tipo == 'counter':
+                for (metrica, etiquetas), valor in contadores:
+                    if metrica == nombre:
+                        lineas.append(f'{nombre}{formato_etiquetas(etiquetas)} {valor}')
+                continue
+            
+            for (metrica, etiquetas), (cuentas, suma, total) in histogramas:
+                if metrica != nombre:
+                    continue
+                acumulado = 0
+                for limite, cuenta in zip(self.buckets + ('+Inf',), cuentas):
+                    acumulado += cuenta
+                    lineas.append(f'{nombre}_bucket{formato_etiquetas(etiquetas + (("le", limite),))} {acumulado}')
+                lineas.append(f'{nombre}_sum{formato_etiquetas(etiquetas)} {suma}')
+                lineas.append(f'{nombre}_count{formato_etiquetas(etiquetas)} {total}')
+        return '\n'.join(lineas) + '\n'
+
+metricas = Metricas(METRICS_BUCKETS)
+metricas.describir('http_request_duration_seconds', 'histogram', 'Duración de las peticiones por endpoint')
+metricas.describir('app_phase_duration_seconds', 'histogram', 'Duración de las fases fetch, aggregate y render')
+metricas.describir('firestore_operations_total', 'counter', 'Llamadas a Firestore por endpoint y operación')
+metricas.describir('firestore_document_reads_total', 'counter', 'Documentos leídos de Firestore')
+metricas.describir('firestore_document_writes_total', 'counter', 'Documentos escritos en Firestore')
+
+def endpoint_actual():
+    """Endpoint de la petición en curso, o 'background' fuera de una petición"""
+    if has_request_context():
+        return request.endpoint or 'desconocido'
+    return 'background'
+
+@contextmanager
+def medir_fase(fase):
+    """Medir la duración de una fase (fetch, aggregate, render) del endpoint actual"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        metricas.observar(
+            'app_phase_duration_seconds',
+            {'endpoint': endpoint_actual(), 'phase': fase},
+            time.perf_counter() - inicio
+        )
+
+def contar_firestore(operacion, lecturas=0, escrituras=0, endpoint=None):
+    """Registrar una llamada a Firestore y los documentos que leyó o escribió"""
+    etiquetas = {'endpoint': endpoint or endpoint_actual()}
+    metricas.incrementar('firestore_operations_total', dict(etiquetas, operation=operacion))
+    if lecturas:
+        metricas.incrementar('firestore_document_reads_total', etiquetas, lecturas)
+    if escrituras:
+        metricas.incrementar('firestore_document_writes_total', etiquetas, escrituras)
+    if has_request_context():
+        g.lecturas = g.get('lecturas', 0) + lecturas
+        g.escrituras = g.get('escrituras', 0) + escrituras
+
+def leer_consulta(query):
+    """Ejecutar una consulta contando los documentos leídos"""
+    documentos = list(query.stream())
+    contar_firestore('query', lecturas=len(documentos))
+    return documentos
+
+def leer_documentos(refs, field_paths=None, transaction=None):
+    """get_all contando los documentos leídos (también los que no existen)"""
+    documentos = list(get_db().get_all(refs, field_paths=field_paths, transaction=transaction))
+    contar_firestore('get_all', lecturas=len(documentos))
+    return documentos
+
+@app.before_request
+def iniciar_medicion():
+    g.inicio = time.perf_counter()
+
+@app.after_request
+def registrar_medicion(response):
+    """Histograma de latencia por endpoint y registro de peticiones lentas"""
+    inicio = g.get('inicio')
+    if inicio is None:
+        return response
+    duracion = time.perf_counter() - inicio
+    metricas.observar(
+        'http_request_duration_seconds',
+        {'endpoint': endpoint_actual(), 'method': request.method, 'status': response.status_code},
+        duracion
+    )
+    if SLOW_REQUEST_MS and duracion * 1000 >= SLOW_REQUEST_MS:
+        app.logger.warning(
+            'Petición lenta: %s %s -> %s en %.0f ms (%d lecturas, %d escrituras)',
+            request.method, request.full_path.rstrip('?'), response.status_code,
+            duracion * 1000, g.get('lecturas', 0), g.get('escrituras', 0)
+        )
+    return response
+
+def clave_mes(mes, year):
+    """Clave YYYY-MM de un registro mensual"""
+    return f'{int(year):04d}-{int(mes):02d}'
+
+def campo_mes(mes, year):
+    """Ruta del campo months.`YYYY-MM` para consultas y actualizaciones"""
+    from google.cloud.firestore_v1.field_path import FieldPath
+    return FieldPath('months', clave_mes(mes, year)).to_api_repr()
+
+def campo_registros(persona_data):
+    """'hours' o 'months': el de HOURS_LAYOUT, o el otro si el documento solo tiene ese
+
+    Tras migrate_hours.py sin --drop-hours, o al volver a HOURS_LAYOUT=array, un
+    documento tiene los dos; las escrituras solo mantienen al día el de HOURS_LAYOUT.
+    """
+    preferido, otro = ('months', 'hours') if HOURS_LAYOUT == 'map' else ('hours', 'months')
+    return otro if preferido not in persona_data and otro in persona_data else preferido
+
+def registros_activos(persona_data):
+    """Quitar de una persona la copia de los registros que ya no se mantiene"""
+    if 'hours' in persona_data and 'months' in persona_data:
+        del persona_data['hours' if campo_registros(persona_data) == 'months' else 'months']
+    return persona_data
+
+def registro_mes(persona_data, mes, year):
+    """Obtener el registro de un mes desde el mapa months o la lista hours"""
+    if campo_registros(persona_data) == 'months':
+        return persona_data['months'].get(clave_mes(mes, year))
+    
+    for hour_entry in persona_data.get('hours', []):
+        if hour_entry.get('month') == mes and hour_entry.get('year') == year:
+            return hour_entry
+    return None
+
+def registros_persona(persona_data):
+    """Registros mensuales de una persona, tenga el mapa months o la lista hours"""
+    if campo_registros(persona_data) == 'months':
+        return list(persona_data['months'].values())
+    return persona_data.get('hours', [])
+
+def registros_por_mes(persona_data):
+    """{(mes, año): registro} de todos los meses guardados de una persona"""
+    if campo_registros(persona_data) == 'months':
+        return {parsear_clave_mes(clave): registro for clave, registro in persona_data['months'].items()}
+    return {
+        (registro.get('month'), registro.get('year')): registro
+        for registro in persona_data.get('hours', [])
+        if registro.get('month') and registro.get('year')
+    }
+
+def con_registro(persona_data, new_hour):
+    """Copia de una persona con el registro de un mes guardado o reemplazado"""
+    persona = dict(persona_data)
+    if HOURS_LAYOUT == 'map':
+        persona['months'] = dict(persona_data.get('months', {}))
+        persona['months'][clave_mes(new_hour['month'], new_hour['year'])] = new_hour
+    else:
+        persona.update(cambios_registro_mes(persona_data, new_hour))
+    return persona
+
+def hours_a_months(hours_array):
+    """Convertir la lista hours al mapa months indexado por YYYY-MM"""
+    return {
+        clave_mes(entry['month'], entry['year']): entry
+        for entry in hours_array
+        if entry.get('month') and entry.get('year')
+    }
+
+def consulta_mes(query, mes, year):
+    """Limitar una consulta de Publishers a los campos del informe de un mes"""
+    if HOURS_LAYOUT != 'map':
+        return query
+    return query.select(['name', 'state', 'groupID', campo_mes(mes, year)])
+
+def numero(valor):
+    """Un valor numérico de Firestore, o 0 si falta o no es un número"""
+    if isinstance(valor, bool) or not isinstance(valor, (int, float)):
+        return 0
+    return valor
+
+class RegistroMes:
+    """Registro de un mes de una persona, con los valores ya normalizados"""
+    __slots__ = ('horas', 'estudios', 'participo', 'comentario')
+
+    def __init__(self, horas=0, estudios=0, participo=False, comentario=''):
+        self.horas = horas
+        self.estudios = estudios
+        self.participo = participo
+        self.comentario = comentario
+
+    @classmethod
+    def desde_dict(cls, entry):
+        """Leer un registro de hours o de months (None = sin informe ese mes)"""
+        if entry is None:
+            return cls()
+        comentario = entry.get('Comentario')
+        return cls(
+            numero(entry.get('hours')),
+            numero(entry.get('estudios')),
+            bool(entry.get('Participo', False)),
+            comentario if isinstance(comentario, str) else ''
+        )
+
+class Persona:
+    """Fila del informe mensual: una persona y su registro del mes
+
+    Los informes en cache, los PDF y los Excel usan estas filas; a JSON se
+    convierten con a_dict, que conserva la forma de la API.
+    """
+    __slots__ = ('id', 'nombre', 'state', 'grupo', 'registro')
+
+    def __init__(self, id, nombre, state, grupo, registro):
+        self.id = id
+        self.nombre = nombre
+        self.state = state
+        self.grupo = grupo
+        self.registro = registro
+
+    @classmethod
+    def desde_dict(cls, persona_data, mes, year):
+        """Leer una persona de Publishers con su registro de (mes, year)"""
+        return cls(
+            persona_data.get('id'),
+            persona_data.get('name') or 'Sin nombre',
+            persona_data.get('state', 'Publicador'),
+            persona_data.get('groupID'),
+            RegistroMes.desde_dict(registro_mes(persona_data, mes, year))
+        )
+
+    def a_dict(self):
+        registro = self.registro
+        return {
+            'nombre': self.nombre,
+            'horas': registro.horas,
+            'participo': registro.participo,
+            'estudios': registro.estudios,
+            'comentario': registro.comentario
+        }
+
+def a_json(objeto, respaldo=str):
+    """Serializar para JSON las filas del informe (y con respaldo lo demás)"""
+    if isinstance(objeto, Persona):
+        return objeto.a_dict()
+    return respaldo(objeto)
+
+class ProveedorJSON(DefaultJSONProvider):
+    """jsonify que admite las filas del informe"""
+
+    @staticmethod
+    def default(objeto):
+        return a_json(objeto, DefaultJSONProvider.default)
+
+app.json = ProveedorJSON(app)
+
+def agregar_reporte(personas, grupo_id, mes, year):
+    """Agrupar por estado las filas del mes y calcular los totales"""
+    reporte = {estado: [] for estado in ESTADOS}
+
+    for persona_data in personas:
+        persona = Persona.desde_dict(persona_data, mes, year)
+        if persona.state in reporte:
+            reporte[persona.state].append(persona)
+
+    # Calcular totales (solo horas para no Publicadores)
+    totales = {}
+    totales_estudios = {}
+    for estado, personas_estado in reporte.items():
+        if estado == 'Publicador':
+            # Para publicadores, contar cuántos participaron
+            totales[estado] = sum(1 for p in personas_estado if p.registro.participo)
+        else:
+            # Para otros, sumar horas y estudios
+            totales[estado] = sum(p.registro.horas for p in personas_estado)
+            totales_estudios[estado] = sum(p.registro.estudios for p in personas_estado)
+
+    # Total general solo de horas (sin publicadores)
+    total_general = sum(totales[estado] for estado in totales if estado != 'Publicador')
+    total_estudios_general = sum(totales_estudios.values())
+
+    return {
+        'reporte': reporte,
+        'totales': totales,
+        'totales_estudios': totales_estudios,
+        'total_general': total_general,
+        'total_estudios_general': total_estudios_general,
+        'mes': MESES[mes - 1],
+        'year': year,
+        'grupo': grupo_id
+    }
+
+def construir_reporte(grupo_id, mes, year):
+    """Leer el grupo y agregar el informe del mes"""
+    with medir_fase('fetch'):
+        personas = repositorio().personas_grupos([grupo_id], mes, year)[grupo_id]
+    with medir_fase('aggregate'):
+        return agregar_reporte(personas, grupo_id, mes, year)
+
+def obtener_reporte(grupo_id, mes, year):
+    """Obtener el informe agregado desde la cache o construirlo"""
+    clave = (grupo_id, mes, year)
+    datos = reporte_cache.get(clave)
+    if datos is None:
+        datos = construir_reporte(grupo_id, mes, year)
+        reporte_cache.set(clave, datos)
+    return datos
+
+def obtener_reportes_congregacion(mes, year):
+    """Obtener los informes de todos los grupos con una sola consulta"""
+    reportes = {grupo_id: reporte_cache.get((grupo_id, mes, year)) for grupo_id in GRUPOS}
+    faltantes = [grupo_id for grupo_id, datos in reportes.items() if datos is None]
+    
+    if faltantes:
+        with medir_fase('fetch'):
+            personas_por_grupo = repositorio().personas_grupos(faltantes, mes, year)
+        with medir_fase('aggregate'):
+            for grupo_id, personas in personas_por_grupo.items():
+                datos = agregar_reporte(personas, grupo_id, mes, year)
+                reporte_cache.set((grupo_id, mes, year), datos)
+                reportes[grupo_id] = datos
+    
+    return [reportes[grupo_id] for grupo_id in GRUPOS]
+
+class VersionesGrupo:
+    """Versión de los datos de cada grupo, que cambia con cada escritura
+
+    Las respuestas de lectura llevan un ETag derivado de estas versiones, así que
+    un If-None-Match se puede responder con 304 sin consultar Firestore. La época
+    distingue los contadores de cada proceso; el tramo, si se indica, hace que el
+    ETag caduque aunque no cambie la versión.
+    """
+
+    def __init__(self):
+        self._epoca = os.urandom(4).hex()
+        self._versiones = {}
+        self._todas = 0
+        self._lock = threading.Lock()
+
+    def incrementar(self, grupo_id=None):
+        with self._lock:
+            if grupo_id is None:
+                self._todas += 1
+            else:
+                self._versiones[grupo_id] = self._versiones.get(grupo_id, 0) + 1
+
+    def etag(self, clave, grupo_id=None, tramo=None):
+        """ETag de una respuesta que depende de un grupo (o de todos con None)"""
+        with self._lock:
+            if grupo_id is None:
+                partes = (self._todas, sorted(self._versiones.items(), key=str))
+            else:
+                partes = (self._todas, self._versiones.get(grupo_id, 0))
+        contenido = f'{self._epoca}|{tramo}|{clave}|{partes}'
+        return hashlib.sha256(contenido.encode('utf-8')).hexdigest()[:32]
+
+versiones = VersionesGrupo()
+
+def invalidar_reporte(grupo_id=None):
+    """Descartar los informes en cache de un grupo (o de todos) y cambiar su versión"""
+    if grupo_id is None:
+        reporte_cache.invalidar()
+        versiones.incrementar()
+        return
+    try:
+        grupo_id = int(grupo_id)
+    except (TypeError, ValueError):
+        reporte_cache.invalidar()
+        versiones.incrementar()
+        return
+    reporte_cache.invalidar(lambda clave: clave[0] == grupo_id)
+    versiones.incrementar(grupo_id)
+
+class ReplicaPublishers:
+    """Copia en memoria de Publishers, indexada por id y por groupID
+
+    Se carga con el primer snapshot de on_snapshot y se mantiene al día con los
+    cambios siguientes. Mientras no está lista las lecturas van a Firestore.
+    """
+
+    def __init__(self):
+        self._por_id = {}
+        self._por_grupo = {}
+        self._lock = threading.Lock()
+        self._listo = threading.Event()
+        self._watch = None
+
+    @property
+    def listo(self):
+        watch = self._watch
+        return self._listo.is_set() and watch is not None and getattr(watch, 'is_active', True)
+
+    def iniciar(self):
+        """Suscribirse en segundo plano con un hilo que reinicia el listener si se cae"""
+        threading.Thread(target=self._vigilar, daemon=True, name='replica-publishers').start()
+
+    def _suscribir(self):
+        self._listo.clear()
+        with self._lock:
+            self._por_id.clear()
+            self._por_grupo.clear()
+        self._watch = get_db().collection('Publishers').on_snapshot(self._al_cambiar)
+
+    def _vigilar(self):
+        """Suscribirse y volver a hacerlo cuando el stream de Firestore termina"""
+        while True:
+            watch = self._watch
+            if watch is None or not getattr(watch, 'is_active', True):
+                if watch is not None:
+                    print("⚠ Listener de Publishers inactivo, resincronizando")
+                    try:
+                        watch.unsubscribe()
+                    except Exception:
+                        pass
+                try:
+                    self._suscribir()
+                    if watch is not None:
+                        invalidar_reporte()
+                        indice_nombres.invalidar()
+                except Exception as e:
+                    print(f"⚠ No se pudo iniciar el listener de Publishers: {e}")
+            time.sleep(SNAPSHOT_CHECK_INTERVAL)
+
+    def _al_cambiar(self, snapshot, cambios, read_time):
+        contar_firestore('listen', lecturas=len(cambios), endpoint='replica')
+        grupos = set()
+        nombres = False
+        with self._lock:
+            for cambio in cambios:
+                doc = cambio.document
+                anterior = self._por_id.pop(doc.id, None)
+                if anterior is not None:
+                    grupo_anterior = anterior.get('groupID')
+                    self._por_grupo.get(grupo_anterior, {}).pop(doc.id, None)
+                    grupos.add(grupo_anterior)
+                
+                if cambio.type.name == 'REMOVED':
+                    nombres = True
+                    continue
+                
+                persona_data = registros_activos(doc.to_dict())
+                persona_data['id'] = doc.id
+                grupo_id = persona_data.get('groupID')
+                self._por_id[doc.id] = persona_data
+                self._por_grupo.setdefault(grupo_id, {})[doc.id] = persona_data
+                grupos.add(grupo_id)
+                if anterior is None or anterior.get('name') != persona_data.get('name'):
+                    nombres = True
+                else:
+                    indice_nombres.actualizar(doc.id, persona_data)
+        
+        if not self._listo.is_set():
+            print(f"✓ Réplica de Publishers cargada ({len(self._por_id)} documentos)")
+            self._listo.set()
+        
+        # Los cambios pueden venir de otros procesos: descartar sus informes
+        for grupo_id in grupos:
+            invalidar_reporte(grupo_id)
+        if nombres:
+            indice_nombres.invalidar()
+
+    def todos(self):
+        with self._lock:
+            return list(self._por_id.values())
+
+    def grupo(self, grupo_id):
+        with self._lock:
+            return list(self._por_grupo.get(grupo_id, {}).values())
+
+    def estado(self):
+        return {
+            'activa': self._watch is not None,
+            'lista': self.listo,
+            'publishers': len(self._por_id)
+        }
+
+replica = ReplicaPublishers()
+
+def doc_a_dict(doc):
+    """Convertir un documento de Publishers a dict con su id"""
+    persona_data = registros_activos(doc.to_dict())
+    persona_data['id'] = doc.id
+    return persona_data
+
+def nuevo_id():
+    """Id aleatorio de 20 caracteres, como los de Firestore"""
+    alfabeto = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+    return ''.join(secrets.choice(alfabeto) for _ in range(20))
+
+def marca_tiempo():
+    """Milisegundos desde epoch para updatedAt de Publishers y de sus eliminaciones"""
+    return int(time.time() * 1000)
+
+def marcar_eliminado(batch, persona_ref):
+    """Borrar una persona y dejar en Tombstones constancia para los clientes offline"""
+    batch.delete(persona_ref)
+    batch.set(get_db().collection('Tombstones').document(persona_ref.id), {
+        'updatedAt': marca_tiempo(),
+        # Campo para una política TTL de Firestore que purgue las eliminaciones antiguas
+        'expireAt': datetime.now(timezone.utc) + timedelta(days=SYNC_TOMBSTONE_DIAS)
+    })
+
+def leer_consultas(queries):
+    """Ejecutar varias consultas a la vez en consulta_pool; una lista de documentos por consulta
+
+    Las lecturas se cuentan en el hilo que llama para atribuirlas a su petición.
+    """
+    if len(queries) == 1:
+        return [leer_consulta(queries[0])]
+    resultados = list(consulta_pool.map(lambda query: list(query.stream()), queries))
+    for documentos in resultados:
+        contar_firestore('query', lecturas=len(documentos))
+    return resultados
+
+def consultar_grupos(grupos, preparar=None):
+    """Documentos de Publishers de varios grupos, una lista por consulta
+
+    Un grupo se lee con '=='; varios, con una consulta 'in' por cada FIRESTORE_IN_MAX
+    grupos, todas a la vez. preparar(query) añade el resto de filtros, orden y límite.
+    """
+    grupos = list(grupos)
+    coleccion = get_db().collection('Publishers')
+    if len(grupos) == 1:
+        queries = [coleccion.where('groupID', '==', grupos[0])]
+    else:
+        queries = [
+            coleccion.where('groupID', 'in', grupos[i:i + FIRESTORE_IN_MAX])
+            for i in range(0, len(grupos), FIRESTORE_IN_MAX)
+        ]
+    if preparar is not None:
+        queries = [preparar(query) for query in queries]
+    return leer_consultas(queries)
+
+def personas_grupos(grupos, mes=None, year=None):
+    """{grupo: personas} de varios grupos, desde la réplica si está lista
+
+    Si se indica el mes, las consultas a Firestore se limitan a los campos del informe.
+    """
+    if replica.listo:
+        return {grupo_id: replica.grupo(grupo_id) for grupo_id in grupos}
+    
+    preparar = None
+    if mes is not None:
+        preparar = lambda query: consulta_mes(query, mes, year)
+    personas_por_grupo = {grupo_id: [] for grupo_id in grupos}
+    for documentos in consultar_grupos(grupos, preparar):
+        for doc in documentos:
+            persona_data = doc_a_dict(doc)
+            personas_por_grupo[persona_data.get('groupID')].append(persona_data)
+    return personas_por_grupo
+
+def codificar_cursor(persona):
+    """Cursor opaco (nombre, id) para continuar un listado después de esta persona"""
+    contenido = json.dumps([persona.get('name', ''), persona['id']], ensure_ascii=False)
+    return base64.urlsafe_b64encode(contenido.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decodificar_cursor(cursor):
+    """(nombre, id) de un cursor; ValueError si no es válido"""
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        nombre, persona_id = json.loads(base64.urlsafe_b64decode(cursor + relleno).decode('utf-8'))
+    except Exception:
+        raise ValueError('Cursor no válido')
+    if not isinstance(nombre, str) or not isinstance(persona_id, str):
+        raise ValueError('Cursor no válido')
+    return nombre, persona_id
+
+def parametros_listado():
+    """Leer limit, start_after, fields y q de la petición; ValueError si no son válidos"""
+    limite = request.args.get('limit')
+    if limite is not None:
+        if not limite.isdigit() or not 1 <= int(limite) <= PAGINA_MAX:
+            raise ValueError(f'limit debe estar entre 1 y {PAGINA_MAX}')
+        limite = int(limite)
+    
+    cursor = request.args.get('start_after')
+    if cursor is not None:
+        cursor = decodificar_cursor(cursor)
+    
+    campos = None
+    if 'fields' in request.args:
+        campos = [campo.strip() for campo in request.args['fields'].split(',') if campo.strip()]
+        invalidos = sorted(set(campos) - set(CAMPOS_PUBLISHER))
+        if invalidos:
+            raise ValueError(f"Campos no válidos: {', '.join(invalidos)}")
+    
+    return {
+        'limite': limite,
+        'cursor': cursor,
+        'campos': campos,
+        'prefijo': request.args.get('q') or None
+    }
+
+def grupos_desde_request():
+    """Grupos de ?groups=1,2,3 sin repetir; ValueError si falta o no son válidos"""
+    valor = request.args.get('groups', '')
+    grupos = []
+    for parte in valor.split(','):
+        parte = parte.strip()
+        if not parte:
+            continue
+        if not parte.isdigit() or int(parte) not in GRUPOS:
+            raise ValueError(f'Grupo no válido: {parte}')
+        if int(parte) not in grupos:
+            grupos.append(int(parte))
+    if not grupos:
+        raise ValueError('groups es requerido (p. ej. ?groups=1,2,3)')
+    return grupos
+
+def proyectar_persona(persona_data, campos):
+    """Copia de una persona con su id y solo los campos indicados"""
+    resultado = {campo: persona_data[campo] for campo in campos if campo in persona_data}
+    resultado['id'] = persona_data['id']
+    return resultado
+
+def listar_pagina(grupos=None, limite=None, cursor=None, campos=None, prefijo=None):
+    """Publishers (de algunos grupos o todos) filtrados por prefijo del nombre y paginados
+
+    Con limit, cursor o prefijo se ordena por (name, id); si no, por id. Devuelve
+    (personas, siguiente) donde siguiente es el cursor de la próxima página o None.
+    """
+    ordenado = limite is not None or cursor is not None or prefijo is not None
+    
+    if replica.listo:
+        if grupos is None:
+            personas = replica.todos()
+        else:
+            personas = [p for grupo_id in grupos for p in replica.grupo(grupo_id)]
+            if len(grupos) > 1 and not ordenado:
+                personas.sort(key=lambda p: p['id'])
+        if prefijo is not None:
+            personas = [p for p in personas if p.get('name', '').startswith(prefijo)]
+        if ordenado:
+            personas.sort(key=lambda p: (p.get('name', ''), p['id']))
+        if cursor is not None:
+            personas = [p for p in personas if (p.get('name', ''), p['id']) > cursor]
+        if limite is not None:
+            personas = personas[:limite]
+    else:
+        from google.cloud.firestore_v1.field_path import FieldPath
+        
+        # El nombre hace falta para ordenar y para el cursor aunque no se pida
+        seleccion = campos
+        if campos is not None and ordenado and 'name' not in campos:
+            seleccion = campos + ['name']
+        
+        def preparar(query):
+            if prefijo is not None:
+                query = query.where('name', '>=', prefijo).where('name', '<', prefijo + '\uf8ff')
+            if ordenado:
+                query = query.order_by('name').order_by(FieldPath.document_id())
+            if cursor is not None:
+                query = query.start_after({'name': cursor[0], FieldPath.document_id(): cursor[1]})
+            if limite is not None:
+                query = query.limit(limite)
+            if seleccion is not None:
+                query = query.select(seleccion)
+            return query
+        
+        if grupos is None:
+            resultados = [leer_consulta(preparar(get_db().collection('Publishers')))]
+        else:
+            resultados = consultar_grupos(grupos, preparar)
+        personas = [doc_a_dict(doc) for documentos in resultados for doc in documentos]
+        
+        # Varias consultas 'in': mezclar en el mismo orden y quedarse con la página
+        if len(resultados) > 1:
+            if ordenado:
+                personas.sort(key=lambda p: (p.get('name', ''), p['id']))
+            else:
+                personas.sort(key=lambda p: p['id'])
+            if limite is not None:
+                personas = personas[:limite]
+    
+    siguiente = None
+    if limite is not None and len(personas) == limite:
+        siguiente = codificar_cursor(personas[-1])
+    if campos is not None:
+        personas = [proyectar_persona(p, campos) for p in personas]
+    return personas, siguiente
+
+def cambios_desde(since):
+    """(publishers, ids eliminados) con updatedAt >= since"""
+    if replica.listo:
+        personas = [p for p in replica.todos() if p.get('updatedAt', 0) >= since]
+    else:
+        query = get_db().collection('Publishers').where('updatedAt', '>=', since)
+        personas = [doc_a_dict(doc) for doc in leer_consulta(query)]
+    
+    query = get_db().collection('Tombstones').where('updatedAt', '>=', since).select(['updatedAt'])
+    eliminados = [doc.id for doc in leer_consulta(query)]
+    return personas, eliminados
+
+def respuesta_listado(grupos=None):
+    """Listado de publishers: la lista completa o, con limit, una página y su cursor"""
+    try:
+        parametros = parametros_listado()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    with medir_fase('fetch'):
+        personas, siguiente = repositorio().listar(grupos, **parametros)
+    if parametros['limite'] is None:
+        return jsonify(personas)
+    return jsonify({'personas': personas, 'siguiente': siguiente})
+
+def normalizar_nombre(texto):
+    """Nombre sin acentos, en minúsculas y con los espacios simplificados"""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    sin_acentos = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return ' '.join(sin_acentos.casefold().split())
+
+def trigramas(texto):
+    """Trigramas de un texto normalizado, con relleno para que cuenten el principio y el final"""
+    relleno = f'  {texto} '
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+class NodoTrie:
+    """Nodo del trie de prefijos, con los ids de las personas que tienen una palabra por debajo"""
+
+    __slots__ = ('hijos', 'ids')
+
+    def __init__(self):
+        self.hijos = {}
+        self.ids = set()
+
+class IndiceNombres:
+    """Índice en memoria de los nombres: trie de prefijos por palabra y trigramas
+
+    Los nombres se normalizan (sin acentos ni mayúsculas). Se construye con la primera
+    búsqueda y se rehace en la siguiente tras invalidar() o pasados ttl segundos. Los
+    cambios de grupo o estado se aplican a la entrada con actualizar(), sin rehacerlo.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._datos = None
+        self._vigente = False
+        self._lock = threading.Lock()
+
+    def invalidar(self):
+        self._vigente = False
+
+    def actualizar(self, persona_id, cambios):
+        """Cambiar grupo o estado de una persona indexada (el nombre exige invalidar())"""
+        datos = self._datos
+        entrada = datos['entradas'].get(persona_id) if datos is not None else None
+        if entrada is not None:
+            persona = dict(entrada[0])
+            persona.update((campo, cambios[campo]) for campo in ('groupID', 'state') if campo in cambios)
+            datos['entradas'][persona_id] = (persona,) + entrada[1:]
+
+    def _actual(self):
+        datos = self._datos
+        if self._vigente and datos is not None and time.monotonic() - datos['construido'] < self.ttl:
+            return datos
+        return None
+
+    def datos(self):
+        """Trie, trigramas y personas indexadas, reconstruidos si hace falta"""
+        datos = self._actual()
+        if datos is not None:
+            return datos
+        with self._lock:
+            datos = self._actual()
+            if datos is not None:
+                return datos
+            # Antes de leer: una escritura durante la lectura vuelve a invalidar el índice
+            self._vigente = True
+            try:
+                personas, _ = repositorio().listar(campos=['name', 'groupID', 'state'])
+            except Exception:
+                self._vigente = False
+                raise
+            self._datos = self._construir(personas)
+            return self._datos
+
+    @staticmethod
+    def _construir(personas):
+        raiz = NodoTrie()
+        por_trigrama = {}
+        entradas = {}
+        for persona in personas:
+            nombre = normalizar_nombre(persona.get('name', ''))
+            tris = trigramas(nombre)
+            entradas[persona['id']] = (persona, nombre, len(tris))
+            for palabra in nombre.split():
+                nodo = raiz
+                for letra in palabra:
+                    nodo = nodo.hijos.setdefault(letra, NodoTrie())
+                    nodo.ids.add(persona['id'])
+            for trigrama in tris:
+                por_trigrama.setdefault(trigrama, []).append(persona['id'])
+        return {
+            'raiz': raiz,
+            'trigramas': por_trigrama,
+            'entradas': entradas,
+            'construido': time.monotonic()
+        }
+
+    @staticmethod
+    def _prefijo(raiz, palabra):
+        nodo = raiz
+        for letra in palabra:
+            nodo = nodo.hijos.get(letra)
+            if nodo is None:
+                return set()
+        return nodo.ids
+
+    @staticmethod
+    def _similitudes(datos, consulta):
+        """{id: similitud de Jaccard entre los trigramas de la consulta y los del nombre}"""
+        tris = trigramas(consulta)
+        comunes = Counter()
+        for trigrama in tris:
+            comunes.update(datos['trigramas'].get(trigrama, ()))
+        entradas = datos['entradas']
+        return {
+            persona_id: n / (len(tris) + entradas[persona_id][2] - n)
+            for persona_id, n in comunes.items()
+        }
+
+    @staticmethod
+    def _resultado(datos, persona_id, similitudes):
+        return dict(datos['entradas'][persona_id][0], similitud=round(similitudes.get(persona_id, 0.0), 3))
+
+    def buscar(self, texto, limite=BUSQUEDA_MAX):
+        """Personas con palabras que empiezan por las de la búsqueda y, después, las parecidas"""
+        consulta = normalizar_nombre(texto)
+        if not consulta:
+            return []
+        datos = self.datos()
+        entradas = datos['entradas']
+        
+        coincidencias = None
+        for palabra in consulta.split():
+            ids = self._prefijo(datos['raiz'], palabra)
+            coincidencias = ids if coincidencias is None else coincidencias & ids
+        similitudes = self._similitudes(datos, consulta)
+        
+        primeras = heapq.nsmallest(limite, coincidencias, key=lambda pid: (entradas[pid][1], pid))
+        parecidas = heapq.nsmallest(
+            limite - len(primeras),
+            (pid for pid, similitud in similitudes.items()
+             if similitud >= BUSQUEDA_SIMILITUD and pid not in coincidencias),
+            key=lambda pid: (-similitudes[pid], entradas[pid][1], pid)
+        )
+        return [self._resultado(datos, pid, similitudes) for pid in primeras + parecidas]
+
+    def duplicados(self, nombre):
+        """Personas con el mismo nombre normalizado o uno muy parecido, de más a menos"""
+        consulta = normalizar_nombre(nombre)
+        if not consulta:
+            return []
+        datos = self.datos()
+        entradas = datos['entradas']
+        similitudes = self._similitudes(datos, consulta)
+        for persona_id, (_, normalizado, _) in entradas.items():
+            if normalizado == consulta:
+                similitudes[persona_id] = 1.0
+        candidatos = sorted(
+            (pid for pid, similitud in similitudes.items() if similitud >= DUPLICADO_SIMILITUD),
+            key=lambda pid: (-similitudes[pid], entradas[pid][1], pid)
+        )
+        return [self._resultado(datos, pid, similitudes) for pid in candidatos]
+
+indice_nombres = IndiceNombres(BUSQUEDA_TTL)
+
+def versiones_confiables():
+    """Las versiones ven todas las escrituras de la app: con la réplica o con un solo proceso"""
+    return replica.listo or WEB_CONCURRENCY <= 1
+
+def tramo_versiones():
+    """None con la réplica lista; si no, el tramo actual de REPORTE_CACHE_TTL segundos
+
+    Sin réplica, las escrituras de fuera del proceso (scripts, la consola, otras
+    instancias) no cambian las versiones: el ETag caduca con la cache de informes.
+    """
+    if replica.listo:
+        return None
+    return int(time.time() // max(REPORTE_CACHE_TTL, 1))
+
+def etag_coincidente(etag):
+    """La variante del ETag (sin comprimir, gzip o br) que envió el cliente, o None"""
+    for variante in (etag, f'{etag}-gzip', f'{etag}-br'):
+        if request.if_none_match.contains(variante):
+            return variante
+    return None
+
+def con_etag(parametro_grupo=None):
+    """Responder con ETag de versión y 304 si el cliente ya tiene la respuesta
+
+    parametro_grupo es el argumento de la ruta con el grupo; sin él (o con grupo 0)
+    la respuesta depende de todos los grupos. Solo las respuestas JSON llevan este ETag.
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(*args, **kwargs):
+            if not versiones_confiables():
+                return vista(*args, **kwargs)
+            
+            grupo_id = kwargs.get(parametro_grupo) if parametro_grupo else None
+            etag = versiones.etag(request.full_path, grupo_id or None, tramo_versiones())
+            coincidente = etag_coincidente(etag)
+            if coincidente is not None:
+                respuesta = Response(status=304)
+                respuesta.set_etag(coincidente)
+                respuesta.headers['Cache-Control'] = 'no-cache'
+                return respuesta
+            
+            respuesta = make_response(vista(*args, **kwargs))
+            if respuesta.status_code == 200 and respuesta.is_json:
+                respuesta.set_etag(etag)
+                respuesta.headers['Cache-Control'] = 'no-cache'
+            return respuesta
+        return envoltura
+    return decorador
+
+@lru_cache(maxsize=None)
+def modulo_pypdf():
+    """El módulo pypdf si está instalado (une los PDF de cada grupo de la congregación)"""
+    try:
+        import pypdf
+        return pypdf
+    except ImportError:
+        return None
+
+@lru_cache(maxsize=None)
+def modulo_brotli():
+    """El módulo brotli si está instalado"""
+    try:
+        import brotli
+        return brotli
+    except ImportError:
+        return None
+
+@app.after_request
+def comprimir_json(response):
+    """Comprimir con brotli o gzip las respuestas JSON grandes"""
+    if (response.status_code != 200 or not response.is_json or response.direct_passthrough
+            or 'Content-Encoding' in response.headers):
+        return response
+    
+    datos = response.get_data()
+    if len(datos) < COMPRESS_MIN_BYTES:
+        return response
+    
+    aceptadas = request.accept_encodings
+    brotli = modulo_brotli()
+    if brotli is not None and aceptadas['br']:
+        codificacion = 'br'
+        datos = brotli.compress(datos, quality=min(COMPRESS_LEVEL, 11))
+    elif aceptadas['gzip']:
+        codificacion = 'gzip'
+        datos = gzip.compress(datos, compresslevel=COMPRESS_LEVEL)
+    else:
+        return response
+    
+    response.set_data(datos)
+    response.headers['Content-Encoding'] = codificacion
+    response.vary.add('Accept-Encoding')
+    # Cada codificación es una representación distinta: su ETag fuerte también
+    etag, debil = response.get_etag()
+    if etag and not debil:
+        response.set_etag(f'{etag}-{codificacion}')
+    return response
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -74,29 +1247,50 @@ def index():
 @app.route('/api/grupos')
 def get_grupos():
     """Obtener los 6 grupos"""
-    grupos = [{'id': i, 'nombre': f'Grupo {i}'} for i in range(1, 7)]
-    return jsonify(grupos)
+    grupos = [{'id': i, 'nombre': f'Grupo {i}'} for i in GRUPOS]
+    respuesta = jsonify(grupos)
+    respuesta.cache_control.public = True
+    respuesta.cache_control.max_age = GRUPOS_MAX_AGE
+    return respuesta
+
+@app.route('/api/salud')
+def get_salud():
+    """Estado del servicio y de la réplica de Publishers"""
+    return jsonify({'status': 'ok', 'almacenamiento': STORAGE_BACKEND, 'replica': replica.estado()})
+
+@app.route('/metrics')
+def get_metrics():
+    """Métricas del proceso en formato de texto de Prometheus"""
+    return Response(metricas.exportar(), mimetype='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/api/publishers/all')
+@con_etag()
 def get_all_publishers():
-    """Obtener todos los publishers"""
+    """Obtener todos los publishers (?limit=&start_after=&fields=&q= para paginar)"""
     try:
-        personas_ref = db.collection('Publishers')
-        query = personas_ref.stream()
-        
-        personas = []
-        for doc in query:
-            persona_data = doc.to_dict()
-            persona_data['id'] = doc.id
-            personas.append(persona_data)
+        return respuesta_listado()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/publishers/search')
+def search_publishers():
+    """Buscar publishers por nombre sin distinguir acentos ni mayúsculas (?q=&limit=)"""
+    try:
+        texto = request.args.get('q', '').strip()
+        if not texto:
+            return jsonify({'error': 'q es requerido'}), 400
+        limite = request.args.get('limit', str(BUSQUEDA_MAX))
+        if not limite.isdigit() or not 1 <= int(limite) <= PAGINA_MAX:
+            return jsonify({'error': f'limit debe estar entre 1 y {PAGINA_MAX}'}), 400
         
-        return jsonify(personas)
+        with medir_fase('fetch'):
+            return jsonify(indice_nombres.buscar(texto, int(limite)))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/publishers', methods=['POST'])
 def create_publisher():
-    """Crear un nuevo publisher"""
+    """Crear un nuevo publisher (409 con los parecidos si no se envía confirmar)"""
     try:
         data = request.json
         
@@ -104,20 +1298,34 @@ def create_publisher():
         if 'name' not in data or not data['name']:
             return jsonify({'error': 'El nombre es requerido'}), 400
         
+        # Avisar de posibles duplicados antes de escribir
+        if not data.get('confirmar'):
+            duplicados = indice_nombres.duplicados(data['name'])
+            if duplicados:
+                return jsonify({
+                    'error': 'Ya hay publishers con un nombre igual o parecido',
+                    'duplicados': duplicados
+                }), 409
+        
         new_publisher = {
             'name': data['name'],
             'groupID': data.get('groupID', 1),
             'state': data.get('state', 'Publicador'),
-            'hours': data.get('hours', [])
+            'updatedAt': marca_tiempo()
         }
+        if HOURS_LAYOUT == 'map':
+            new_publisher['months'] = hours_a_months(data.get('hours', []))
+        else:
+            new_publisher['hours'] = data.get('hours', [])
         
-        # Agregar a Firestore
-        doc_ref = db.collection('Publishers').add(new_publisher)
+        persona_id = repositorio().crear(new_publisher)
+        invalidar_reporte(new_publisher['groupID'])
+        indice_nombres.invalidar()
         
         return jsonify({
             'success': True, 
             'message': 'Publisher creado correctamente',
-            'id': doc_ref[1].id
+            'id': persona_id
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -126,66 +1334,264 @@ def create_publisher():
 def delete_publisher(publisher_id):
     """Eliminar un publisher"""
     try:
-        db.collection('Publishers').document(publisher_id).delete()
+        repositorio().eliminar(publisher_id)
+        # No se conoce el grupo sin leer el documento: descartar toda la cache
+        invalidar_reporte()
+        indice_nombres.invalidar()
         return jsonify({'success': True, 'message': 'Publisher eliminado correctamente'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/personas/<int:grupo_id>')
+@con_etag('grupo_id')
 def get_personas(grupo_id):
-    """Obtener personas de un grupo específico"""
+    """Obtener personas de un grupo específico (admite los parámetros de paginación)"""
     try:
-        personas_ref = db.collection('Publishers')
-        query = personas_ref.where('groupID', '==', grupo_id).stream()
-        
-        personas = []
-        for doc in query:
-            persona_data = doc.to_dict()
-            persona_data['id'] = doc.id
-            personas.append(persona_data)
-        
-        return jsonify(personas)
+        return respuesta_listado([grupo_id])
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/personas')
+@con_etag()
+def get_personas_grupos():
+    """Obtener personas de varios grupos (?groups=1,2,3; admite los parámetros de paginación)"""
+    try:
+        try:
+            grupos = grupos_desde_request()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return respuesta_listado(grupos)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def cambios_registro_mes(persona_data, new_hour):
+    """Campos a actualizar para guardar el registro de un mes"""
+    if HOURS_LAYOUT == 'map':
+        return {campo_mes(new_hour['month'], new_hour['year']): new_hour}
+    
+    # Si el documento solo tiene months (se volvió a la lista), partir de ese mapa
+    hours_array = list(registros_persona(persona_data))
+    
+    # Buscar si ya existe un registro para este mes/año
+    for i, hour_entry in enumerate(hours_array):
+        if hour_entry.get('month') == new_hour['month'] and hour_entry.get('year') == new_hour['year']:
+            hours_array[i] = new_hour
+            break
+    else:
+        hours_array.append(new_hour)
+    
+    return {'hours': hours_array}
+
+def campos_lectura_persona(mes=None, year=None):
+    """Campos que hay que leer antes de actualizar el registro de un mes (sin mes, todos)"""
+    if HOURS_LAYOUT != 'map':
+        return ['name', 'state', 'groupID', 'hours', 'months']
+    if mes is None:
+        return ['name', 'state', 'groupID', 'months']
+    return ['name', 'state', 'groupID', campo_mes(mes, year)]
+
+def rollup_ref(grupo_id, mes, year):
+    """Documento Rollups/{grupo}-{YYYY-MM} con los registros del mes de un grupo"""
+    return get_db().collection('Rollups').document(f'{grupo_id}-{clave_mes(mes, year)}')
+
+def fila_rollup(persona_data, state, registro):
+    """Resumen de una persona guardado en el rollup mensual, con los valores normalizados"""
+    registro = RegistroMes.desde_dict(registro)
+    return {
+        'nombre': persona_data.get('name', 'Sin nombre'),
+        'state': state,
+        'horas': registro.horas,
+        'estudios': registro.estudios,
+        'participo': registro.participo
+    }
+
+def datos_rollup(grupo_id, mes, year, filas):
+    """Contenido para set(merge=True) del rollup: solo se tocan las personas indicadas"""
+    return {
+        'grupo': grupo_id,
+        'month': mes,
+        'year': year,
+        'personas': filas
+    }
+
+def totales_ref(grupo_id, mes, year):
+    """Documento Reports/{grupo}-{YYYY-MM} con los totales del informe del mes"""
+    return get_db().collection('Reports').document(f'{grupo_id}-{clave_mes(mes, year)}')
+
+def aporte_totales(state, registro):
+    """Lo que suma una persona a los totales del informe (mismas reglas que agregar_reporte)"""
+    if registro is None or state not in ESTADOS:
+        return {}
+    # Valores que no son números cuentan 0, como en el informe
+    registro = RegistroMes.desde_dict(registro)
+    if state == 'Publicador':
+        return {('totales', state): 1 if registro.participo else 0}
+    
+    horas = registro.horas
+    estudios = registro.estudios
+    return {
+        ('totales', state): horas,
+        ('totales_estudios', state): estudios,
+        ('total_general',): horas,
+        ('total_estudios_general',): estudios
+    }
+
+def sumar_aportes(deltas, aporte, signo=1):
+    """Acumular en deltas un aporte (signo -1 para restarlo)"""
+    for clave, valor in aporte.items():
+        deltas[clave] = deltas.get(clave, 0) + signo * valor
+    return deltas
+
+def delta_totales(state_anterior, anterior, state, registro):
+    """Diferencia en los totales al pasar de (state_anterior, anterior) a (state, registro)"""
+    deltas = sumar_aportes({}, aporte_totales(state, registro))
+    return sumar_aportes(deltas, aporte_totales(state_anterior, anterior), -1)
+
+def datos_totales(grupo_id, mes, year, deltas):
+    """Contenido para set(merge=True) de Reports con Increment por cada total"""
+    from google.cloud.firestore_v1 import Increment
+    
+    datos = {'grupo': grupo_id, 'month': mes, 'year': year}
+    for clave, delta in deltas.items():
+        if not delta:
+            continue
+        destino = datos
+        for parte in clave[:-1]:
+            destino = destino.setdefault(parte, {})
+        destino[clave[-1]] = Increment(delta)
+    return datos
+
+def acumular_resumenes(resumenes, persona_id, antes, despues):
+    """Sumar a resumenes el cambio de Rollups y Reports al pasar una persona de antes a despues
+
+    antes y despues son la persona (name, groupID, state y sus registros) o None si
+    no existe. En cada mes guardado se resta lo que aportaba y se suma lo nuevo, en
+    su grupo anterior y en el actual. resumenes es {(grupo, mes, año): {'filas', 'deltas'}}
+    y puede reunir varias personas para escribir cada documento una sola vez.
+    """
+    from google.cloud.firestore_v1 import DELETE_FIELD
+    
+    filas = {}
+    for persona, signo in ((antes, -1), (despues, 1)):
+        if persona is None:
+            continue
+        grupo_id = persona.get('groupID')
+        state = persona.get('state', 'Publicador')
+        for (mes, year), registro in registros_por_mes(persona).items():
+            clave = (grupo_id, mes, year)
+            filas.setdefault(clave, {})[signo] = fila_rollup(persona, state, registro)
+            resumen = resumenes.setdefault(clave, {'filas': {}, 'deltas': {}})
+            sumar_aportes(resumen['deltas'], aporte_totales(state, registro), signo)
+    
+    for clave, fila in filas.items():
+        if fila.get(1) != fila.get(-1):
+            resumenes[clave]['filas'][persona_id] = fila.get(1, DELETE_FIELD)
+    return resumenes
+
+def escrituras_resumenes(resumenes):
+    """(ref, datos) de los Rollups y Reports que cambian, para set(merge=True) en la transacción"""
+    escrituras = []
+    for (grupo_id, mes, year), resumen in resumenes.items():
+        if resumen['filas']:
+            escrituras.append((rollup_ref(grupo_id, mes, year), datos_rollup(grupo_id, mes, year, resumen['filas'])))
+        if any(resumen['deltas'].values()):
+            escrituras.append((totales_ref(grupo_id, mes, year), datos_totales(grupo_id, mes, year, resumen['deltas'])))
+    return escrituras
+
+def resumenes_persona(persona_id, antes, despues):
+    """Escrituras de Rollups y Reports por el cambio de una sola persona"""
+    return escrituras_resumenes(acumular_resumenes({}, persona_id, antes, despues))
+
+def datos_totales_reporte(datos):
+    """Totales de un informe ya agregado, para reescribir el documento Reports"""
+    return {
+        'grupo': datos['grupo'],
+        'month': MESES.index(datos['mes']) + 1,
+        'year': datos['year'],
+        'totales': datos['totales'],
+        'totales_estudios': datos['totales_estudios'],
+        'total_general': datos['total_general'],
+        'total_estudios_general': datos['total_estudios_general']
+    }
+
+def actualizar_persona_txn(transaction, persona_ref, data):
+    """Actualizar state y el registro del mes dentro de una transacción"""
+    new_hour = data.get('hours')
+    # Un cambio de estado mueve lo que la persona aporta en todos sus meses
+    mes, year = (new_hour['month'], new_hour['year']) if new_hour and 'state' not in data else (None, None)
+    
+    persona_doc = persona_ref.get(field_paths=campos_lectura_persona(mes, year), transaction=transaction)
+    contar_firestore('get', lecturas=1)
+    if not persona_doc.exists:
+        return None
+    
+    persona_data = persona_doc.to_dict()
+    despues = dict(persona_data)
+    cambios = {}
+    
+    if 'state' in data:
+        cambios['state'] = despues['state'] = data['state']
+    
+    if new_hour:
+        despues = con_registro(despues, new_hour)
+        cambios.update(cambios_registro_mes(persona_data, new_hour))
+    
+    escrituras = 0
+    if cambios:
+        # Rollups y Reports de cada mes afectado, con lo leído en la transacción
+        for ref, datos in resumenes_persona(persona_ref.id, persona_data, despues):
+            transaction.set(ref, datos, merge=True)
+            escrituras += 1
+        cambios['updatedAt'] = marca_tiempo()
+        transaction.update(persona_ref, cambios)
+        escrituras += 1
+    contar_firestore('transaction', escrituras=escrituras)
+    return persona_data
+
+def actualizar_persona_admin_txn(transaction, persona_ref, cambios):
+    """Actualizar los datos de administración dentro de una transacción"""
+    persona_doc = persona_ref.get(field_paths=campos_lectura_persona(), transaction=transaction)
+    contar_firestore('get', lecturas=1)
+    if not persona_doc.exists:
+        return None
+    
+    persona_data = persona_doc.to_dict()
+    escrituras = 0
+    if cambios:
+        # Nombre, grupo o estado cambian las filas y los totales de todos sus meses
+        for ref, datos in resumenes_persona(persona_ref.id, persona_data, dict(persona_data, **cambios)):
+            transaction.set(ref, datos, merge=True)
+            escrituras += 1
+        transaction.update(persona_ref, dict(cambios, updatedAt=marca_tiempo()))
+        escrituras += 1
+    contar_firestore('transaction', escrituras=escrituras)
+    return persona_data
+
+def eliminar_persona_txn(transaction, persona_ref):
+    """Borrar una persona y quitar sus meses de Rollups y Reports dentro de una transacción"""
+    persona_doc = persona_ref.get(field_paths=campos_lectura_persona(), transaction=transaction)
+    contar_firestore('get', lecturas=1)
+    escrituras = 2
+    if persona_doc.exists:
+        for ref, datos in resumenes_persona(persona_ref.id, persona_doc.to_dict(), None):
+            transaction.set(ref, datos, merge=True)
+            escrituras += 1
+    marcar_eliminado(transaction, persona_ref)
+    contar_firestore('transaction', escrituras=escrituras)
+    return persona_doc.to_dict() if persona_doc.exists else None
+
 @app.route('/api/persona/<persona_id>', methods=['PUT'])
 def update_persona(persona_id):
     """Actualizar información de una persona"""
     try:
         data = request.json
-        persona_ref = db.collection('Publishers').document(persona_id)
-        
-        # Obtener datos actuales
-        persona_doc = persona_ref.get()
-        if not persona_doc.exists:
+        persona_data = repositorio().actualizar_persona(persona_id, data)
+        if persona_data is None:
             return jsonify({'error': 'Persona no encontrada'}), 404
         
-        persona_data = persona_doc.to_dict()
-        
-        # Actualizar state si se proporciona
+        invalidar_reporte(persona_data.get('groupID'))
         if 'state' in data:
-            persona_data['state'] = data['state']
-        
-        # Actualizar hours si se proporciona
-        if 'hours' in data:
-            hours_array = persona_data.get('hours', [])
-            new_hour = data['hours']
-            
-            # Buscar si ya existe un registro para este mes/año
-            found = False
-            for i, hour_entry in enumerate(hours_array):
-                if hour_entry.get('month') == new_hour['month'] and hour_entry.get('year') == new_hour['year']:
-                    hours_array[i] = new_hour
-                    found = True
-                    break
-            
-            if not found:
-                hours_array.append(new_hour)
-            
-            persona_data['hours'] = hours_array
-        
-        # Guardar cambios
-        persona_ref.set(persona_data)
+            indice_nombres.actualizar(persona_id, {'state': data['state']})
         
         return jsonify({'success': True, 'message': 'Persona actualizada correctamente'})
     except Exception as e:
@@ -196,272 +1602,1932 @@ def update_persona_admin(persona_id):
     """Actualizar información completa de una persona desde administración"""
     try:
         data = request.json
-        persona_ref = db.collection('Publishers').document(persona_id)
-        
-        # Obtener datos actuales
-        persona_doc = persona_ref.get()
-        if not persona_doc.exists:
-            return jsonify({'error': 'Persona no encontrada'}), 404
-        
-        persona_data = persona_doc.to_dict()
         
         # Actualizar los campos proporcionados
-        if 'name' in data:
-            persona_data['name'] = data['name']
+        cambios = {campo: data[campo] for campo in ('name', 'groupID', 'state') if campo in data}
         
-        if 'groupID' in data:
-            persona_data['groupID'] = data['groupID']
-        
-        if 'state' in data:
-            persona_data['state'] = data['state']
+        persona_data = repositorio().actualizar_admin(persona_id, cambios)
+        if persona_data is None:
+            return jsonify({'error': 'Persona no encontrada'}), 404
         
-        # Guardar cambios
-        persona_ref.set(persona_data)
+        grupo_anterior = persona_data.get('groupID')
+        invalidar_reporte(grupo_anterior)
+        if cambios.get('groupID', grupo_anterior) != grupo_anterior:
+            invalidar_reporte(cambios['groupID'])
+        # Solo un nombre nuevo obliga a rehacer el índice; grupo y estado se corrigen en él
+        if 'name' in cambios:
+            indice_nombres.invalidar()
+        else:
+            indice_nombres.actualizar(persona_id, cambios)
         
         return jsonify({'success': True, 'message': 'Persona actualizada correctamente'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/reporte/<int:grupo_id>/<int:mes>/<int:year>')
-def get_reporte_data(grupo_id, mes, year):
-    """Obtener datos para el reporte"""
-    try:
-        personas_ref = db.collection('Publishers')
-        query = personas_ref.where('groupID', '==', grupo_id).stream()
+def validar_filas_mes(filas):
+    """(resultados, índices válidos) de las filas de un guardado en bloque"""
+    resultados = [{'id': fila.get('id') if isinstance(fila, dict) else None} for fila in filas]
+    validas = []
+    for i, fila in enumerate(filas):
+        if not isinstance(fila, dict) or not fila.get('id'):
+            resultados[i]['error'] = 'El id es requerido'
+        elif 'state' in fila and fila['state'] not in ESTADOS:
+            resultados[i]['error'] = 'Estado no válido'
+        elif 'hours' in fila and not isinstance(fila['hours'], dict):
+            resultados[i]['error'] = 'El registro del mes no es válido'
+        else:
+            validas.append(i)
+    return resultados, validas
+
+def guardar_lote_mes_txn(transaction, grupo_id, mes, year, filas):
+    """Guardar filas ya validadas de un grupo y mes dentro de una transacción
+
+    Las personas se leen en la transacción, así que si otra escritura las cambia
+    antes de confirmar, Firestore la reintenta con datos frescos. Devuelve el
+    error de cada fila, o None si se guardó.
+    """
+    refs = [get_db().collection('Publishers').document(fila['id']) for fila in filas]
+    # Un cambio de estado mueve lo que la persona aporta en todos sus meses
+    campos = campos_lectura_persona() if any('state' in fila for fila in filas) else campos_lectura_persona(mes, year)
+    documentos = {
+        persona_doc.id: persona_doc.to_dict()
+        for persona_doc in leer_documentos(refs, field_paths=campos, transaction=transaction)
+        if persona_doc.exists
+    }
+    
+    errores = []
+    resumenes = {}
+    for fila, ref in zip(filas, refs):
+        persona_data = documentos.get(ref.id)
+        if persona_data is None:
+            errores.append('Persona no encontrada')
+            continue
+        if persona_data.get('groupID') != grupo_id:
+            errores.append('La persona no pertenece al grupo')
+            continue
         
-        # Agrupar por estado
-        reporte = {
-            'Publicador': [],
-            'Precursor Auxiliar': [],
-            'Precursor Auxiliar Indefinido': [],
-            'Precursor Regular': []
-        }
+        despues = dict(persona_data)
+        cambios = {}
+        if 'state' in fila:
+            cambios['state'] = despues['state'] = fila['state']
+        if 'hours' in fila:
+            new_hour = dict(fila['hours'], month=mes, year=year)
+            despues = con_registro(despues, new_hour)
+            cambios.update(cambios_registro_mes(persona_data, new_hour))
+        if not cambios:
+            errores.append('No hay cambios')
+            continue
         
-        for doc in query:
-            persona_data = doc.to_dict()
-            state = persona_data.get('state', 'Publicador')
-            nombre = persona_data.get('name', 'Sin nombre')
-            
-            # Buscar los datos del mes específico
-            hours_mes = 0
-            participo = False
-            estudios = 0
-            comentario = ''
-            
-            hours_array = persona_data.get('hours', [])
-            for hour_entry in hours_array:
-                if hour_entry.get('month') == mes and hour_entry.get('year') == year:
-                    hours_mes = hour_entry.get('hours', 0)
-                    participo = hour_entry.get('Participo', False)
-                    estudios = hour_entry.get('estudios', 0)
-                    comentario = hour_entry.get('Comentario', '')
-                    break
-            
-            if state in reporte:
-                reporte[state].append({
-                    'nombre': nombre,
-                    'horas': hours_mes,
-                    'participo': participo,
-                    'estudios': estudios,
-                    'comentario': comentario
-                })
-        
-        # Calcular totales (solo horas para no Publicadores)
-        totales = {}
-        totales_estudios = {}
-        for estado, personas in reporte.items():
-            if estado == 'Publicador':
-                # Para publicadores, contar cuántos participaron
-                totales[estado] = sum(1 for p in personas if p['participo'])
+        acumular_resumenes(resumenes, ref.id, persona_data, despues)
+        # Otra fila de la misma persona parte de lo ya guardado
+        documentos[ref.id] = despues
+        cambios['updatedAt'] = marca_tiempo()
+        transaction.update(ref, cambios)
+        errores.append(None)
+    
+    escrituras = escrituras_resumenes(resumenes)
+    for ref, datos in escrituras:
+        transaction.set(ref, datos, merge=True)
+    contar_firestore('transaction', escrituras=len(escrituras) + errores.count(None))
+    return errores
+
+def guardar_registros_mes(grupo_id, mes, year, filas):
+    """Guardar state y el registro del mes de varias personas de un grupo con transacciones
+
+    Devuelve, en el orden de filas, {'id', 'success'} y 'error' si la fila no se guardó.
+    Si falló la transacción y no la fila, lleva además 'reintentar': True.
+    """
+    # Validar cada fila antes de tocar Firestore
+    resultados, validas = validar_filas_mes(filas)
+    
+    # Cada transacción deja la mitad de sus escrituras para Rollups y Reports: dos por
+    # mes tocado, que con cambios de estado son todos los meses guardados de esas personas
+    tamano = BATCH_SIZE // 2
+    guardadas = False
+    for inicio in range(0, len(validas), tamano):
+        indices = validas[inicio:inicio + tamano]
+        try:
+            errores = ejecutar_transaccion(guardar_lote_mes_txn, grupo_id, mes, year, [filas[i] for i in indices])
+        except Exception as e:
+            # Error de Firestore o de la transacción: las filas se pueden volver a enviar
+            errores = [str(e)] * len(indices)
+            for i in indices:
+                resultados[i]['reintentar'] = True
+        for i, error in zip(indices, errores):
+            if error:
+                resultados[i]['error'] = error
             else:
-                # Para otros, sumar horas y estudios
-                totales[estado] = sum(p['horas'] for p in personas)
-                totales_estudios[estado] = sum(p['estudios'] for p in personas)
-        
-        # Total general solo de horas (sin publicadores)
-        total_general = sum(totales[estado] for estado in totales if estado != 'Publicador')
-        total_estudios_general = sum(totales_estudios.values())
-        
-        return jsonify({
-            'reporte': reporte,
-            'totales': totales,
-            'totales_estudios': totales_estudios,
-            'total_general': total_general,
-            'total_estudios_general': total_estudios_general,
-            'mes': MESES[mes - 1],
-            'year': year,
-            'grupo': grupo_id
-        })
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+                guardadas = True
+    
+    for resultado in resultados:
+        resultado['success'] = 'error' not in resultado
+    
+    if guardadas:
+        invalidar_reporte(grupo_id)
+    return resultados
 
-@app.route('/api/export/pdf/<int:grupo_id>/<int:mes>/<int:year>')
-def export_pdf(grupo_id, mes, year):
-    """Exportar reporte a PDF"""
-    try:
-        # Obtener datos del reporte
-        personas_ref = db.collection('Publishers')
-        query = personas_ref.where('groupID', '==', grupo_id).stream()
-        
-        reporte = {
-            'Publicador': [],
-            'Precursor Auxiliar': [],
-            'Precursor Auxiliar Indefinido': [],
-            'Precursor Regular': []
+class Repositorio:
+    """Operaciones de almacenamiento que usan las rutas
+
+    Las personas son dict con id, name, groupID, state, updatedAt y sus registros
+    mensuales en hours o en months según HOURS_LAYOUT. Las rutas se encargan de
+    la cache de informes y de las versiones; cada implementación, de leer y
+    escribir lo suyo.
+    """
+
+    def listar(self, grupos=None, limite=None, cursor=None, campos=None, prefijo=None):
+        """(personas, siguiente) de algunos grupos o de todas, filtradas por prefijo del nombre y paginadas"""
+        raise NotImplementedError
+
+    def personas_grupos(self, grupos, mes=None, year=None):
+        """{grupo: personas}; con (mes, year) basta con que traigan el registro de ese mes"""
+        raise NotImplementedError
+
+    def crear(self, persona_data):
+        """Guardar una persona nueva y devolver su id"""
+        raise NotImplementedError
+
+    def eliminar(self, persona_id):
+        """Borrar una persona y registrar la eliminación para los clientes offline"""
+        raise NotImplementedError
+
+    def actualizar_persona(self, persona_id, data):
+        """Guardar state y el registro del mes; devuelve la persona anterior o None si no existe"""
+        raise NotImplementedError
+
+    def actualizar_admin(self, persona_id, cambios):
+        """Cambiar name, groupID o state; devuelve la persona anterior o None si no existe"""
+        raise NotImplementedError
+
+    def guardar_registros_mes(self, grupo_id, mes, year, filas):
+        """Guardar en bloque las filas de un grupo y mes; devuelve el resultado de cada una"""
+        raise NotImplementedError
+
+    def cambios_desde(self, since):
+        """(personas, ids eliminados) con updatedAt >= since"""
+        raise NotImplementedError
+
+    def totales_mes(self, mes, year):
+        """{grupo: totales del mes} con la forma de los documentos Reports"""
+        raise NotImplementedError
+
+    def rollups(self, grupos, meses):
+        """Filas por persona de cada grupo y mes, con la forma de los documentos Rollups"""
+        raise NotImplementedError
+
+    def exportar(self):
+        """Todas las personas, completas"""
+        raise NotImplementedError
+
+    def importar(self, personas):
+        """Guardar personas completas conservando su id; devuelve cuántas"""
+        raise NotImplementedError
+
+class RepositorioFirestore(Repositorio):
+    """Publishers en Firestore, con la réplica en memoria, Rollups, Reports y Tombstones"""
+
+    def listar(self, grupos=None, limite=None, cursor=None, campos=None, prefijo=None):
+        return listar_pagina(grupos, limite, cursor, campos, prefijo)
+
+    def personas_grupos(self, grupos, mes=None, year=None):
+        return personas_grupos(grupos, mes, year)
+
+    def crear(self, persona_data):
+        _, doc_ref = get_db().collection('Publishers').add(persona_data)
+        contar_firestore('add', escrituras=1)
+        return doc_ref.id
+
+    def eliminar(self, persona_id):
+        persona_ref = get_db().collection('Publishers').document(persona_id)
+        ejecutar_transaccion(eliminar_persona_txn, persona_ref)
+
+    def actualizar_persona(self, persona_id, data):
+        # Solo se escriben los campos modificados; la transacción se reintenta si hay conflicto
+        persona_ref = get_db().collection('Publishers').document(persona_id)
+        return ejecutar_transaccion(actualizar_persona_txn, persona_ref, data)
+
+    def actualizar_admin(self, persona_id, cambios):
+        persona_ref = get_db().collection('Publishers').document(persona_id)
+        return ejecutar_transaccion(actualizar_persona_admin_txn, persona_ref, cambios)
+
+    def guardar_registros_mes(self, grupo_id, mes, year, filas):
+        return guardar_registros_mes(grupo_id, mes, year, filas)
+
+    def cambios_desde(self, since):
+        return cambios_desde(since)
+
+    def totales_mes(self, mes, year):
+        # Solo los documentos Reports, materializados en cada escritura
+        refs = [totales_ref(grupo_id, mes, year) for grupo_id in GRUPOS]
+        grupos = {ref.id: grupo_id for ref, grupo_id in zip(refs, GRUPOS)}
+        return {grupos[doc.id]: doc.to_dict() for doc in leer_documentos(refs) if doc.exists}
+
+    def rollups(self, grupos, meses):
+        refs = [rollup_ref(g, mes, year) for mes, year in meses for g in grupos]
+        return [doc.to_dict() for doc in leer_documentos(refs) if doc.exists]
+
+    def exportar(self):
+        for doc in leer_consulta(get_db().collection('Publishers')):
+            yield doc_a_dict(doc)
+
+    def importar(self, personas):
+        """Escribir las personas con WriteBatch; Rollups y Reports se rehacen con rebuild_rollups.py"""
+        total = 0
+        batch = get_db().batch()
+        pendientes = 0
+        for persona_data in personas:
+            documento = {campo: persona_data[campo] for campo in ('name', 'groupID', 'state') if campo in persona_data}
+            registros = registros_persona(persona_data)
+            if HOURS_LAYOUT == 'map':
+                documento['months'] = hours_a_months(registros)
+            else:
+                documento['hours'] = registros
+            documento['updatedAt'] = marca_tiempo()
+            batch.set(get_db().collection('Publishers').document(persona_data['id']), documento)
+            pendientes += 1
+            total += 1
+            if pendientes == BATCH_SIZE:
+                batch.commit()
+                contar_firestore('commit', escrituras=pendientes)
+                batch = get_db().batch()
+                pendientes = 0
+        if pendientes:
+            batch.commit()
+            contar_firestore('commit', escrituras=pendientes)
+        return total
+
+class RepositorioSQLite(Repositorio):
+    """Publishers en un archivo SQLite local (modo WAL), pensado para el volumen de Fly.io
+
+    Los registros mensuales van en su propia tabla con clave (publisher, year, month),
+    así el informe de un grupo es una sola consulta indexada y los totales del
+    mes, un GROUP BY. Cada hilo usa su propia conexión.
+    """
+
+    ESQUEMA = """
+        CREATE TABLE IF NOT EXISTS publishers (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            groupID INTEGER,
+            state TEXT NOT NULL DEFAULT 'Publicador',
+            updatedAt INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS publishers_grupo ON publishers (groupID, name);
+        CREATE INDEX IF NOT EXISTS publishers_nombre ON publishers (name);
+        CREATE INDEX IF NOT EXISTS publishers_actualizado ON publishers (updatedAt);
+        CREATE TABLE IF NOT EXISTS registros (
+            publisher TEXT NOT NULL REFERENCES publishers (id) ON DELETE CASCADE,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            hours NUMERIC NOT NULL DEFAULT 0,
+            estudios NUMERIC NOT NULL DEFAULT 0,
+            participo INTEGER NOT NULL DEFAULT 0,
+            comentario TEXT NOT NULL DEFAULT '',
+            PRIMARY KEY (publisher, year, month)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS registros_mes ON registros (year, month);
+        CREATE TABLE IF NOT EXISTS tombstones (
+            id TEXT PRIMARY KEY,
+            updatedAt INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS tombstones_actualizado ON tombstones (updatedAt);
+    """
+
+    # Límite de parámetros por consulta en las versiones antiguas de SQLite
+    LOTE_IDS = 500
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._local = threading.local()
+        self._esquema_lock = threading.Lock()
+        self._esquema_creado = False
+
+    def conexion(self):
+        """Conexión del hilo actual, creada (con el esquema) la primera vez"""
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.ruta)), exist_ok=True)
+            conexion = sqlite3.connect(self.ruta, timeout=30, isolation_level=None, check_same_thread=False)
+            conexion.row_factory = sqlite3.Row
+            conexion.execute('PRAGMA journal_mode=WAL')
+            conexion.execute('PRAGMA synchronous=NORMAL')
+            conexion.execute('PRAGMA foreign_keys=ON')
+            with self._esquema_lock:
+                if not self._esquema_creado:
+                    conexion.executescript(self.ESQUEMA)
+                    self._esquema_creado = True
+            self._local.conexion = conexion
+        return conexion
+
+    @contextmanager
+    def transaccion(self):
+        """BEGIN IMMEDIATE ... COMMIT: las escrituras de otros procesos esperan su turno"""
+        conexion = self.conexion()
+        conexion.execute('BEGIN IMMEDIATE')
+        try:
+            yield conexion
+        except BaseException:
+            conexion.execute('ROLLBACK')
+            raise
+        conexion.execute('COMMIT')
+
+    @staticmethod
+    def _registro(fila):
+        return {
+            'month': fila['month'],
+            'year': fila['year'],
+            'hours': fila['hours'],
+            'estudios': fila['estudios'],
+            'Participo': bool(fila['participo']),
+            'Comentario': fila['comentario']
         }
+
+    @staticmethod
+    def _persona(fila, registros):
+        """dict de una persona con sus registros en hours o months según HOURS_LAYOUT"""
+        persona_data = {
+            'id': fila['id'],
+            'name': fila['name'],
+            'groupID': fila['groupID'],
+            'state': fila['state']
+        }
+        if fila['updatedAt'] is not None:
+            persona_data['updatedAt'] = fila['updatedAt']
+        if HOURS_LAYOUT == 'map':
+            persona_data['months'] = hours_a_months(registros)
+        else:
+            persona_data['hours'] = registros
+        return persona_data
+
+    def _registros_de(self, conexion, ids):
+        """{id: registros ordenados} de varias personas"""
+        registros = {persona_id: [] for persona_id in ids}
+        for inicio in range(0, len(ids), self.LOTE_IDS):
+            lote = ids[inicio:inicio + self.LOTE_IDS]
+            filas = conexion.execute(
+                f"SELECT * FROM registros WHERE publisher IN ({','.join('?' * len(lote))}) "
+                'ORDER BY publisher, year, month',
+                lote
+            )
+            for fila in filas:
+                registros[fila['publisher']].append(self._registro(fila))
+        return registros
+
+    def _completar(self, conexion, filas, con_registros=True):
+        filas = list(filas)
+        registros = self._registros_de(conexion, [fila['id'] for fila in filas]) if con_registros else {}
+        return [self._persona(fila, registros.get(fila['id'], [])) for fila in filas]
+
+    @staticmethod
+    def _guardar_registro(conexion, persona_id, registro):
+        comentario = registro.get('Comentario')
+        conexion.execute(
+            'INSERT INTO registros (publisher, year, month, hours, estudios, participo, comentario) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (publisher, year, month) DO UPDATE SET hours = excluded.hours, '
+            'estudios = excluded.estudios, participo = excluded.participo, comentario = excluded.comentario',
+            (
+                persona_id, registro['year'], registro['month'],
+                numero(registro.get('hours')), numero(registro.get('estudios')),
+                1 if registro.get('Participo') else 0,
+                comentario if isinstance(comentario, str) else ''
+            )
+        )
+
+    def listar(self, grupos=None, limite=None, cursor=None, campos=None, prefijo=None):
+        condiciones = []
+        parametros = []
+        if grupos is not None:
+            condiciones.append(f"groupID IN ({','.join('?' * len(grupos))})")
+            parametros += list(grupos)
+        if prefijo is not None:
+            condiciones.append('name >= ? AND name < ?')
+            parametros += [prefijo, prefijo + '\uf8ff']
+        if cursor is not None:
+            condiciones.append('(name, id) > (?, ?)')
+            parametros += list(cursor)
         
-        for doc in query:
-            persona_data = doc.to_dict()
-            state = persona_data.get('state', 'Publicador')
-            nombre = persona_data.get('name', 'Sin nombre')
-            
-            hours_mes = 0
-            participo = False
-            estudios = 0
-            comentario = ''
+        # Mismo orden que Firestore: por id, o por (name, id) al paginar o buscar
+        ordenado = limite is not None or cursor is not None or prefijo is not None
+        sql = 'SELECT id, name, groupID, state, updatedAt FROM publishers'
+        if condiciones:
+            sql += ' WHERE ' + ' AND '.join(condiciones)
+        sql += ' ORDER BY name, id' if ordenado else ' ORDER BY id'
+        if limite is not None:
+            sql += ' LIMIT ?'
+            parametros.append(limite)
+        
+        conexion = self.conexion()
+        con_registros = campos is None or bool({'hours', 'months'} & set(campos))
+        personas = self._completar(conexion, conexion.execute(sql, parametros), con_registros)
+
+        # El cursor se toma antes de proyectar: necesita el nombre aunque no se pida
+        siguiente = None
+        if limite is not None and len(personas) == limite:
+            siguiente = codificar_cursor(personas[-1])
+        if campos is not None:
+            personas = [proyectar_persona(p, campos) for p in personas]
+        return personas, siguiente
+
+    def personas_grupos(self, grupos, mes=None, year=None):
+        conexion = self.conexion()
+        marcadores = ','.join('?' * len(grupos))
+        personas_por_grupo = {grupo_id: [] for grupo_id in grupos}
+        if mes is None:
+            filas = conexion.execute(
+                f'SELECT id, name, groupID, state, updatedAt FROM publishers WHERE groupID IN ({marcadores}) ORDER BY id',
+                list(grupos)
+            )
+            for persona_data in self._completar(conexion, filas):
+                personas_por_grupo[persona_data['groupID']].append(persona_data)
+            return personas_por_grupo
+        
+        # Una sola consulta: cada persona con el registro del mes por la clave primaria
+        filas = conexion.execute(
+            'SELECT p.id, p.name, p.groupID, p.state, p.updatedAt, r.year, r.month, r.hours, '
+            'r.estudios, r.participo, r.comentario FROM publishers p '
+            'LEFT JOIN registros r ON r.publisher = p.id AND r.year = ? AND r.month = ? '
+            f'WHERE p.groupID IN ({marcadores}) ORDER BY p.id',
+            [year, mes] + list(grupos)
+        )
+        for fila in filas:
+            registros = [self._registro(fila)] if fila['year'] is not None else []
+            personas_por_grupo[fila['groupID']].append(self._persona(fila, registros))
+        return personas_por_grupo
+
+    def crear(self, persona_data):
+        persona_id = nuevo_id()
+        with self.transaccion() as conexion:
+            conexion.execute(
+                'INSERT INTO publishers (id, name, groupID, state, updatedAt) VALUES (?, ?, ?, ?, ?)',
+                (persona_id, persona_data['name'], persona_data.get('groupID'),
+                 persona_data.get('state', 'Publicador'), persona_data.get('updatedAt', marca_tiempo()))
+            )
+            for registro in registros_persona(persona_data):
+                self._guardar_registro(conexion, persona_id, registro)
+        return persona_id
+
+    def eliminar(self, persona_id):
+        ahora = marca_tiempo()
+        with self.transaccion() as conexion:
+            conexion.execute('DELETE FROM registros WHERE publisher = ?', (persona_id,))
+            conexion.execute('DELETE FROM publishers WHERE id = ?', (persona_id,))
+            conexion.execute('INSERT OR REPLACE INTO tombstones (id, updatedAt) VALUES (?, ?)', (persona_id, ahora))
+            # Equivalente a la política TTL de Tombstones en Firestore
+            conexion.execute('DELETE FROM tombstones WHERE updatedAt < ?', (ahora - SYNC_TOMBSTONE_DIAS * 86400 * 1000,))
+
+    def actualizar_persona(self, persona_id, data):
+        new_hour = data.get('hours')
+        with self.transaccion() as conexion:
+            fila = conexion.execute('SELECT name, groupID, state FROM publishers WHERE id = ?', (persona_id,)).fetchone()
+            if fila is None:
+                return None
+            if 'state' in data:
+                conexion.execute('UPDATE publishers SET state = ? WHERE id = ?', (data['state'], persona_id))
+            if new_hour:
+                self._guardar_registro(conexion, persona_id, new_hour)
+            if 'state' in data or new_hour:
+                conexion.execute('UPDATE publishers SET updatedAt = ? WHERE id = ?', (marca_tiempo(), persona_id))
+        return dict(fila)
+
+    def actualizar_admin(self, persona_id, cambios):
+        with self.transaccion() as conexion:
+            fila = conexion.execute('SELECT name, groupID, state FROM publishers WHERE id = ?', (persona_id,)).fetchone()
+            if fila is None:
+                return None
+            if cambios:
+                asignaciones = ', '.join(f'{campo} = ?' for campo in cambios)
+                conexion.execute(
+                    f'UPDATE publishers SET {asignaciones}, updatedAt = ? WHERE id = ?',
+                    list(cambios.values()) + [marca_tiempo(), persona_id]
+                )
+        return dict(fila)
+
+    def guardar_registros_mes(self, grupo_id, mes, year, filas):
+        resultados, validas = validar_filas_mes(filas)
+        escritas = 0
+        with self.transaccion() as conexion:
+            ids = [filas[i]['id'] for i in validas]
+            grupos = {}
+            for inicio in range(0, len(ids), self.LOTE_IDS):
+                lote = ids[inicio:inicio + self.LOTE_IDS]
+                consulta = conexion.execute(
+                    f"SELECT id, groupID FROM publishers WHERE id IN ({','.join('?' * len(lote))})", lote
+                )
+                grupos.update((fila['id'], fila['groupID']) for fila in consulta)
             
-            hours_array = persona_data.get('hours', [])
-            for hour_entry in hours_array:
-                if hour_entry.get('month') == mes and hour_entry.get('year') == year:
-                    hours_mes = hour_entry.get('hours', 0)
-                    participo = hour_entry.get('Participo', False)
-                    estudios = hour_entry.get('estudios', 0)
-                    comentario = hour_entry.get('Comentario', '')
-                    break
+            ahora = marca_tiempo()
+            for i in validas:
+                fila = filas[i]
+                if fila['id'] not in grupos:
+                    resultados[i]['error'] = 'Persona no encontrada'
+                    continue
+                if grupos[fila['id']] != grupo_id:
+                    resultados[i]['error'] = 'La persona no pertenece al grupo'
+                    continue
+                if 'state' not in fila and 'hours' not in fila:
+                    resultados[i]['error'] = 'No hay cambios'
+                    continue
+                if 'state' in fila:
+                    conexion.execute('UPDATE publishers SET state = ? WHERE id = ?', (fila['state'], fila['id']))
+                if 'hours' in fila:
+                    self._guardar_registro(conexion, fila['id'], dict(fila['hours'], month=mes, year=year))
+                conexion.execute('UPDATE publishers SET updatedAt = ? WHERE id = ?', (ahora, fila['id']))
+                escritas += 1
+        
+        for resultado in resultados:
+            resultado['success'] = 'error' not in resultado
+        if escritas:
+            invalidar_reporte(grupo_id)
+        return resultados
+
+    def cambios_desde(self, since):
+        conexion = self.conexion()
+        filas = conexion.execute(
+            'SELECT id, name, groupID, state, updatedAt FROM publishers WHERE updatedAt >= ? ORDER BY id', (since,)
+        )
+        personas = self._completar(conexion, filas)
+        eliminados = [fila['id'] for fila in conexion.execute('SELECT id FROM tombstones WHERE updatedAt >= ?', (since,))]
+        return personas, eliminados
+
+    def totales_mes(self, mes, year):
+        # Un GROUP BY sobre registros_mes; las mismas reglas que agregar_reporte
+        filas = self.conexion().execute(
+            'SELECT p.groupID AS grupo, p.state AS state, SUM(r.participo) AS participaron, '
+            'SUM(r.hours) AS horas, SUM(r.estudios) AS estudios '
+            'FROM registros r JOIN publishers p ON p.id = r.publisher '
+            'WHERE r.year = ? AND r.month = ? GROUP BY p.groupID, p.state',
+            (year, mes)
+        )
+        totales_por_grupo = {}
+        for fila in filas:
+            if fila['state'] not in ESTADOS:
+                continue
+            totales = totales_por_grupo.setdefault(fila['grupo'], {
+                'grupo': fila['grupo'],
+                'month': mes,
+                'year': year,
+                'totales': {estado: 0 for estado in ESTADOS},
+                'totales_estudios': {estado: 0 for estado in ESTADOS[1:]},
+                'total_general': 0,
+                'total_estudios_general': 0
+            })
+            if fila['state'] == 'Publicador':
+                totales['totales'][fila['state']] = fila['participaron']
+                continue
+            totales['totales'][fila['state']] = fila['horas']
+            totales['totales_estudios'][fila['state']] = fila['estudios']
+            totales['total_general'] += fila['horas']
+            totales['total_estudios_general'] += fila['estudios']
+        return totales_por_grupo
+
+    def rollups(self, grupos, meses):
+        (mes_desde, year_desde), (mes_hasta, year_hasta) = meses[0], meses[-1]
+        filas = self.conexion().execute(
+            'SELECT p.groupID, p.name, p.state, r.publisher, r.year, r.month, r.hours, r.estudios, r.participo '
+            'FROM registros r JOIN publishers p ON p.id = r.publisher '
+            f"WHERE (r.year, r.month) >= (?, ?) AND (r.year, r.month) <= (?, ?) AND p.groupID IN ({','.join('?' * len(grupos))}) "
+            'ORDER BY r.year, r.month',
+            [year_desde, mes_desde, year_hasta, mes_hasta] + list(grupos)
+        )
+        rollups = {}
+        for fila in filas:
+            clave = (fila['year'], fila['month'], fila['groupID'])
+            rollup = rollups.get(clave)
+            if rollup is None:
+                rollup = rollups[clave] = datos_rollup(fila['groupID'], fila['month'], fila['year'], {})
+            rollup['personas'][fila['publisher']] = fila_rollup(
+                {'name': fila['name']}, fila['state'],
+                {'hours': fila['hours'], 'estudios': fila['estudios'], 'Participo': bool(fila['participo'])}
+            )
+        return list(rollups.values())
+
+    def exportar(self):
+        personas, _ = self.listar()
+        return iter(personas)
+
+    def importar(self, personas):
+        total = 0
+        with self.transaccion() as conexion:
+            for persona_data in personas:
+                conexion.execute(
+                    'INSERT OR REPLACE INTO publishers (id, name, groupID, state, updatedAt) VALUES (?, ?, ?, ?, ?)',
+                    (persona_data['id'], persona_data.get('name') or 'Sin nombre', persona_data.get('groupID'),
+                     persona_data.get('state', 'Publicador'), marca_tiempo())
+                )
+                conexion.execute('DELETE FROM registros WHERE publisher = ?', (persona_data['id'],))
+                for registro in registros_persona(persona_data):
+                    self._guardar_registro(conexion, persona_data['id'], registro)
+                total += 1
+        return total
+
+def crear_repositorio(nombre, ruta=None):
+    """Repositorio de un backend: 'firestore' o 'sqlite' (en ruta o SQLITE_PATH)"""
+    if nombre == 'firestore':
+        return RepositorioFirestore()
+    if nombre == 'sqlite':
+        return RepositorioSQLite(ruta or SQLITE_PATH)
+    raise ValueError(f'Almacenamiento no válido: {nombre}')
+
+_repositorio = None
+_repositorio_lock = threading.Lock()
+
+def repositorio():
+    """Repositorio de STORAGE_BACKEND, creado en el primer uso"""
+    global _repositorio
+    if _repositorio is None:
+        with _repositorio_lock:
+            if _repositorio is None:
+                _repositorio = crear_repositorio(STORAGE_BACKEND)
+    return _repositorio
+
+@app.route('/api/reporte/<int:grupo_id>/<int:mes>/<int:year>/bulk', methods=['POST'])
+def bulk_reporte(grupo_id, mes, year):
+    """Guardar los registros del mes de todo un grupo en una sola petición"""
+    try:
+        if not 1 <= mes <= 12:
+            return jsonify({'error': 'Mes no válido'}), 400
+        data = request.json
+        filas = data.get('personas', []) if isinstance(data, dict) else data
+        if not isinstance(filas, list):
+            return jsonify({'error': 'Se esperaba una lista de personas'}), 400
+        
+        resultados = repositorio().guardar_registros_mes(grupo_id, mes, year, filas)
+        guardados = sum(1 for resultado in resultados if resultado['success'])
+        return jsonify({
+            'success': guardados == len(resultados),
+            'guardados': guardados,
+            'resultados': resultados
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/sync')
+def get_sync():
+    """Publishers cambiados y eliminados desde una versión (?since=ms; sin él, todos)"""
+    try:
+        since = request.args.get('since')
+        if since is not None and not since.isdigit():
+            return jsonify({'error': 'since debe ser una versión devuelta por /api/sync'}), 400
+        
+        ahora = marca_tiempo()
+        # Sin versión, o si es más antigua que las eliminaciones conservadas, se envía todo
+        completo = since is None or int(since) < ahora - SYNC_TOMBSTONE_DIAS * 86400 * 1000
+        with medir_fase('fetch'):
+            if completo:
+                publishers, _ = repositorio().listar()
+                eliminados = []
+            else:
+                publishers, eliminados = repositorio().cambios_desde(int(since))
+        
+        # La próxima sincronización repite el margen para no perder escrituras en vuelo
+        return jsonify({
+            'version': ahora - SYNC_MARGEN_MS,
+            'completo': completo,
+            'publishers': publishers,
+            'eliminados': eliminados
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/sync', methods=['POST'])
+def post_sync():
+    """Guardar en bloque los cambios hechos sin conexión
+
+    Cada cambio es {'id', 'grupo', 'state', 'hours': {month, year, ...}}. Se agrupan por
+    grupo y mes para escribirlos con guardar_registros_mes; si una persona tiene varios
+    cambios del mismo mes gana el último, y los anteriores reciben su mismo resultado.
+    """
+    try:
+        data = request.json
+        cambios = data.get('cambios') if isinstance(data, dict) else None
+        if not isinstance(cambios, list):
+            return jsonify({'error': 'Se esperaba una lista de cambios'}), 400
+        
+        resultados = [None] * len(cambios)
+        lotes = {}
+        sustituidos = {}
+        for i, cambio in enumerate(cambios):
+            persona_id = cambio.get('id') if isinstance(cambio, dict) else None
+            try:
+                clave = (int(cambio['grupo']), int(cambio['hours']['month']), int(cambio['hours']['year']))
+            except (KeyError, TypeError, ValueError):
+                clave = None
+            if not persona_id or clave is None or not 1 <= clave[1] <= 12:
+                resultados[i] = {'id': persona_id, 'success': False, 'error': 'Se requieren id, grupo y el mes del registro'}
+                continue
             
-            if state in reporte:
-                reporte[state].append({
-                    'nombre': nombre,
-                    'horas': hours_mes,
-                    'participo': participo,
-                    'estudios': estudios,
-                    'comentario': comentario
-                })
-        
-        # Crear PDF
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
-        elements = []
+            ultimos = lotes.setdefault(clave, {})
+            if persona_id in ultimos:
+                sustituidos[ultimos[persona_id]] = (clave, persona_id)
+            ultimos[persona_id] = i
+        
+        for (grupo_id, mes, year), ultimos in lotes.items():
+            indices = list(ultimos.values())
+            filas = [cambios[i] for i in indices]
+            for i, resultado in zip(indices, repositorio().guardar_registros_mes(grupo_id, mes, year, filas)):
+                resultados[i] = resultado
+        
+        # Un cambio sustituido se guarda o falla con el que lo reemplazó
+        for i, (clave, persona_id) in sustituidos.items():
+            resultados[i] = dict(resultados[lotes[clave][persona_id]], sustituido=True)
         
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
+        guardados = sum(1 for resultado in resultados if resultado['success'])
+        return jsonify({
+            'success': guardados == len(resultados),
+            'guardados': guardados,
+            'resultados': resultados
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Encabezados aceptados al importar (normalizados y sin espacios) y el campo de cada uno
+COLUMNAS_IMPORTACION = {
+    'name': 'name', 'nombre': 'name',
+    'groupid': 'groupID', 'grupo': 'groupID', 'group': 'groupID',
+    'state': 'state', 'estado': 'state',
+    'year': 'year', 'ano': 'year',
+    'month': 'month', 'mes': 'month',
+    'hours': 'hours', 'horas': 'hours',
+    'estudios': 'estudios',
+    'participo': 'Participo',
+    'comentario': 'Comentario'
+}
+VALORES_SI = {'si', 's', 'true', 'yes', 'x', '1'}
+VALORES_NO = {'no', 'n', 'false', '0', ''}
+
+@lru_cache(maxsize=None)
+def modulo_openpyxl():
+    """El módulo openpyxl si está instalado (solo hace falta para importar XLSX)"""
+    try:
+        import openpyxl
+        return openpyxl
+    except ImportError:
+        return None
+
+def filas_csv(archivo):
+    """Filas de un CSV binario, leídas a medida que se recorren
+
+    El separador (',', ';' o tabulador) se deduce de la línea de encabezados.
+    """
+    texto = io.TextIOWrapper(archivo, encoding='utf-8-sig', newline='')
+    primera = texto.readline()
+    separador = max(',;\t', key=primera.count)
+    return csv.reader(itertools.chain([primera], texto), delimiter=separador)
+
+def filas_xlsx(archivo):
+    """Filas de la primera hoja de un XLSX, leída en modo read_only"""
+    libro = modulo_openpyxl().load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        yield from libro.worksheets[0].iter_rows(values_only=True)
+    finally:
+        libro.close()
+
+def filas_archivo(archivo, formato):
+    """Filas de un archivo de importación 'csv' o 'xlsx'"""
+    if formato == 'xlsx':
+        return filas_xlsx(archivo)
+    return filas_csv(archivo)
+
+def texto_celda(valor):
+    """Texto de una celda de CSV o XLSX, sin espacios alrededor (3.0 se lee como '3')"""
+    if valor is None:
+        return ''
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor).strip()
+
+def entero_celda(valor):
+    """Entero de una celda ('3', 3 o 3.0); ValueError si no lo es"""
+    numero_celda = float(texto_celda(valor))
+    if not numero_celda.is_integer():
+        raise ValueError(valor)
+    return int(numero_celda)
+
+def cantidad_celda(valor):
+    """Número >= 0 de una celda (vacía es 0, admite coma decimal); ValueError si no lo es"""
+    texto = texto_celda(valor).replace(',', '.')
+    if not texto:
+        return 0
+    cantidad = float(texto)
+    if cantidad < 0 or not math.isfinite(cantidad):
+        raise ValueError(valor)
+    return int(cantidad) if cantidad.is_integer() else cantidad
+
+def leer_fila_importacion(columnas, celdas):
+    """(fila, error) de una fila del archivo: name, groupID, state y el registro del mes en hours"""
+    valores = {campo: celda for campo, celda in zip(columnas, celdas) if campo is not None}
+    nombre = ' '.join(texto_celda(valores.get('name')).split())
+    if not nombre:
+        return None, 'El nombre es requerido'
+    fila = {'name': nombre}
+    
+    if texto_celda(valores.get('groupID')):
+        try:
+            grupo_id = entero_celda(valores['groupID'])
+        except ValueError:
+            grupo_id = None
+        if grupo_id not in GRUPOS:
+            return None, f"Grupo no válido: {texto_celda(valores['groupID'])}"
+        fila['groupID'] = grupo_id
+    
+    if texto_celda(valores.get('state')):
+        estados = {normalizar_nombre(estado): estado for estado in ESTADOS}
+        state = estados.get(normalizar_nombre(texto_celda(valores['state'])))
+        if state is None:
+            return None, f"Estado no válido: {texto_celda(valores['state'])}"
+        fila['state'] = state
+    
+    if not texto_celda(valores.get('month')) and not texto_celda(valores.get('year')):
+        return fila, None
+    try:
+        mes = entero_celda(valores.get('month'))
+        year = entero_celda(valores.get('year'))
+    except ValueError:
+        return None, 'Se requieren year y month numéricos'
+    if not 1 <= mes <= 12 or not 1900 <= year <= 2100:
+        return None, 'Mes o año fuera de rango'
+    try:
+        horas = cantidad_celda(valores.get('hours'))
+        estudios = cantidad_celda(valores.get('estudios'))
+    except ValueError:
+        return None, 'hours y estudios deben ser números positivos'
+    
+    participo = valores.get('Participo')
+    if not isinstance(participo, bool):
+        texto = normalizar_nombre(texto_celda(participo))
+        if texto not in VALORES_SI | VALORES_NO:
+            return None, f'Participo no válido: {texto_celda(participo)}'
+        participo = texto in VALORES_SI
+    
+    fila['hours'] = {
+        'month': mes,
+        'year': year,
+        'hours': horas,
+        'estudios': estudios,
+        'Participo': participo,
+        'Comentario': texto_celda(valores.get('Comentario'))
+    }
+    return fila, None
+
+def asociar_persona(fila, por_nombre, nuevas):
+    """(persona, error): el publisher con ese nombre (en su grupo, si se indica) o uno nuevo
+
+    Los nuevos se añaden a nuevas y a por_nombre para que las filas siguientes los encuentren.
+    """
+    nombre = normalizar_nombre(fila['name'])
+    candidatos = por_nombre.get(nombre, [])
+    grupo_id = fila.get('groupID')
+    if grupo_id is not None and candidatos:
+        en_grupo = [persona for persona in candidatos if persona.get('groupID') == grupo_id]
+        if not en_grupo:
+            return None, f"Ya existe un publisher con ese nombre en el grupo {candidatos[0].get('groupID')}"
+        candidatos = en_grupo
+    if len(candidatos) > 1:
+        return None, 'Hay varios publishers con ese nombre en el grupo'
+    if candidatos:
+        return candidatos[0], None
+    
+    if grupo_id is None:
+        return None, 'El grupo es requerido para un publisher nuevo'
+    persona = {
+        'id': nuevo_id(),
+        'name': fila['name'],
+        'groupID': grupo_id,
+        'state': fila.get('state', 'Publicador'),
+        'hours': []
+    }
+    nuevas.append(persona)
+    por_nombre.setdefault(nombre, []).append(persona)
+    return persona, None
+
+def importar_filas(filas, dry_run=False):
+    """Importar publishers y registros mensuales; la primera fila son los encabezados
+
+    Cada fila se valida y se asocia por nombre (sin acentos ni mayúsculas) a un publisher
+    existente o a uno nuevo. Los nuevos se crean con importar y los registros se guardan
+    por grupo y mes con guardar_registros_mes, en lotes. Si una persona tiene varias filas
+    del mismo mes gana la última. Con dry_run se valida todo sin escribir.
+    """
+    filas = iter(filas)
+    encabezados = next(filas, None)
+    if encabezados is None:
+        raise ValueError('El archivo está vacío')
+    columnas = [
+        COLUMNAS_IMPORTACION.get(normalizar_nombre(texto_celda(encabezado)).replace(' ', ''))
+        for encabezado in encabezados
+    ]
+    if 'name' not in columnas:
+        raise ValueError('Falta la columna name (o nombre)')
+    columna_nombre = columnas.index('name')
+    
+    # Publishers actuales por nombre normalizado, leídos de nuevo para no usar un índice viejo
+    indice_nombres.invalidar()
+    por_nombre = {}
+    for persona, nombre, _ in indice_nombres.datos()['entradas'].values():
+        por_nombre.setdefault(nombre, []).append(persona)
+    
+    errores = []
+    nuevas = []
+    registros = {}
+    total = 0
+    for numero_fila, celdas in enumerate(filas, start=2):
+        if not any(texto_celda(celda) for celda in celdas):
+            continue
+        total += 1
+        if total > IMPORT_MAX_FILAS:
+            raise ValueError(f'El archivo tiene más de {IMPORT_MAX_FILAS} filas')
+        
+        fila, error = leer_fila_importacion(columnas, celdas)
+        if error is None:
+            persona, error = asociar_persona(fila, por_nombre, nuevas)
+        if error is not None:
+            nombre = texto_celda(celdas[columna_nombre]) if columna_nombre < len(celdas) else ''
+            errores.append({'fila': numero_fila, 'name': nombre, 'error': error})
+            continue
+        if 'hours' in fila:
+            clave = (persona['groupID'], fila['hours']['month'], fila['hours']['year'])
+            registros.setdefault(clave, {})[persona['id']] = (numero_fila, fila['name'], fila['hours'])
+    
+    guardados = 0
+    if dry_run:
+        guardados = sum(len(por_persona) for por_persona in registros.values())
+    else:
+        if nuevas:
+            repositorio().importar(nuevas)
+            invalidar_reporte()
+            indice_nombres.invalidar()
+        for (grupo_id, mes, year), por_persona in registros.items():
+            filas_mes = [{'id': persona_id, 'hours': hours} for persona_id, (_, _, hours) in por_persona.items()]
+            resultados = repositorio().guardar_registros_mes(grupo_id, mes, year, filas_mes)
+            for (numero_fila, nombre, _), resultado in zip(por_persona.values(), resultados):
+                if resultado['success']:
+                    guardados += 1
+                else:
+                    errores.append({'fila': numero_fila, 'name': nombre, 'error': resultado['error']})
+    
+    return {
+        'dry_run': dry_run,
+        'filas': total,
+        'creados': len(nuevas),
+        'registros': guardados,
+        'errores': sorted(errores, key=lambda error: error['fila'])
+    }
+
+@app.route('/api/import', methods=['POST'])
+def import_publishers():
+    """Importar publishers y registros mensuales desde un CSV o XLSX (campo archivo; ?dry_run=true)"""
+    try:
+        archivo = request.files.get('archivo')
+        if archivo is None or not archivo.filename:
+            return jsonify({'error': 'Se requiere el archivo en el campo archivo'}), 400
+        formato = request.args.get('formato') or os.path.splitext(archivo.filename)[1].lstrip('.').lower()
+        if formato not in ('csv', 'xlsx'):
+            return jsonify({'error': 'El archivo debe ser CSV o XLSX'}), 400
+        if formato == 'xlsx' and modulo_openpyxl() is None:
+            return jsonify({'error': 'Importar XLSX requiere openpyxl (pip install openpyxl)'}), 501
+        dry_run = request.args.get('dry_run', 'false').lower() == 'true'
+        
+        try:
+            informe = importar_filas(filas_archivo(archivo.stream, formato), dry_run=dry_run)
+        except (ValueError, zipfile.BadZipFile) as e:
+            return jsonify({'error': f'Archivo no válido: {e}'}), 400
+        informe['success'] = not informe['errores']
+        return jsonify(informe)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/dashboard/<int:mes>/<int:year>')
+@con_etag()
+def get_dashboard(mes, year):
+    """Totales del mes de todos los grupos leyendo solo los documentos Reports"""
+    try:
+        if not 1 <= mes <= 12:
+            return jsonify({'error': 'Mes no válido'}), 400
+        totales_por_grupo = repositorio().totales_mes(mes, year)
+        
+        grupos = []
+        for grupo_id in GRUPOS:
+            totales = totales_por_grupo.get(grupo_id, {})
+            grupos.append({
+                'grupo': grupo_id,
+                'totales': totales.get('totales', {}),
+                'totales_estudios': totales.get('totales_estudios', {}),
+                'total_general': totales.get('total_general', 0),
+                'total_estudios_general': totales.get('total_estudios_general', 0)
+            })
+        
+        return jsonify({
+            'mes': MESES[mes - 1],
+            'year': year,
+            'grupos': grupos,
+            'total_general': sum(grupo['total_general'] for grupo in grupos),
+            'total_estudios_general': sum(grupo['total_estudios_general'] for grupo in grupos)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/reporte/<int:grupo_id>/<int:mes>/<int:year>')
+@con_etag('grupo_id')
+def get_reporte_data(grupo_id, mes, year):
+    """Obtener datos para el reporte"""
+    try:
+        return jsonify(obtener_reporte(grupo_id, mes, year))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@lru_cache(maxsize=None)
+def estilos_pdf():
+    """Estilos y plantillas de tabla de los PDF, creados una sola vez en el primer uso"""
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    from reportlab.platypus import TableStyle
+    
+    styles = getSampleStyleSheet()
+    return {
+        'styles': styles,
+        'titulo': ParagraphStyle(
             'CustomTitle',
             parent=styles['Heading1'],
             fontSize=24,
             textColor=colors.HexColor('#1e3a8a'),
             spaceAfter=30,
             alignment=1
-        )
-        
-        subtitle_style = ParagraphStyle(
+        ),
+        'subtitulo': ParagraphStyle(
             'CustomSubtitle',
             parent=styles['Heading2'],
             fontSize=16,
             textColor=colors.HexColor('#1e40af'),
             spaceAfter=20,
             alignment=1
-        )
-        
-        # Título
-        title = Paragraph(f"Informe del mes de {MESES[mes - 1]} {year}", title_style)
-        elements.append(title)
-        
-        subtitle = Paragraph(f"Grupo {grupo_id}", subtitle_style)
-        elements.append(subtitle)
-        elements.append(Spacer(1, 20))
-        
-        total_general = 0
-        total_estudios_general = 0
-        
-        # Crear tabla para cada estado
-        for estado in ['Publicador', 'Precursor Auxiliar', 'Precursor Auxiliar Indefinido', 'Precursor Regular']:
-            if reporte[estado]:
-                # Título del estado
-                estado_title = Paragraph(f"<b>{estado}</b>", styles['Heading3'])
-                elements.append(estado_title)
-                elements.append(Spacer(1, 10))
-                
-                # Datos de la tabla
-                if estado == 'Publicador':
-                    # Para publicadores: nombre y participó
-                    data = [['Nombre', 'Participó']]
-                    total_participo = 0
-                    
-                    for persona in reporte[estado]:
-                        participo_text = 'Sí' if persona['participo'] else 'No'
-                        data.append([persona['nombre'], participo_text])
-                        if persona['participo']:
-                            total_participo += 1
-                    
-                    data.append(['Total Participaron', str(total_participo)])
-                    
-                    # Crear tabla
-                    table = Table(data, colWidths=[4*inch, 1.5*inch])
-                else:
-                    # Para otros: nombre, horas, estudios, comentario
-                    data = [['Nombre', 'Horas', 'Estudios', 'Comentario']]
-                    total_estado = 0
-                    total_estudios_estado = 0
-                    
-                    for persona in reporte[estado]:
-                        comentario_text = persona['comentario'][:30] + '...' if len(persona['comentario']) > 30 else persona['comentario']
-                        data.append([
-                            persona['nombre'], 
-                            str(persona['horas']),
-                            str(persona['estudios']),
-                            comentario_text
-                        ])
-                        total_estado += persona['horas']
-                        total_estudios_estado += persona['estudios']
-                    
-                    data.append(['Total', str(total_estado), str(total_estudios_estado), ''])
-                    total_general += total_estado
-                    total_estudios_general += total_estudios_estado
-                    
-                    # Crear tabla
-                    table = Table(data, colWidths=[2.5*inch, 1*inch, 1*inch, 2*inch])
-                table.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e3a8a')),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, 0), 12),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                    ('BACKGROUND', (0, 1), (-1, -2), colors.beige),
-                    ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#93c5fd')),
-                    ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-                    ('GRID', (0, 0), (-1, -1), 1, colors.black)
-                ]))
-                
-                elements.append(table)
-                elements.append(Spacer(1, 20))
-        
-        # Total general
-        elements.append(Spacer(1, 10))
-        total_data = [
-            ['Total de Horas', str(total_general)],
-            ['Total de Estudios', str(total_estudios_general)]
-        ]
-        total_table = Table(total_data, colWidths=[4*inch, 1.5*inch])
-        total_table.setStyle(TableStyle([
+        ),
+        'tabla_estado': TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e3a8a')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 12),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -2), colors.beige),
+            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#93c5fd')),
+            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ]),
+        'tabla_total': TableStyle([
             ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#1e3a8a')),
             ('TEXTCOLOR', (0, 0), (-1, -1), colors.whitesmoke),
             ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
             ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
             ('FONTSIZE', (0, 0), (-1, -1), 14),
             ('PADDING', (0, 0), (-1, -1), 12),
-        ]))
-        elements.append(total_table)
-        
-        # Construir PDF
+        ]),
+        'anchos_publicador': [4*inch, 1.5*inch],
+        'anchos_precursor': [2.5*inch, 1*inch, 1*inch, 2*inch],
+        'anchos_rango_estado': [2.5*inch, 1*inch, 1*inch, 1.5*inch],
+        'anchos_rango_persona': [2*inch, 0.6*inch, 1.9*inch, 0.7*inch, 0.8*inch, 0.7*inch]
+    }
+
+def seccion_estado(estado, personas):
+    """Filas y totales de la tabla de un estado, comunes al PDF y al Excel"""
+    contenido = [
+        (p.nombre, p.registro.horas, p.registro.estudios, p.registro.participo, p.registro.comentario)
+        for p in personas
+    ]
+    participaron = sum(1 for fila in contenido if fila[3])
+    horas = sum(fila[1] for fila in contenido)
+    estudios = sum(fila[2] for fila in contenido)
+    if estado == 'Publicador':
+        # Para publicadores: nombre y participó
+        pdf = [['Nombre', 'Participó']]
+        pdf += [[nombre, 'Sí' if participo else 'No'] for nombre, _, _, participo, _ in contenido]
+        pdf.append(['Total Participaron', str(participaron)])
+        excel = [(nombre, 'Sí' if participo else 'No') for nombre, _, _, participo, _ in contenido]
+    else:
+        # Para otros: nombre, horas, estudios, comentario (recortado en el PDF)
+        pdf = [['Nombre', 'Horas', 'Estudios', 'Comentario']]
+        pdf += [
+            [nombre, str(h), str(e), comentario[:30] + '...' if len(comentario) > 30 else comentario]
+            for nombre, h, e, _, comentario in contenido
+        ]
+        pdf.append(['Total', str(horas), str(estudios), ''])
+        excel = [
+            (nombre, h, e, 'Sí' if participo else 'No', comentario)
+            for nombre, h, e, participo, comentario in contenido
+        ]
+    
+    return {
+        'pdf': pdf,
+        'excel': excel,
+        'participaron': participaron,
+        'horas': horas,
+        'estudios': estudios
+    }
+
+def _elementos_seccion_pdf(estado, seccion):
+    """Flowables de la tabla de un estado"""
+    from reportlab.platypus import Table, Paragraph, Spacer
+    
+    estilos = estilos_pdf()
+    anchos = estilos['anchos_publicador'] if estado == 'Publicador' else estilos['anchos_precursor']
+    table = Table(seccion['pdf'], colWidths=anchos)
+    table.setStyle(estilos['tabla_estado'])
+    return [
+        Paragraph(f"<b>{estado}</b>", estilos['styles']['Heading3']),
+        Spacer(1, 10),
+        table,
+        Spacer(1, 20)
+    ]
+
+def _elementos_pdf(datos):
+    """Construir los flowables de la sección PDF de un grupo"""
+    from reportlab.platypus import Table, Paragraph, Spacer
+    
+    estilos = estilos_pdf()
+    reporte = datos['reporte']
+    grupo_id = datos['grupo']
+    mes_nombre = datos['mes']
+    year = datos['year']
+    elements = []
+    
+    # Título
+    title = Paragraph(f"Informe del mes de {mes_nombre} {year}", estilos['titulo'])
+    elements.append(title)
+    
+    subtitle = Paragraph(f"Grupo {grupo_id}", estilos['subtitulo'])
+    elements.append(subtitle)
+    elements.append(Spacer(1, 20))
+    
+    total_general = 0
+    total_estudios_general = 0
+    
+    # Una tabla por estado; los publicadores no suman al total de horas
+    for estado in ESTADOS:
+        if reporte[estado]:
+            seccion = seccion_estado(estado, reporte[estado])
+            elements.extend(_elementos_seccion_pdf(estado, seccion))
+            if estado != 'Publicador':
+                total_general += seccion['horas']
+                total_estudios_general += seccion['estudios']
+    
+    # Total general
+    elements.append(Spacer(1, 10))
+    total_data = [
+        ['Total de Horas', str(total_general)],
+        ['Total de Estudios', str(total_estudios_general)]
+    ]
+    total_table = Table(total_data, colWidths=estilos['anchos_publicador'])
+    total_table.setStyle(estilos['tabla_total'])
+    elements.append(total_table)
+    return elements
+
+def generar_pdf(datos):
+    """Generar el PDF de un informe agregado"""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate
+    
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    elements = _elementos_pdf(datos)
+    
+    # Construir PDF
+    with medir_fase('render'):
         doc.build(elements)
+    buffer.seek(0)
+    
+    return buffer
+
+@lru_cache(maxsize=None)
+def render_pool():
+    """Pool de procesos para renderizar los PDF de los grupos, creado en el primer uso"""
+    # spawn: no copiar a los hijos los hilos ni el canal gRPC del proceso principal
+    return ProcessPoolExecutor(max_workers=EXPORT_PROCESOS, mp_context=multiprocessing.get_context('spawn'))
+
+def pdf_grupo(datos):
+    """Bytes del PDF de un grupo (se ejecuta en render_pool)"""
+    return generar_pdf(datos).getvalue()
+
+def pdfs_grupos(reportes, paralelo=True):
+    """Bytes del PDF de cada grupo, reutilizando los que siguen en pdf_cache
+
+    La clave es el hash del informe del grupo, la misma que usa su exportación
+    individual: tras editar a una persona solo se vuelve a maquetar su grupo.
+    """
+    claves = [hash_contenido(datos) for datos in reportes]
+    partes = [pdf_cache.get(clave) for clave in claves]
+    faltan = [i for i, parte in enumerate(partes) if parte is None]
+    
+    pendientes = [reportes[i] for i in faltan]
+    if paralelo and EXPORT_PROCESOS > 1 and len(pendientes) > 1:
+        nuevas = render_pool().map(pdf_grupo, pendientes)
+    else:
+        nuevas = map(pdf_grupo, pendientes)
+    for i, parte in zip(faltan, nuevas):
+        pdf_cache.set(claves[i], parte)
+        partes[i] = parte
+    return partes
+
+def generar_pdf_congregacion(reportes, paralelo=True):
+    """Generar un PDF con una sección por grupo
+
+    Con pypdf se unen las páginas del PDF de cada grupo (ver pdfs_grupos), que se
+    maquetan en procesos aparte si EXPORT_PROCESOS > 1: cada grupo empieza en una
+    página nueva, así que el resultado es el mismo. Sin pypdf, ReportLab maqueta
+    todo el documento en serie.
+    """
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, PageBreak
+    
+    buffer = io.BytesIO()
+    pypdf = modulo_pypdf()
+    if pypdf is not None:
+        with medir_fase('render'):
+            writer = pypdf.PdfWriter()
+            for parte in pdfs_grupos(reportes, paralelo):
+                writer.append(io.BytesIO(parte))
+            writer.write(buffer)
         buffer.seek(0)
+        return buffer
+    
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    elements = []
+    for i, datos in enumerate(reportes):
+        if i > 0:
+            elements.append(PageBreak())
+        elements.extend(_elementos_pdf(datos))
+    
+    with medir_fase('render'):
+        doc.build(elements)
+    buffer.seek(0)
+    
+    return buffer
+
+def hash_contenido(datos):
+    """Hash estable del contenido de un informe agregado"""
+    contenido = json.dumps(datos, sort_keys=True, ensure_ascii=False, default=a_json)
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+def pdf_cacheado(generar, datos, etag=None):
+    """Obtener (etag, bytes) de un PDF, renderizándolo solo si su contenido cambió"""
+    etag = etag or hash_contenido(datos)
+    pdf_bytes = pdf_cache.get(etag)
+    if pdf_bytes is None:
+        pdf_bytes = generar(datos).getvalue()
+        pdf_cache.set(etag, pdf_bytes)
+    return etag, pdf_bytes
+
+def respuesta_pdf(datos, generar, nombre):
+    """Responder con el PDF en cache o 304 si el cliente ya tiene esa versión"""
+    etag = hash_contenido(datos)
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers={'ETag': f'"{etag}"'})
+    
+    etag, pdf_bytes = pdf_cacheado(generar, datos, etag)
+    return send_file(
+        io.BytesIO(pdf_bytes),
+        as_attachment=True,
+        download_name=nombre,
+        mimetype='application/pdf',
+        etag=etag
+    )
+
+def _formatos_excel(workbook):
+    """Registrar en el libro los formatos usados en los informes"""
+    title_format = workbook.add_format({
+        'bold': True,
+        'font_size': 18,
+        'align': 'center',
+        'valign': 'vcenter',
+        'fg_color': '#1e3a8a',
+        'font_color': 'white'
+    })
+    
+    subtitle_format = workbook.add_format({
+        'bold': True,
+        'font_size': 14,
+        'align': 'center',
+        'fg_color': '#3b82f6',
+        'font_color': 'white'
+    })
+    
+    header_format = workbook.add_format({
+        'bold': True,
+        'font_size': 12,
+        'align': 'center',
+        'fg_color': '#1e3a8a',
+        'font_color': 'white',
+        'border': 1
+    })
+    
+    cell_format = workbook.add_format({
+        'align': 'center',
+        'border': 1
+    })
+    
+    total_format = workbook.add_format({
+        'bold': True,
+        'align': 'center',
+        'fg_color': '#93c5fd',
+        'border': 1
+    })
+    
+    total_general_format = workbook.add_format({
+        'bold': True,
+        'font_size': 14,
+        'align': 'center',
+        'fg_color': '#1e3a8a',
+        'font_color': 'white',
+        'border': 1
+    })
+    
+    return {
+        'title': title_format,
+        'subtitle': subtitle_format,
+        'header': header_format,
+        'cell': cell_format,
+        'total': total_format,
+        'total_general': total_general_format
+    }
+
+def _escribir_seccion_excel(worksheet, formatos, row, estado, seccion):
+    """Escribir la tabla de un estado a partir de la fila row; devuelve la fila siguiente"""
+    if estado == 'Publicador':
+        worksheet.merge_range(row, 0, row, 1, estado, formatos['subtitle'])
+        worksheet.write_row(row + 1, 0, ['Nombre', 'Participó'], formatos['header'])
+        total = ['Total Participaron', seccion['participaron']]
+    else:
+        worksheet.merge_range(row, 0, row, 4, estado, formatos['subtitle'])
+        worksheet.write_row(row + 1, 0, ['Nombre', 'Horas', 'Estudios', 'Participó', 'Comentario'], formatos['header'])
+        total = ['Total', seccion['horas'], seccion['estudios'], '', '']
+    row += 2
+    
+    for fila in seccion['excel']:
+        worksheet.write_row(row, 0, fila, formatos['cell'])
+        row += 1
+    
+    # Total del estado
+    worksheet.write_row(row, 0, total, formatos['total'])
+    return row + 2
+
+def _escribir_hoja_reporte(worksheet, formatos, datos):
+    """Escribir el informe de un grupo en una hoja"""
+    reporte = datos['reporte']
+    grupo_id = datos['grupo']
+    mes_nombre = datos['mes']
+    year = datos['year']
+    title_format = formatos['title']
+    subtitle_format = formatos['subtitle']
+    total_general_format = formatos['total_general']
+    
+    # Título
+    worksheet.merge_range('A1:E1', f'Informe del mes de {mes_nombre} {year}', title_format)
+    worksheet.merge_range('A2:E2', f'Grupo {grupo_id}', subtitle_format)
+    
+    row = 3
+    total_general = 0
+    total_estudios_general = 0
+    
+    # Una tabla por estado; los publicadores no suman al total de horas
+    for estado in ESTADOS:
+        if reporte[estado]:
+            seccion = seccion_estado(estado, reporte[estado])
+            row = _escribir_seccion_excel(worksheet, formatos, row, estado, seccion)
+            if estado != 'Publicador':
+                total_general += seccion['horas']
+                total_estudios_general += seccion['estudios']
+    
+    # Total general
+    worksheet.write(row, 0, 'Total General de Horas (sin Publicadores)', total_general_format)
+    worksheet.write(row, 1, total_general, total_general_format)
+    worksheet.write(row, 2, '', total_general_format)
+    worksheet.write(row, 3, '', total_general_format)
+    worksheet.write(row, 4, '', total_general_format)
+    row += 1
+    worksheet.write(row, 0, 'Total General de Estudios', total_general_format)
+    worksheet.write(row, 1, total_estudios_general, total_general_format)
+    worksheet.write(row, 2, '', total_general_format)
+    worksheet.write(row, 3, '', total_general_format)
+    worksheet.write(row, 4, '', total_general_format)
+    
+    # Ajustar columnas
+    worksheet.set_column('A:A', 30)
+    worksheet.set_column('B:B', 12)
+    worksheet.set_column('C:C', 12)
+    worksheet.set_column('D:D', 12)
+    worksheet.set_column('E:E', 40)
+
+def escribir_libro_reporte(workbook, datos):
+    """Escribir en el libro el informe de un grupo"""
+    worksheet = workbook.add_worksheet('Informe')
+    _escribir_hoja_reporte(worksheet, _formatos_excel(workbook), datos)
+
+def escribir_libro_congregacion(workbook, reportes):
+    """Escribir una hoja de resumen y una hoja por grupo"""
+    formatos = _formatos_excel(workbook)
+    
+    # Hoja de resumen con los totales de cada grupo
+    resumen = workbook.add_worksheet('Resumen')
+    mes_nombre = reportes[0]['mes']
+    year = reportes[0]['year']
+    resumen.merge_range('A1:G1', f'Informe del mes de {mes_nombre} {year}', formatos['title'])
+    resumen.merge_range('A2:G2', 'Todos los grupos', formatos['subtitle'])
+    
+    encabezados = ['Grupo', 'Publicadores que participaron'] + ESTADOS[1:] + ['Total Horas', 'Total Estudios']
+    for col, encabezado in enumerate(encabezados):
+        resumen.write(3, col, encabezado, formatos['header'])
+    
+    row = 4
+    acumulado = [0] * (len(encabezados) - 1)
+    for datos in reportes:
+        valores = [datos['totales'][estado] for estado in ESTADOS]
+        valores += [datos['total_general'], datos['total_estudios_general']]
+        resumen.write(row, 0, f"Grupo {datos['grupo']}", formatos['cell'])
+        for col, valor in enumerate(valores, start=1):
+            resumen.write(row, col, valor, formatos['cell'])
+            acumulado[col - 1] += valor
+        row += 1
+    
+    resumen.write(row, 0, 'Total', formatos['total_general'])
+    for col, valor in enumerate(acumulado, start=1):
+        resumen.write(row, col, valor, formatos['total_general'])
+    resumen.set_column('A:A', 14)
+    resumen.set_column('B:G', 24)
+    
+    # XlsxWriter no es seguro entre hilos: las hojas se escriben en secuencia
+    for datos in reportes:
+        worksheet = workbook.add_worksheet(f"Grupo {datos['grupo']}")
+        _escribir_hoja_reporte(worksheet, formatos, datos)
+
+def generar_excel(datos):
+    """Generar el Excel de un informe agregado"""
+    import xlsxwriter
+    
+    buffer = io.BytesIO()
+    with medir_fase('render'):
+        workbook = xlsxwriter.Workbook(buffer)
+        escribir_libro_reporte(workbook, datos)
+        workbook.close()
+    buffer.seek(0)
+    
+    return buffer
+
+def generar_excel_congregacion(reportes):
+    """Generar un Excel con una hoja de resumen y una hoja por grupo"""
+    import xlsxwriter
+    
+    buffer = io.BytesIO()
+    with medir_fase('render'):
+        workbook = xlsxwriter.Workbook(buffer)
+        escribir_libro_congregacion(workbook, reportes)
+        workbook.close()
+    buffer.seek(0)
+    
+    return buffer
+
+def respuesta_excel_streaming(escribir, datos, nombre):
+    """Generar el libro en modo constant_memory y enviarlo por partes
+
+    Las filas se vuelcan a disco a medida que se escriben y el archivo final se
+    guarda en un SpooledTemporaryFile, así que la memoria no crece con las filas.
+    """
+    import xlsxwriter
+    
+    archivo = tempfile.SpooledTemporaryFile(max_size=XLSX_SPOOL_MAX)
+    try:
+        with medir_fase('render'):
+            workbook = xlsxwriter.Workbook(archivo, {'constant_memory': True})
+            escribir(workbook, datos)
+            workbook.close()
+        tamano = archivo.tell()
+        archivo.seek(0)
+    except Exception:
+        archivo.close()
+        raise
+    
+    def generar():
+        try:
+            while True:
+                chunk = archivo.read(EXPORT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            archivo.close()
+    
+    return Response(
+        generar(),
+        mimetype=XLSX_MIMETYPE,
+        headers={
+            'Content-Disposition': f'attachment; filename={nombre}',
+            'Content-Length': str(tamano)
+        }
+    )
+
+def parsear_clave_mes(texto):
+    """Convertir 'YYYY-MM' en (mes, año)"""
+    year, mes = (int(parte) for parte in texto.split('-'))
+    if not 1 <= mes <= 12:
+        raise ValueError(f'Mes no válido: {texto}')
+    return mes, year
+
+def meses_en_rango(desde, hasta):
+    """Lista de (mes, año) entre dos meses, ambos incluidos"""
+    mes, year = desde
+    meses = []
+    while (year, mes) <= (hasta[1], hasta[0]):
+        meses.append((mes, year))
+        mes += 1
+        if mes > 12:
+            mes, year = 1, year + 1
+    return meses
+
+def rango_desde_request():
+    """Leer el rango de meses de ?desde=YYYY-MM&hasta=YYYY-MM o ?anio_servicio=YYYY"""
+    anio_servicio = request.args.get('anio_servicio', type=int)
+    if anio_servicio:
+        # El año de servicio va de septiembre a agosto
+        return meses_en_rango((9, anio_servicio - 1), (8, anio_servicio))
+    
+    desde = parsear_clave_mes(request.args['desde'])
+    hasta = parsear_clave_mes(request.args.get('hasta', request.args['desde']))
+    return meses_en_rango(desde, hasta)
+
+def agregar_rango(rollups, meses, grupos):
+    """Sumar los rollups mensuales por persona, por estado, por grupo y por mes"""
+    personas = {}
+    por_estado = {estado: {'horas': 0, 'estudios': 0, 'participaciones': 0} for estado in ESTADOS}
+    por_grupo = {grupo_id: {'horas': 0, 'estudios': 0, 'participaciones': 0} for grupo_id in grupos}
+    por_mes = {clave_mes(mes, year): {'horas': 0, 'estudios': 0, 'participaciones': 0} for mes, year in meses}
+    
+    for rollup in rollups:
+        grupo_id = rollup.get('grupo')
+        clave = clave_mes(rollup['month'], rollup['year'])
+        for persona_id, fila in rollup.get('personas', {}).items():
+            state = fila.get('state', 'Publicador')
+            horas = fila.get('horas', 0) if state != 'Publicador' else 0
+            estudios = fila.get('estudios', 0)
+            participo = 1 if fila.get('participo') else 0
+            
+            persona = personas.setdefault(persona_id, {
+                'id': persona_id,
+                'nombre': fila.get('nombre', 'Sin nombre'),
+                'grupo': grupo_id,
+                'state': state,
+                'horas': 0,
+                'estudios': 0,
+                'participaciones': 0,
+                'meses': 0
+            })
+            # Los meses llegan en orden: conservar el último estado y grupo
+            persona['state'] = state
+            persona['grupo'] = grupo_id
+            persona['horas'] += horas
+            persona['estudios'] += estudios
+            persona['participaciones'] += participo
+            persona['meses'] += 1
+            
+            for total in (por_estado.get(state), por_grupo.get(grupo_id), por_mes[clave]):
+                if total is not None:
+                    total['horas'] += horas
+                    total['estudios'] += estudios
+                    total['participaciones'] += participo
+    
+    return {
+        'desde': clave_mes(*meses[0]),
+        'hasta': clave_mes(*meses[-1]),
+        'grupos': grupos,
+        'personas': sorted(personas.values(), key=lambda p: (p['grupo'] or 0, p['nombre'])),
+        'por_estado': por_estado,
+        'por_grupo': {str(grupo_id): total for grupo_id, total in por_grupo.items()},
+        'por_mes': por_mes,
+        'total_horas': sum(total['horas'] for total in por_grupo.values()),
+        'total_estudios': sum(total['estudios'] for total in por_grupo.values())
+    }
+
+def obtener_reporte_rango(grupo_id, meses):
+    """Leer los rollups del rango (un solo get_all en Firestore) y agregarlos"""
+    grupos = GRUPOS if grupo_id == 0 else [grupo_id]
+    with medir_fase('fetch'):
+        rollups = repositorio().rollups(grupos, meses)
+    with medir_fase('aggregate'):
+        rollups.sort(key=lambda rollup: (rollup['year'], rollup['month']))
+        return agregar_rango(rollups, meses, grupos)
+
+def generar_pdf_rango(datos):
+    """Generar el PDF de un informe de varios meses"""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Table, Paragraph, Spacer
+    
+    estilos = estilos_pdf()
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    elements = []
+    
+    titulo_grupos = 'Todos los grupos' if len(datos['grupos']) > 1 else f"Grupo {datos['grupos'][0]}"
+    elements.append(Paragraph(f"Informe de {datos['desde']} a {datos['hasta']}", estilos['titulo']))
+    elements.append(Paragraph(titulo_grupos, estilos['subtitulo']))
+    elements.append(Spacer(1, 20))
+    
+    # Totales por estado
+    data = [['Estado', 'Horas', 'Estudios', 'Participaciones']]
+    for estado, total in datos['por_estado'].items():
+        data.append([estado, str(total['horas']), str(total['estudios']), str(total['participaciones'])])
+    data.append(['Total', str(datos['total_horas']), str(datos['total_estudios']), ''])
+    table = Table(data, colWidths=estilos['anchos_rango_estado'])
+    table.setStyle(estilos['tabla_estado'])
+    elements.append(table)
+    elements.append(Spacer(1, 20))
+    
+    # Totales por persona
+    elements.append(Paragraph("<b>Por persona</b>", estilos['styles']['Heading3']))
+    elements.append(Spacer(1, 10))
+    data = [['Nombre', 'Grupo', 'Estado', 'Horas', 'Estudios', 'Meses']]
+    for persona in datos['personas']:
+        data.append([
+            persona['nombre'],
+            str(persona['grupo']),
+            persona['state'],
+            str(persona['horas']),
+            str(persona['estudios']),
+            f"{persona['participaciones']}/{persona['meses']}"
+        ])
+    data.append(['Total', '', '', str(datos['total_horas']), str(datos['total_estudios']), ''])
+    table = Table(data, colWidths=estilos['anchos_rango_persona'], repeatRows=1)
+    table.setStyle(estilos['tabla_estado'])
+    elements.append(table)
+    
+    with medir_fase('render'):
+        doc.build(elements)
+    buffer.seek(0)
+    
+    return buffer
+
+def escribir_libro_rango(workbook, datos):
+    """Escribir un informe de varios meses: totales y detalle por persona"""
+    formatos = _formatos_excel(workbook)
+    worksheet = workbook.add_worksheet('Informe')
+    
+    titulo_grupos = 'Todos los grupos' if len(datos['grupos']) > 1 else f"Grupo {datos['grupos'][0]}"
+    worksheet.merge_range('A1:F1', f"Informe de {datos['desde']} a {datos['hasta']}", formatos['title'])
+    worksheet.merge_range('A2:F2', titulo_grupos, formatos['subtitle'])
+    
+    row = 3
+    for col, encabezado in enumerate(['Estado', 'Horas', 'Estudios', 'Participaciones']):
+        worksheet.write(row, col, encabezado, formatos['header'])
+    row += 1
+    for estado, total in datos['por_estado'].items():
+        worksheet.write(row, 0, estado, formatos['cell'])
+        worksheet.write(row, 1, total['horas'], formatos['cell'])
+        worksheet.write(row, 2, total['estudios'], formatos['cell'])
+        worksheet.write(row, 3, total['participaciones'], formatos['cell'])
+        row += 1
+    worksheet.write(row, 0, 'Total', formatos['total'])
+    worksheet.write(row, 1, datos['total_horas'], formatos['total'])
+    worksheet.write(row, 2, datos['total_estudios'], formatos['total'])
+    worksheet.write(row, 3, '', formatos['total'])
+    row += 2
+    
+    encabezados = ['Nombre', 'Grupo', 'Estado', 'Horas', 'Estudios', 'Meses que participó']
+    for col, encabezado in enumerate(encabezados):
+        worksheet.write(row, col, encabezado, formatos['header'])
+    row += 1
+    for persona in datos['personas']:
+        worksheet.write(row, 0, persona['nombre'], formatos['cell'])
+        worksheet.write(row, 1, persona['grupo'], formatos['cell'])
+        worksheet.write(row, 2, persona['state'], formatos['cell'])
+        worksheet.write(row, 3, persona['horas'], formatos['cell'])
+        worksheet.write(row, 4, persona['estudios'], formatos['cell'])
+        worksheet.write(row, 5, persona['participaciones'], formatos['cell'])
+        row += 1
+    
+    worksheet.set_column('A:A', 30)
+    worksheet.set_column('B:B', 10)
+    worksheet.set_column('C:C', 30)
+    worksheet.set_column('D:F', 14)
+
+@app.route('/api/reporte/rango/<int:grupo_id>')
+@con_etag('grupo_id')
+def get_reporte_rango(grupo_id):
+    """Informe de varios meses (grupo 0 = todos) en JSON, PDF o Excel"""
+    try:
+        try:
+            meses = rango_desde_request()
+        except (KeyError, ValueError):
+            return jsonify({'error': 'Indica ?desde=YYYY-MM&hasta=YYYY-MM o ?anio_servicio=YYYY'}), 400
+        if not meses or len(meses) > RANGO_MAX_MESES:
+            return jsonify({'error': f'El rango debe tener entre 1 y {RANGO_MAX_MESES} meses'}), 400
+        if grupo_id != 0 and grupo_id not in GRUPOS:
+            return jsonify({'error': 'Grupo no válido'}), 400
         
-        return send_file(
-            buffer,
-            as_attachment=True,
-            download_name=f'informe_grupo_{grupo_id}_{MESES[mes-1]}_{year}.pdf',
-            mimetype='application/pdf'
+        datos = obtener_reporte_rango(grupo_id, meses)
+        formato = request.args.get('formato', 'json')
+        nombre = f"informe_grupo_{grupo_id or 'todos'}_{datos['desde']}_{datos['hasta']}"
+        
+        if formato == 'pdf':
+            return respuesta_pdf(datos, generar_pdf_rango, f'{nombre}.pdf')
+        if formato == 'excel':
+            return respuesta_excel_streaming(escribir_libro_rango, datos, f'{nombre}.xlsx')
+        return jsonify(datos)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@lru_cache(maxsize=None)
+def modulo_pyarrow():
+    """El módulo pyarrow (con pyarrow.compute) si está instalado"""
+    try:
+        import pyarrow
+        import pyarrow.compute
+        return pyarrow
+    except ImportError:
+        return None
+
+def esquema_historial(pa):
+    """Columnas de los archivos de historial: una fila por persona y mes"""
+    return pa.schema([
+        ('publisher', pa.string()),
+        ('grupo', pa.int16()),
+        ('state', pa.dictionary(pa.int8(), pa.string())),
+        ('year', pa.int16()),
+        ('month', pa.int8()),
+        ('periodo', pa.int32()),
+        ('hours', pa.float64()),
+        ('estudios', pa.int32()),
+        ('participo', pa.bool_())
+    ])
+
+def ruta_historial(year):
+    return os.path.join(HISTORIAL_DIR, f'historial-{year}.arrow')
+
+def compactar_historial(directorio=None):
+    """Aplanar los registros de Publishers en un archivo Arrow IPC por año
+
+    Lee la colección una sola vez. Cada archivo se escribe aparte y se renombra
+    al final, así las consultas en curso siguen viendo el anterior. Devuelve el
+    manifiesto con los años y filas escritos.
+    """
+    pa = modulo_pyarrow()
+    if pa is None:
+        raise RuntimeError('pyarrow no está instalado')
+    directorio = directorio or HISTORIAL_DIR
+    os.makedirs(directorio, exist_ok=True)
+    
+    columnas_por_anio = {}
+    with medir_fase('fetch'):
+        personas = list(repositorio().exportar())
+    for persona_data in personas:
+        for registro in registros_persona(persona_data):
+            mes, year = registro.get('month'), registro.get('year')
+            if not isinstance(mes, int) or not isinstance(year, int):
+                continue
+            columnas = columnas_por_anio.setdefault(year, {campo: [] for campo in esquema_historial(pa).names})
+            columnas['publisher'].append(persona_data['id'])
+            columnas['grupo'].append(persona_data.get('groupID'))
+            columnas['state'].append(persona_data.get('state', 'Publicador'))
+            columnas['year'].append(year)
+            columnas['month'].append(mes)
+            columnas['periodo'].append(year * 100 + mes)
+            columnas['hours'].append(registro.get('hours', 0) or 0)
+            columnas['estudios'].append(registro.get('estudios', 0) or 0)
+            columnas['participo'].append(bool(registro.get('Participo', False)))
+    
+    esquema = esquema_historial(pa)
+    with medir_fase('render'):
+        for year, columnas in columnas_por_anio.items():
+            tabla = pa.table(columnas, schema=esquema)
+            ruta = os.path.join(directorio, f'historial-{year}.arrow')
+            # Sin compresión: los archivos se leen con memory map sin copiarlos
+            with pa.OSFile(f'{ruta}.tmp', 'wb') as archivo:
+                with pa.ipc.new_file(archivo, esquema) as writer:
+                    writer.write_table(tabla)
+            os.replace(f'{ruta}.tmp', ruta)
+    
+    # Los años que ya no tienen registros dejan de existir
+    for nombre in os.listdir(directorio):
+        year = nombre[len('historial-'):-len('.arrow')]
+        if nombre.startswith('historial-') and nombre.endswith('.arrow') and year.isdigit() and int(year) not in columnas_por_anio:
+            os.remove(os.path.join(directorio, nombre))
+    
+    manifiesto = {
+        'generado': datetime.now(timezone.utc).isoformat(),
+        'anios': {str(year): len(columnas['periodo']) for year, columnas in sorted(columnas_por_anio.items())}
+    }
+    with open(os.path.join(directorio, 'manifiesto.json.tmp'), 'w') as archivo:
+        json.dump(manifiesto, archivo)
+    os.replace(os.path.join(directorio, 'manifiesto.json.tmp'), os.path.join(directorio, 'manifiesto.json'))
+    return manifiesto
+
+def leer_historial(year):
+    """Tabla de un año leída con memory map, o None si no se ha compactado"""
+    pa = modulo_pyarrow()
+    ruta = ruta_historial(year)
+    if not os.path.exists(ruta):
+        return None
+    with pa.memory_map(ruta, 'r') as fuente:
+        return pa.ipc.open_file(fuente).read_all()
+
+def consultar_historial(meses, claves, grupo_id=None, state=None):
+    """Sumas y medias de horas, estudios y participación agrupadas por claves
+
+    Filtra y agrupa con pyarrow.compute sobre las columnas, sin recorrer filas en Python.
+    """
+    pa = modulo_pyarrow()
+    pc = pa.compute
+    tablas = [leer_historial(year) for year in sorted({year for _, year in meses})]
+    tablas = [tabla for tabla in tablas if tabla is not None]
+    if not tablas:
+        return []
+    tabla = pa.concat_tables(tablas)
+    
+    mascara = pc.is_in(tabla['periodo'], value_set=pa.array([year * 100 + mes for mes, year in meses], pa.int32()))
+    if grupo_id is not None:
+        mascara = pc.and_(mascara, pc.equal(tabla['grupo'], grupo_id))
+    if state is not None:
+        mascara = pc.and_(mascara, pc.equal(pc.cast(tabla['state'], pa.string()), state))
+    tabla = tabla.filter(mascara)
+    tabla = tabla.set_column(tabla.schema.get_field_index('state'), 'state', pc.cast(tabla['state'], pa.string()))
+    tabla = tabla.append_column('participacion', pc.cast(tabla['participo'], pa.float64()))
+    
+    agregado = tabla.group_by(list(claves)).aggregate([
+        ('periodo', 'count'),
+        ('publisher', 'count_distinct'),
+        ('hours', 'sum'),
+        ('hours', 'mean'),
+        ('estudios', 'sum'),
+        ('estudios', 'mean'),
+        ('participacion', 'mean')
+    ])
+    agregado = agregado.rename_columns([
+        {
+            'periodo_count': 'registros',
+            'publisher_count_distinct': 'personas',
+            'hours_sum': 'horas',
+            'hours_mean': 'horas_media',
+            'estudios_sum': 'estudios',
+            'estudios_mean': 'estudios_media',
+            'participacion_mean': 'participacion'
+        }.get(nombre, nombre)
+        for nombre in agregado.column_names
+    ])
+    return agregado.sort_by([(clave, 'ascending') for clave in claves]).to_pylist()
+
+@app.route('/api/historial')
+def get_historial():
+    """Agregados de varios años desde el historial compactado, sin leer Firestore"""
+    try:
+        if modulo_pyarrow() is None:
+            return jsonify({'error': 'El historial requiere pyarrow'}), 501
+        try:
+            meses = rango_desde_request()
+        except (KeyError, ValueError):
+            return jsonify({'error': 'Indica ?desde=YYYY-MM&hasta=YYYY-MM o ?anio_servicio=YYYY'}), 400
+        if not meses:
+            return jsonify({'error': 'El rango no tiene meses'}), 400
+        
+        claves = [clave.strip() for clave in request.args.get('por', 'year').split(',') if clave.strip()]
+        invalidas = sorted(set(claves) - set(HISTORIAL_CLAVES))
+        if not claves or invalidas:
+            return jsonify({'error': f"por admite: {', '.join(HISTORIAL_CLAVES)}"}), 400
+        
+        grupo_id = request.args.get('grupo', type=int)
+        state = request.args.get('state')
+        if state is not None and state not in ESTADOS:
+            return jsonify({'error': 'Estado no válido'}), 400
+        
+        with medir_fase('aggregate'):
+            filas = consultar_historial(meses, claves, grupo_id, state)
+        
+        manifiesto = None
+        ruta_manifiesto = os.path.join(HISTORIAL_DIR, 'manifiesto.json')
+        if os.path.exists(ruta_manifiesto):
+            with open(ruta_manifiesto) as archivo:
+                manifiesto = json.load(archivo)
+        return jsonify({
+            'generado': manifiesto['generado'] if manifiesto else None,
+            'por': claves,
+            'filas': filas
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/historial/compactar', methods=['POST'])
+def rebuild_historial():
+    """Regenerar ahora los archivos del historial"""
+    try:
+        if modulo_pyarrow() is None:
+            return jsonify({'error': 'El historial requiere pyarrow'}), 501
+        return jsonify(compactar_historial())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/export/pdf/<int:grupo_id>/<int:mes>/<int:year>')
+def export_pdf(grupo_id, mes, year):
+    """Exportar reporte a PDF"""
+    try:
+        return respuesta_pdf(
+            obtener_reporte(grupo_id, mes, year),
+            generar_pdf,
+            f'informe_grupo_{grupo_id}_{MESES[mes-1]}_{year}.pdf'
         )
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -470,200 +3536,304 @@ def export_pdf(grupo_id, mes, year):
 def export_excel(grupo_id, mes, year):
     """Exportar reporte a Excel"""
     try:
-        # Obtener datos del reporte
-        personas_ref = db.collection('Publishers')
-        query = personas_ref.where('groupID', '==', grupo_id).stream()
+        datos = obtener_reporte(grupo_id, mes, year)
+        nombre = f'informe_grupo_{grupo_id}_{MESES[mes-1]}_{year}.xlsx'
         
-        reporte = {
-            'Publicador': [],
-            'Precursor Auxiliar': [],
-            'Precursor Auxiliar Indefinido': [],
-            'Precursor Regular': []
-        }
-        
-        for doc in query:
-            persona_data = doc.to_dict()
-            state = persona_data.get('state', 'Publicador')
-            nombre = persona_data.get('name', 'Sin nombre')
-            
-            hours_mes = 0
-            participo = False
-            estudios = 0
-            comentario = ''
-            
-            hours_array = persona_data.get('hours', [])
-            for hour_entry in hours_array:
-                if hour_entry.get('month') == mes and hour_entry.get('year') == year:
-                    hours_mes = hour_entry.get('hours', 0)
-                    participo = hour_entry.get('Participo', False)
-                    estudios = hour_entry.get('estudios', 0)
-                    comentario = hour_entry.get('Comentario', '')
-                    break
-            
-            if state in reporte:
-                reporte[state].append({
-                    'nombre': nombre,
-                    'horas': hours_mes,
-                    'participo': participo,
-                    'estudios': estudios,
-                    'comentario': comentario
-                })
-        
-        # Crear Excel
-        buffer = io.BytesIO()
-        workbook = xlsxwriter.Workbook(buffer)
-        worksheet = workbook.add_worksheet('Informe')
-        
-        # Formatos
-        title_format = workbook.add_format({
-            'bold': True,
-            'font_size': 18,
-            'align': 'center',
-            'valign': 'vcenter',
-            'fg_color': '#1e3a8a',
-            'font_color': 'white'
-        })
+        if EXCEL_STREAMING:
+            return respuesta_excel_streaming(escribir_libro_reporte, datos, nombre)
         
-        subtitle_format = workbook.add_format({
-            'bold': True,
-            'font_size': 14,
-            'align': 'center',
-            'fg_color': '#3b82f6',
-            'font_color': 'white'
-        })
+        return send_file(
+            generar_excel(datos),
+            as_attachment=True,
+            download_name=nombre,
+            mimetype=XLSX_MIMETYPE
+        )
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/export/congregacion/<int:mes>/<int:year>')
+def export_congregacion(mes, year):
+    """Exportar el informe de todos los grupos (PDF y Excel en un ZIP)"""
+    try:
+        formato = request.args.get('formato', 'zip')
+        if formato not in ('zip', 'pdf', 'excel'):
+            return jsonify({'error': 'Formato no válido'}), 400
         
-        header_format = workbook.add_format({
-            'bold': True,
-            'font_size': 12,
-            'align': 'center',
-            'fg_color': '#1e3a8a',
-            'font_color': 'white',
-            'border': 1
-        })
+        reportes = obtener_reportes_congregacion(mes, year)
+        nombre = f'informe_congregacion_{MESES[mes-1]}_{year}'
         
-        cell_format = workbook.add_format({
-            'align': 'center',
-            'border': 1
-        })
+        if formato == 'pdf':
+            return respuesta_pdf(reportes, generar_pdf_congregacion, f'{nombre}.pdf')
         
-        total_format = workbook.add_format({
-            'bold': True,
-            'align': 'center',
-            'fg_color': '#93c5fd',
-            'border': 1
-        })
+        if formato == 'excel' and EXCEL_STREAMING:
+            return respuesta_excel_streaming(escribir_libro_congregacion, reportes, f'{nombre}.xlsx')
         
-        total_general_format = workbook.add_format({
-            'bold': True,
-            'font_size': 14,
-            'align': 'center',
-            'fg_color': '#1e3a8a',
-            'font_color': 'white',
-            'border': 1
-        })
+        if formato == 'excel':
+            return send_file(
+                generar_excel_congregacion(reportes),
+                as_attachment=True,
+                download_name=f'{nombre}.xlsx',
+                mimetype=XLSX_MIMETYPE
+            )
         
-        # Título
-        worksheet.merge_range('A1:E1', f'Informe del mes de {MESES[mes - 1]} {year}', title_format)
-        worksheet.merge_range('A2:E2', f'Grupo {grupo_id}', subtitle_format)
-        
-        row = 3
-        total_general = 0
-        total_estudios_general = 0
-        
-        # Escribir datos por estado
-        for estado in ['Publicador', 'Precursor Auxiliar', 'Precursor Auxiliar Indefinido', 'Precursor Regular']:
-            if reporte[estado]:
-                # Título del estado
-                if estado == 'Publicador':
-                    worksheet.merge_range(row, 0, row, 1, estado, subtitle_format)
-                    row += 1
-                    
-                    # Headers para Publicadores
-                    worksheet.write(row, 0, 'Nombre', header_format)
-                    worksheet.write(row, 1, 'Participó', header_format)
-                    row += 1
-                    
-                    # Datos
-                    total_participo = 0
-                    for persona in reporte[estado]:
-                        worksheet.write(row, 0, persona['nombre'], cell_format)
-                        participo_text = 'Sí' if persona['participo'] else 'No'
-                        worksheet.write(row, 1, participo_text, cell_format)
-                        if persona['participo']:
-                            total_participo += 1
-                        row += 1
-                    
-                    # Total del estado
-                    worksheet.write(row, 0, 'Total Participaron', total_format)
-                    worksheet.write(row, 1, total_participo, total_format)
-                    row += 2
-                else:
-                    worksheet.merge_range(row, 0, row, 4, estado, subtitle_format)
-                    row += 1
-                    
-                    # Headers para otros estados
-                    worksheet.write(row, 0, 'Nombre', header_format)
-                    worksheet.write(row, 1, 'Horas', header_format)
-                    worksheet.write(row, 2, 'Estudios', header_format)
-                    worksheet.write(row, 3, 'Participó', header_format)
-                    worksheet.write(row, 4, 'Comentario', header_format)
-                    row += 1
-                    
-                    # Datos
-                    total_estado = 0
-                    total_estudios_estado = 0
-                    for persona in reporte[estado]:
-                        worksheet.write(row, 0, persona['nombre'], cell_format)
-                        worksheet.write(row, 1, persona['horas'], cell_format)
-                        worksheet.write(row, 2, persona['estudios'], cell_format)
-                        participo_text = 'Sí' if persona['participo'] else 'No'
-                        worksheet.write(row, 3, participo_text, cell_format)
-                        worksheet.write(row, 4, persona['comentario'], cell_format)
-                        total_estado += persona['horas']
-                        total_estudios_estado += persona['estudios']
-                        row += 1
-                    
-                    # Total del estado
-                    worksheet.write(row, 0, 'Total', total_format)
-                    worksheet.write(row, 1, total_estado, total_format)
-                    worksheet.write(row, 2, total_estudios_estado, total_format)
-                    worksheet.write(row, 3, '', total_format)
-                    worksheet.write(row, 4, '', total_format)
-                    total_general += total_estado
-                    total_estudios_general += total_estudios_estado
-                    row += 2
-        
-        # Total general
-        worksheet.write(row, 0, 'Total General de Horas (sin Publicadores)', total_general_format)
-        worksheet.write(row, 1, total_general, total_general_format)
-        worksheet.write(row, 2, '', total_general_format)
-        worksheet.write(row, 3, '', total_general_format)
-        worksheet.write(row, 4, '', total_general_format)
-        row += 1
-        worksheet.write(row, 0, 'Total General de Estudios', total_general_format)
-        worksheet.write(row, 1, total_estudios_general, total_general_format)
-        worksheet.write(row, 2, '', total_general_format)
-        worksheet.write(row, 3, '', total_general_format)
-        worksheet.write(row, 4, '', total_general_format)
-        
-        # Ajustar columnas
-        worksheet.set_column('A:A', 30)
-        worksheet.set_column('B:B', 12)
-        worksheet.set_column('C:C', 12)
-        worksheet.set_column('D:D', 12)
-        worksheet.set_column('E:E', 40)
+        # Generar ambos archivos a la vez
+        futuro_excel = export_pool.submit(generar_excel_congregacion, reportes)
+        _, pdf_bytes = pdf_cacheado(generar_pdf_congregacion, reportes)
+        excel_buffer = futuro_excel.result()
         
-        workbook.close()
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archivo_zip:
+            archivo_zip.writestr(f'{nombre}.pdf', pdf_bytes)
+            archivo_zip.writestr(f'{nombre}.xlsx', excel_buffer.getvalue())
         buffer.seek(0)
         
         return send_file(
             buffer,
             as_attachment=True,
-            download_name=f'informe_grupo_{grupo_id}_{MESES[mes-1]}_{year}.xlsx',
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+            download_name=f'{nombre}.zip',
+            mimetype='application/zip'
         )
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def renderizar_export(tipo, datos, ruta):
+    """Renderizar una exportación y guardarla en disco (se ejecuta en el pool de procesos)"""
+    import xlsxwriter
+    
+    congregacion = isinstance(datos, list)
+    ruta_tmp = f'{ruta}.tmp'
+    
+    if tipo == 'pdf':
+        # Ya corre en un proceso del pool de trabajos: sin otro pool dentro
+        buffer = generar_pdf_congregacion(datos, paralelo=False) if congregacion else generar_pdf(datos)
+        with open(ruta_tmp, 'wb') as archivo:
+            archivo.write(buffer.getvalue())
+    else:
+        workbook = xlsxwriter.Workbook(ruta_tmp, {'constant_memory': True})
+        if congregacion:
+            escribir_libro_congregacion(workbook, datos)
+        else:
+            escribir_libro_reporte(workbook, datos)
+        workbook.close()
+    
+    os.replace(ruta_tmp, ruta)
+    return os.path.getsize(ruta)
+
+def proceso_vivo(pid):
+    """El proceso pid sigue en marcha en esta máquina"""
+    if not isinstance(pid, int):
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class ColaExportaciones:
+    """Trabajos de exportación: un pool de procesos acotado y el estado guardado en disco
+
+    El estado de cada trabajo vive en EXPORT_JOBS_DIR/<id>.json, así que cualquier
+    worker puede consultarlo. El id sale del contenido del informe, de modo que
+    pedir dos veces la misma exportación reutiliza el trabajo existente. Un trabajo
+    pendiente cuyo proceso ya no lo está renderizando (caída, reinicio o más de
+    timeout segundos) se marca como error y la siguiente petición lo vuelve a encolar.
+    """
+
+    def __init__(self, directorio, max_workers, ttl, timeout):
+        self.directorio = directorio
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self.timeout = timeout
+        self._pool = None
+        self._pool_id = None
+        self._en_curso = set()
+        self._lock = threading.Lock()
+
+    def _obtener_pool(self):
+        if self._pool is None:
+            os.makedirs(self.directorio, exist_ok=True)
+            # Identifica los trabajos de este pool; se crea tras el fork de cada worker
+            self._pool_id = os.urandom(8).hex()
+            # spawn: no copiar a los hijos los hilos ni el canal gRPC del proceso principal
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._pool
+
+    def _ruta(self, job_id, extension='json'):
+        return os.path.join(self.directorio, f'{job_id}.{extension}')
+
+    def obtener(self, job_id):
+        if not re.fullmatch(r'[0-9a-f]{32}', job_id):
+            return None
+        try:
+            with open(self._ruta(job_id)) as archivo:
+                job = json.load(archivo)
+        except (OSError, ValueError):
+            return None
+        if job['estado'] == 'pendiente' and self._huerfano(job):
+            job = dict(job, estado='error', terminado=time.time(), error='El trabajo se interrumpió')
+            self._guardar(job)
+        return job
+
+    def _huerfano(self, job):
+        """El trabajo pendiente ya no lo está renderizando ningún pool"""
+        if time.time() - job['creado'] > self.timeout:
+            return True
+        if job.get('pool') == self._pool_id:
+            return job['id'] not in self._en_curso
+        return not proceso_vivo(job.get('pid'))
+
+    def _guardar(self, job):
+        ruta = self._ruta(job['id'])
+        with open(f'{ruta}.tmp', 'w') as archivo:
+            json.dump(job, archivo)
+        os.replace(f'{ruta}.tmp', ruta)
+
+    def ruta_archivo(self, job):
+        return self._ruta(job['id'], job['extension'])
+
+    def crear(self, tipo, datos, nombre):
+        """Encolar una exportación o devolver el trabajo idéntico que ya exista"""
+        extension = 'pdf' if tipo == 'pdf' else 'xlsx'
+        job_id = hash_contenido([tipo, datos])[:32]
+        
+        with self._lock:
+            pool = self._obtener_pool()
+            self.limpiar()
+            job = self.obtener(job_id)
+            if job is not None and job['estado'] != 'error':
+                return job
+            
+            job = {
+                'id': job_id,
+                'tipo': tipo,
+                'estado': 'pendiente',
+                'nombre': nombre,
+                'extension': extension,
+                'creado': time.time(),
+                'terminado': None,
+                'tamano': None,
+                'error': None,
+                'pid': os.getpid(),
+                'pool': self._pool_id
+            }
+            self._en_curso.add(job_id)
+            self._guardar(job)
+            futuro = pool.submit(renderizar_export, tipo, datos, self.ruta_archivo(job))
+        
+        futuro.add_done_callback(lambda f: self._terminar(job, f))
+        return job
+
+    def _terminar(self, job, futuro):
+        self._en_curso.discard(job['id'])
+        job = dict(job, terminado=time.time())
+        try:
+            job['tamano'] = futuro.result()
+            job['estado'] = 'listo'
+        except Exception as e:
+            job['estado'] = 'error'
+            job['error'] = str(e)
+        self._guardar(job)
+
+    def limpiar(self):
+        """Eliminar trabajos y archivos más antiguos que el TTL"""
+        limite = time.time() - self.ttl
+        try:
+            nombres = os.listdir(self.directorio)
+        except OSError:
+            return
+        for nombre in nombres:
+            ruta = os.path.join(self.directorio, nombre)
+            try:
+                if os.path.getmtime(ruta) < limite:
+                    os.remove(ruta)
+            except OSError:
+                pass
+
+cola_exportaciones = ColaExportaciones(EXPORT_JOBS_DIR, EXPORT_JOBS_WORKERS, EXPORT_JOBS_TTL, EXPORT_JOBS_TIMEOUT)
+
+def estado_job(job):
+    """Datos públicos de un trabajo de exportación"""
+    estado = {campo: job[campo] for campo in ('id', 'tipo', 'estado', 'nombre', 'creado', 'terminado', 'tamano', 'error')}
+    if job['estado'] == 'listo':
+        estado['descarga'] = f"/api/export/jobs/{job['id']}/descarga"
+    return estado
+
+@app.route('/api/export/jobs', methods=['POST'])
+def create_export_job():
+    """Crear un trabajo de exportación (grupo 0 = todos los grupos)"""
+    try:
+        data = request.json or {}
+        tipo = data.get('tipo')
+        grupo_id = data.get('grupo')
+        mes = data.get('mes')
+        year = data.get('year')
+        
+        if tipo not in ('pdf', 'excel'):
+            return jsonify({'error': 'El tipo debe ser pdf o excel'}), 400
+        if grupo_id != 0 and grupo_id not in GRUPOS:
+            return jsonify({'error': 'Grupo no válido'}), 400
+        if not isinstance(mes, int) or not 1 <= mes <= 12 or not isinstance(year, int):
+            return jsonify({'error': 'Mes o año no válido'}), 400
+        
+        if grupo_id == 0:
+            datos = obtener_reportes_congregacion(mes, year)
+            nombre = f'informe_congregacion_{MESES[mes-1]}_{year}'
+        else:
+            datos = obtener_reporte(grupo_id, mes, year)
+            nombre = f'informe_grupo_{grupo_id}_{MESES[mes-1]}_{year}'
+        nombre += '.pdf' if tipo == 'pdf' else '.xlsx'
+        
+        job = cola_exportaciones.crear(tipo, datos, nombre)
+        return jsonify(estado_job(job)), 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/export/jobs/<job_id>')
+def get_export_job(job_id):
+    """Consultar el estado de un trabajo de exportación"""
+    job = cola_exportaciones.obtener(job_id)
+    if job is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    return jsonify(estado_job(job))
+
+@app.route('/api/export/jobs/<job_id>/descarga')
+def download_export_job(job_id):
+    """Descargar el archivo de un trabajo terminado"""
+    job = cola_exportaciones.obtener(job_id)
+    if job is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    if job['estado'] != 'listo':
+        return jsonify({'error': 'El trabajo todavía no ha terminado', 'estado': job['estado']}), 409
+    
+    return send_file(
+        cola_exportaciones.ruta_archivo(job),
+        as_attachment=True,
+        download_name=job['nombre'],
+        mimetype='application/pdf' if job['tipo'] == 'pdf' else XLSX_MIMETYPE
+    )
+
+def calentar():
+    """Abrir la conexión con Firestore y cargar ReportLab y XlsxWriter antes de la primera petición"""
+    inicio = time.perf_counter()
+    try:
+        repositorio().listar(limite=1)
+        estilos_pdf()
+        import xlsxwriter
+        print(f"✓ Calentamiento terminado en {time.perf_counter() - inicio:.2f} s")
+    except Exception as e:
+        print(f"⚠ Calentamiento fallido: {e}")
+
+# Los procesos del pool de exportación importan este módulo: solo el principal escucha y calienta
+if multiprocessing.parent_process() is None:
+    if PUBLISHERS_SNAPSHOT and STORAGE_BACKEND == 'firestore':
+        replica.iniciar()
+    if WARMUP_ON_BOOT:
+        threading.Thread(target=calentar, daemon=True, name='calentamiento').start()
+
 if __name__ == '__main__':
     app.run(debug=True)
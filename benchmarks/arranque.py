@@ -0,0 +1,83 @@
+"""Comprobar el tiempo de arranque de la aplicación frente a un presupuesto
+
+Uso:
+    python -m benchmarks.arranque [--repeticiones 5] [--presupuesto-ms 250]
+
+Importa app en procesos nuevos (sin credenciales de Firebase) y mide la
+importación y la primera petición. Sale con código 1 si la mediana supera el
+presupuesto o si la importación carga Firebase, ReportLab, XlsxWriter, pyarrow,
+openpyxl o pypdf, que deben esperar al primer uso.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Mediana máxima para importar app (también la usa tests/test_arranque.py)
+PRESUPUESTO_MS = float(os.getenv('ARRANQUE_PRESUPUESTO_MS', '250'))
+
+MODULOS_DIFERIDOS = ['firebase_admin', 'google.cloud.firestore', 'grpc', 'reportlab', 'xlsxwriter', 'pyarrow', 'openpyxl', 'pypdf']
+
+CODIGO = """
+import json, sys, time
+inicio = time.perf_counter()
+import app
+importado = time.perf_counter()
+cliente = app.app.test_client()
+cliente.get('/api/grupos')
+cliente.get('/')
+fin = time.perf_counter()
+print(json.dumps({
+    'import_ms': (importado - inicio) * 1000,
+    'primera_peticion_ms': (fin - importado) * 1000,
+    'cargados': [m for m in %r if m in sys.modules]
+}))
+""" % (MODULOS_DIFERIDOS,)
+
+
+def medir_arranque():
+    """Medir un arranque en un proceso nuevo"""
+    entorno = dict(os.environ, PUBLISHERS_SNAPSHOT='false', WARMUP_ON_BOOT='false')
+    inicio = time.perf_counter()
+    salida = subprocess.run(
+        [sys.executable, '-c', CODIGO],
+        capture_output=True, text=True, check=True, env=entorno,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+    medida = json.loads(salida.stdout.strip().splitlines()[-1])
+    medida['proceso_ms'] = (time.perf_counter() - inicio) * 1000
+    return medida
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--presupuesto-ms', type=float, default=PRESUPUESTO_MS, help='Máximo para importar app (mediana)')
+    args = parser.parse_args()
+
+    medidas = [medir_arranque() for _ in range(args.repeticiones)]
+    resumen = {
+        campo: round(statistics.median(m[campo] for m in medidas), 1)
+        for campo in ('import_ms', 'primera_peticion_ms', 'proceso_ms')
+    }
+    resumen['cargados'] = sorted({modulo for m in medidas for modulo in m['cargados']})
+    resumen['presupuesto_ms'] = args.presupuesto_ms
+    print(json.dumps(resumen, indent=2))
+
+    errores = []
+    if resumen['import_ms'] > args.presupuesto_ms:
+        errores.append(f"La importación tarda {resumen['import_ms']} ms (presupuesto {args.presupuesto_ms} ms)")
+    if resumen['cargados']:
+        errores.append(f"La importación carga módulos diferidos: {', '.join(resumen['cargados'])}")
+    for error in errores:
+        print(f'✗ {error}', file=sys.stderr)
+    if errores:
+        sys.exit(1)
+    print('✓ Arranque dentro del presupuesto', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
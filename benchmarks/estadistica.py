@@ -0,0 +1,10 @@
+"""Estadísticas comunes a los benchmarks y a loadtest.py"""
+
+
+def percentil(valores, p):
+    """Percentil p (0-100) de una lista de valores"""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[indice]
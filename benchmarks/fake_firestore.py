@@ -0,0 +1,453 @@
+"""Firestore falso en memoria para los benchmarks
+
+Implementa la parte del cliente de google-cloud-firestore que usa la aplicación:
+collection/document, where (==, !=, in, <, <=, >, >=), select, order_by, limit,
+start_after, stream, get_all, WriteBatch, transacciones, Increment, DELETE_FIELD y
+rutas de campo con acentos graves (months.`2024-01`).
+
+Cuenta las llamadas (rpc), los documentos leídos y los escritos, y puede simular
+la latencia de red de cada llamada.
+"""
+import copy
+import functools
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from google.api_core.exceptions import NotFound
+from google.cloud.firestore_v1 import DELETE_FIELD, Increment
+
+
+def partes_campo(ruta):
+    """Dividir una ruta de campo (a.b.`c-d`) en sus partes"""
+    partes = []
+    actual = ''
+    entre_acentos = False
+    i = 0
+    while i < len(ruta):
+        caracter = ruta[i]
+        if caracter == '\\' and entre_acentos and i + 1 < len(ruta):
+            actual += ruta[i + 1]
+            i += 2
+            continue
+        if caracter == '`':
+            entre_acentos = not entre_acentos
+        elif caracter == '.' and not entre_acentos:
+            partes.append(actual)
+            actual = ''
+        else:
+            actual += caracter
+        i += 1
+    partes.append(actual)
+    return partes
+
+
+def leer_campo(datos, partes):
+    """(existe, valor) de un campo anidado"""
+    valor = datos
+    for parte in partes:
+        if not isinstance(valor, dict) or parte not in valor:
+            return False, None
+        valor = valor[parte]
+    return True, valor
+
+
+def _resolver(valor, anterior=None):
+    """Aplicar Increment sobre el valor anterior y resolver los mapas anidados"""
+    if isinstance(valor, Increment):
+        base = anterior if isinstance(anterior, (int, float)) and not isinstance(anterior, bool) else 0
+        return base + valor.value
+    if isinstance(valor, dict):
+        return {clave: _resolver(v) for clave, v in valor.items() if v is not DELETE_FIELD}
+    return copy.deepcopy(valor)
+
+
+def _fusionar(destino, datos):
+    """set(merge=True): fusionar los mapas campo a campo"""
+    for clave, valor in datos.items():
+        if valor is DELETE_FIELD:
+            destino.pop(clave, None)
+        elif isinstance(valor, dict) and isinstance(destino.get(clave), dict):
+            _fusionar(destino[clave], valor)
+        elif isinstance(valor, dict):
+            destino[clave] = {}
+            _fusionar(destino[clave], valor)
+        else:
+            destino[clave] = _resolver(valor, destino.get(clave))
+
+
+def _actualizar(destino, cambios):
+    """update(): cada clave es una ruta de campo y su valor reemplaza al anterior"""
+    for ruta, valor in cambios.items():
+        partes = partes_campo(ruta)
+        padre = destino
+        for parte in partes[:-1]:
+            if not isinstance(padre.get(parte), dict):
+                padre[parte] = {}
+            padre = padre[parte]
+        if valor is DELETE_FIELD:
+            padre.pop(partes[-1], None)
+        else:
+            padre[partes[-1]] = _resolver(valor, padre.get(partes[-1]))
+
+
+def _proyectar(datos, rutas):
+    """Copia del documento con solo los campos indicados"""
+    resultado = {}
+    for ruta in rutas:
+        partes = partes_campo(ruta)
+        existe, valor = leer_campo(datos, partes)
+        if not existe:
+            continue
+        destino = resultado
+        for parte in partes[:-1]:
+            destino = destino.setdefault(parte, {})
+        destino[partes[-1]] = copy.deepcopy(valor)
+    return resultado
+
+
+def _rango_valor(valor):
+    """Orden de Firestore entre tipos: null < bool < número < texto < resto"""
+    if valor is None:
+        return (0, 0)
+    if isinstance(valor, bool):
+        return (1, valor)
+    if isinstance(valor, (int, float)):
+        return (2, valor)
+    if isinstance(valor, str):
+        return (3, valor)
+    return (4, str(valor))
+
+
+def _cumple(valor, operador, esperado):
+    if operador == '==':
+        return valor == esperado
+    if operador == '!=':
+        return valor != esperado
+    if operador == 'in':
+        return valor in esperado
+    if operador == 'not-in':
+        return valor not in esperado
+    if operador == 'array_contains':
+        return isinstance(valor, list) and esperado in valor
+    if _rango_valor(valor)[0] != _rango_valor(esperado)[0]:
+        return False
+    if operador == '<':
+        return valor < esperado
+    if operador == '<=':
+        return valor <= esperado
+    if operador == '>':
+        return valor > esperado
+    if operador == '>=':
+        return valor >= esperado
+    raise ValueError(f'Operador no soportado: {operador}')
+
+
+class DocumentoFalso:
+    """Equivalente a DocumentSnapshot"""
+
+    def __init__(self, referencia, datos):
+        self.reference = referencia
+        self.id = referencia.id
+        self._datos = datos
+        self.exists = datos is not None
+        self.read_time = datetime.now(timezone.utc)
+
+    def to_dict(self):
+        return copy.deepcopy(self._datos) if self.exists else None
+
+    def get(self, ruta):
+        existe, valor = leer_campo(self._datos or {}, partes_campo(ruta))
+        if not existe:
+            raise KeyError(ruta)
+        return copy.deepcopy(valor)
+
+
+class ReferenciaFalsa:
+    """Equivalente a DocumentReference"""
+
+    def __init__(self, db, coleccion, doc_id):
+        self._db = db
+        self._coleccion = coleccion
+        self.id = doc_id
+        self.path = f'{coleccion}/{doc_id}'
+
+    def __eq__(self, otra):
+        return isinstance(otra, ReferenciaFalsa) and otra.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def _leer(self):
+        return self._db._documentos(self._coleccion).get(self.id)
+
+    def get(self, field_paths=None, transaction=None):
+        self._db._rpc('get', lecturas=1)
+        with self._db._lock:
+            datos = self._leer()
+            if datos is not None and field_paths is not None:
+                datos = _proyectar(datos, field_paths)
+            return DocumentoFalso(self, copy.deepcopy(datos))
+
+    def set(self, datos, merge=False):
+        lote = self._db.batch()
+        lote.set(self, datos, merge=merge)
+        lote.commit()
+
+    def update(self, cambios):
+        lote = self._db.batch()
+        lote.update(self, cambios)
+        lote.commit()
+
+    def delete(self):
+        lote = self._db.batch()
+        lote.delete(self)
+        lote.commit()
+
+
+class ConsultaFalsa:
+    """Equivalente a Query: filtros, proyección, orden, cursor y límite"""
+
+    def __init__(self, db, coleccion, filtros=(), campos=None, orden=(), limite=None, cursor=None):
+        self._db = db
+        self._coleccion = coleccion
+        self._filtros = filtros
+        self._campos = campos
+        self._orden = orden
+        self._limite = limite
+        self._cursor = cursor
+
+    def _copiar(self, **cambios):
+        estado = {
+            'filtros': self._filtros,
+            'campos': self._campos,
+            'orden': self._orden,
+            'limite': self._limite,
+            'cursor': self._cursor
+        }
+        estado.update(cambios)
+        return ConsultaFalsa(self._db, self._coleccion, **estado)
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copiar(filtros=self._filtros + ((field_path, op_string, value),))
+
+    def select(self, field_paths):
+        return self._copiar(campos=list(field_paths))
+
+    def order_by(self, field_path, direction='ASCENDING'):
+        return self._copiar(orden=self._orden + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copiar(limite=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copiar(cursor=document_fields_or_snapshot)
+
+    def _valor(self, doc_id, datos, ruta):
+        if ruta == '__name__':
+            return True, doc_id
+        return leer_campo(datos, partes_campo(ruta))
+
+    def _clave(self, doc_id, datos):
+        return [self._valor(doc_id, datos, ruta)[1] for ruta, _ in self._orden] + [doc_id]
+
+    def _comparar(self, clave_a, clave_b):
+        direcciones = [direccion for _, direccion in self._orden] + ['ASCENDING']
+        for a, b, direccion in zip(clave_a, clave_b, direcciones):
+            a, b = _rango_valor(a), _rango_valor(b)
+            if a != b:
+                resultado = -1 if a < b else 1
+                return -resultado if direccion == 'DESCENDING' else resultado
+        return 0
+
+    def _clave_cursor(self):
+        cursor = self._cursor
+        if isinstance(cursor, DocumentoFalso):
+            return self._clave(cursor.id, cursor._datos or {})
+        if isinstance(cursor, dict):
+            return [cursor.get(ruta) for ruta, _ in self._orden] + [cursor.get('__name__', '')]
+        return list(cursor) + [''] * (len(self._orden) + 1 - len(cursor))
+
+    def stream(self, transaction=None):
+        with self._db._lock:
+            filas = []
+            for doc_id, datos in self._db._documentos(self._coleccion).items():
+                valido = True
+                for ruta, operador, esperado in self._filtros:
+                    existe, valor = self._valor(doc_id, datos, ruta)
+                    if not existe or not _cumple(valor, operador, esperado):
+                        valido = False
+                        break
+                # order_by excluye los documentos sin el campo
+                if valido and all(self._valor(doc_id, datos, ruta)[0] for ruta, _ in self._orden):
+                    filas.append((self._clave(doc_id, datos), doc_id, datos))
+
+            filas.sort(key=functools.cmp_to_key(lambda a, b: self._comparar(a[0], b[0])))
+            if self._cursor is not None:
+                clave_cursor = self._clave_cursor()
+                filas = [fila for fila in filas if self._comparar(fila[0], clave_cursor) > 0]
+            if self._limite is not None:
+                filas = filas[:self._limite]
+
+            documentos = []
+            for _, doc_id, datos in filas:
+                if self._campos is not None:
+                    datos = _proyectar(datos, self._campos)
+                referencia = ReferenciaFalsa(self._db, self._coleccion, doc_id)
+                documentos.append(DocumentoFalso(referencia, copy.deepcopy(datos)))
+
+        self._db._rpc('query', lecturas=len(documentos))
+        return iter(documentos)
+
+    def get(self, transaction=None):
+        return list(self.stream(transaction=transaction))
+
+    def on_snapshot(self, callback):
+        raise NotImplementedError('El Firestore falso no admite listeners')
+
+
+class ColeccionFalsa(ConsultaFalsa):
+    """Equivalente a CollectionReference"""
+
+    def __init__(self, db, nombre):
+        super().__init__(db, nombre)
+        self.id = nombre
+
+    def document(self, document_id=None):
+        return ReferenciaFalsa(self._db, self._coleccion, document_id or self._db._nuevo_id())
+
+    def add(self, datos, document_id=None):
+        referencia = self.document(document_id)
+        referencia.set(datos)
+        return datetime.now(timezone.utc), referencia
+
+
+class LoteFalso:
+    """Equivalente a WriteBatch: las escrituras se aplican juntas al confirmar"""
+
+    def __init__(self, db):
+        self._db = db
+        self._escrituras = []
+
+    def set(self, referencia, datos, merge=False):
+        self._escrituras.append(('set', referencia, datos, merge))
+
+    def update(self, referencia, cambios):
+        self._escrituras.append(('update', referencia, cambios, False))
+
+    def delete(self, referencia):
+        self._escrituras.append(('delete', referencia, None, False))
+
+    def commit(self):
+        if not self._escrituras:
+            return []
+        self._db._rpc('commit', escrituras=len(self._escrituras))
+        with self._db._lock:
+            # Validar antes de aplicar: un lote falla entero
+            for tipo, referencia, _, _ in self._escrituras:
+                if tipo == 'update' and referencia._leer() is None:
+                    raise NotFound(f'No document to update: {referencia.path}')
+
+            for tipo, referencia, datos, merge in self._escrituras:
+                documentos = self._db._documentos(referencia._coleccion)
+                if tipo == 'delete':
+                    documentos.pop(referencia.id, None)
+                elif tipo == 'update':
+                    _actualizar(documentos[referencia.id], datos)
+                elif merge:
+                    _fusionar(documentos.setdefault(referencia.id, {}), datos)
+                else:
+                    documentos[referencia.id] = _resolver(datos)
+        escrituras = self._escrituras
+        self._escrituras = []
+        return escrituras
+
+
+class TransaccionFalsa(LoteFalso):
+    """Transacción: lecturas directas y escrituras aplicadas al confirmar"""
+
+
+def transactional(funcion):
+    """Sustituto de firestore.transactional para el Firestore falso"""
+    @functools.wraps(funcion)
+    def envoltura(transaccion, *args, **kwargs):
+        resultado = funcion(transaccion, *args, **kwargs)
+        transaccion.commit()
+        return resultado
+    return envoltura
+
+
+class FirestoreFalso:
+    """Cliente de Firestore en memoria con contadores de operaciones"""
+
+    def __init__(self, latencia=0.0, semilla=0):
+        self.latencia = latencia
+        self.operaciones = Counter()
+        self._colecciones = {}
+        self._lock = threading.RLock()
+        self._contador_lock = threading.Lock()
+        self._ids = random.Random(semilla)
+
+    def _nuevo_id(self):
+        with self._contador_lock:
+            return ''.join(self._ids.choices('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789', k=20))
+
+    def _documentos(self, coleccion):
+        return self._colecciones.setdefault(coleccion, {})
+
+    def _rpc(self, tipo, lecturas=0, escrituras=0):
+        if self.latencia:
+            time.sleep(self.latencia)
+        with self._contador_lock:
+            self.operaciones['rpc'] += 1
+            self.operaciones[tipo] += 1
+            self.operaciones['lecturas'] += lecturas
+            self.operaciones['escrituras'] += escrituras
+
+    def reiniciar_contadores(self):
+        with self._contador_lock:
+            self.operaciones.clear()
+
+    def contadores(self):
+        with self._contador_lock:
+            return dict(self.operaciones)
+
+    def collection(self, nombre):
+        return ColeccionFalsa(self, nombre)
+
+    def batch(self):
+        return LoteFalso(self)
+
+    def transaction(self, **kwargs):
+        return TransaccionFalsa(self)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        references = list(references)
+        self._rpc('get_all', lecturas=len(references))
+        with self._lock:
+            documentos = []
+            for referencia in references:
+                datos = referencia._leer()
+                if datos is not None and field_paths is not None:
+                    datos = _proyectar(datos, field_paths)
+                documentos.append(DocumentoFalso(referencia, copy.deepcopy(datos)))
+        return iter(documentos)
+
+
+def instalar(db):
+    """Hacer que firebase_admin devuelva el Firestore falso
+
+    Llamar antes de importar app: evita buscar credenciales y sustituye
+    firestore.client() y firestore.transactional.
+    """
+    import firebase_admin
+    from firebase_admin import firestore
+
+    firebase_admin._apps.setdefault('[DEFAULT]', object())
+    firestore.client = lambda app=None: db
+    firestore.transactional = transactional
+    return db
@@ -0,0 +1,265 @@
+"""Benchmarks de los endpoints de informes y exportación contra un Firestore falso
+
+Uso:
+    python -m benchmarks.run [--por-grupo 40] [--anios 3] [--iteraciones 30]
+                             [--layout array|map] [--latencia-ms 0] [--almacenamiento firestore|sqlite]
+                             [--salida benchmarks/baselines/actual.json]
+                             [--comparar benchmarks/baselines/base.json] [--tolerancia 0.25]
+
+Siembra una congregación sintética (siempre la misma para una semilla), recorre los
+endpoints con el cliente de pruebas de Flask y guarda en JSON, por escenario, los
+percentiles de latencia, el pico de memoria (tracemalloc) y las operaciones de
+Firestore por petición. Con --comparar sale con código 1 si hay regresiones.
+Con --almacenamiento sqlite los datos sembrados se copian a un SQLite temporal.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.estadistica import percentil
+from benchmarks.fake_firestore import FirestoreFalso, instalar
+
+ESTADOS_PESOS = {
+    'Publicador': 70,
+    'Precursor Auxiliar': 8,
+    'Precursor Auxiliar Indefinido': 4,
+    'Precursor Regular': 18
+}
+
+NOMBRES = ['José', 'María', 'Ana', 'Luis', 'Carmen', 'Jorge', 'Lucía', 'Andrés', 'Sofía', 'Raúl']
+APELLIDOS = ['Pérez', 'Gómez', 'Rodríguez', 'Fernández', 'López', 'Martínez', 'Núñez', 'Álvarez']
+
+
+def registro_sintetico(rng, state, mes, year):
+    """Registro de un mes con valores plausibles para el estado"""
+    participo = rng.random() < 0.9
+    horas = 0
+    if state == 'Precursor Regular':
+        horas = rng.randint(30, 70)
+    elif state != 'Publicador' and participo:
+        horas = rng.randint(10, 40)
+    return {
+        'month': mes,
+        'year': year,
+        'hours': horas,
+        'estudios': rng.randint(0, 3) if participo else 0,
+        'Participo': participo,
+        'Comentario': rng.choice(['', '', '', 'Enfermo dos semanas', 'Viaje'])
+    }
+
+
+def sembrar(db, grupos, por_grupo, anios, mes, year, layout, semilla):
+    """Crear por_grupo publishers en cada grupo con anios de historial hasta (mes, year)"""
+    from app import clave_mes, meses_en_rango
+
+    rng = random.Random(semilla)
+    desde = (1, year - anios + 1) if mes == 12 else (mes + 1, year - anios)
+    meses = meses_en_rango(desde, (mes, year))
+    ids = {grupo_id: [] for grupo_id in grupos}
+    lote = db.batch()
+
+    for grupo_id in grupos:
+        for i in range(por_grupo):
+            state = rng.choices(list(ESTADOS_PESOS), weights=ESTADOS_PESOS.values())[0]
+            registros = [registro_sintetico(rng, state, m, y) for m, y in meses]
+            persona = {
+                'name': f'{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)} {grupo_id}-{i + 1}',
+                'groupID': grupo_id,
+                'state': state
+            }
+            if layout == 'map':
+                persona['months'] = {clave_mes(r['month'], r['year']): r for r in registros}
+            else:
+                persona['hours'] = registros
+            referencia = db.collection('Publishers').document(f'pub-{grupo_id}-{i + 1:04d}')
+            lote.set(referencia, persona)
+            ids[grupo_id].append(referencia.id)
+
+    lote.commit()
+    db.reiniciar_contadores()
+    return ids
+
+
+def escenarios(aplicacion, ids, mes, year):
+    """(nombre, preparar, petición) de cada escenario medido"""
+    def vaciar_caches():
+        aplicacion.reporte_cache.invalidar()
+        aplicacion.pdf_cache.invalidar()
+
+    contador = {'n': 0}
+
+    def actualizar(cliente):
+        contador['n'] += 1
+        persona_id = ids[1][contador['n'] % len(ids[1])]
+        return cliente.put(f'/api/persona/{persona_id}', json={
+            'hours': {
+                'month': mes,
+                'year': year,
+                'hours': contador['n'] % 50,
+                'estudios': contador['n'] % 4,
+                'Participo': True,
+                'Comentario': ''
+            }
+        })
+
+    return [
+        ('get_reporte_data', vaciar_caches, lambda c: c.get(f'/api/reporte/1/{mes}/{year}')),
+        ('get_reporte_data_cache', None, lambda c: c.get(f'/api/reporte/1/{mes}/{year}')),
+        ('export_pdf', vaciar_caches, lambda c: c.get(f'/api/export/pdf/1/{mes}/{year}')),
+        ('export_excel', vaciar_caches, lambda c: c.get(f'/api/export/excel/1/{mes}/{year}')),
+        ('update_persona', None, actualizar),
+        ('get_all_publishers', None, lambda c: c.get('/api/publishers/all')),
+    ]
+
+
+def medir(cliente, db, preparar, peticion, iteraciones):
+    """Latencias, operaciones de Firestore y pico de memoria de un escenario"""
+    def ejecutar():
+        if preparar is not None:
+            preparar()
+        respuesta = peticion(cliente)
+        respuesta.get_data()
+        respuesta.close()
+        return respuesta.status_code
+
+    # Calentamiento (imports perezosos, caches de estilos)
+    ejecutar()
+
+    latencias = []
+    errores = 0
+    db.reiniciar_contadores()
+    for _ in range(iteraciones):
+        inicio = time.perf_counter()
+        estado = ejecutar()
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        if estado >= 400:
+            errores += 1
+    operaciones = db.contadores()
+
+    # Una pasada aparte con tracemalloc para no alterar las latencias
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        ejecutar()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'iteraciones': iteraciones,
+        'errores': errores,
+        'media_ms': round(sum(latencias) / len(latencias), 3),
+        'p50_ms': round(percentil(latencias, 50), 3),
+        'p95_ms': round(percentil(latencias, 95), 3),
+        'p99_ms': round(percentil(latencias, 99), 3),
+        'memoria_pico_kb': round((pico - base) / 1024, 1),
+        'rpc_por_peticion': round(operaciones.get('rpc', 0) / iteraciones, 2),
+        'lecturas_por_peticion': round(operaciones.get('lecturas', 0) / iteraciones, 2),
+        'escrituras_por_peticion': round(operaciones.get('escrituras', 0) / iteraciones, 2)
+    }
+
+
+def comparar(actual, base, tolerancia):
+    """Lista de regresiones de actual frente a base
+
+    Las operaciones de Firestore son deterministas y no admiten tolerancia; la
+    mediana de latencia y la memoria sí, porque dependen de la máquina.
+    """
+    regresiones = []
+    for nombre, medidas in actual['escenarios'].items():
+        anteriores = base.get('escenarios', {}).get(nombre)
+        if anteriores is None:
+            continue
+        for metrica in ('rpc_por_peticion', 'lecturas_por_peticion', 'escrituras_por_peticion'):
+            if medidas[metrica] > anteriores[metrica]:
+                regresiones.append(f'{nombre}.{metrica}: {anteriores[metrica]} -> {medidas[metrica]}')
+        for metrica in ('p50_ms', 'memoria_pico_kb'):
+            if anteriores[metrica] and medidas[metrica] > anteriores[metrica] * (1 + tolerancia):
+                regresiones.append(f'{nombre}.{metrica}: {anteriores[metrica]} -> {medidas[metrica]}')
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--por-grupo', type=int, default=40, help='Publishers por grupo')
+    parser.add_argument('--anios', type=int, default=3, help='Años de historial por publisher')
+    parser.add_argument('--iteraciones', type=int, default=30, help='Peticiones medidas por escenario')
+    parser.add_argument('--layout', choices=['array', 'map'], default='array', help='HOURS_LAYOUT sembrado')
+    parser.add_argument('--latencia-ms', type=float, default=0, help='Latencia simulada por llamada a Firestore')
+    parser.add_argument('--almacenamiento', choices=['firestore', 'sqlite'], default='firestore', help='STORAGE_BACKEND medido')
+    parser.add_argument('--mes', type=int, default=12)
+    parser.add_argument('--year', type=int, default=2024)
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--solo', nargs='*', help='Escenarios a ejecutar (por defecto todos)')
+    parser.add_argument('--salida', help='Guardar el resultado en este JSON')
+    parser.add_argument('--comparar', help='JSON de referencia para detectar regresiones')
+    parser.add_argument('--tolerancia', type=float, default=0.25, help='Margen de latencia y memoria (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    # Configuración fija antes de importar app (load_dotenv no sobrescribe)
+    os.environ['HOURS_LAYOUT'] = args.layout
+    os.environ['PUBLISHERS_SNAPSHOT'] = 'false'
+    os.environ['SLOW_REQUEST_MS'] = '0'
+    os.environ['STORAGE_BACKEND'] = args.almacenamiento
+    if args.almacenamiento == 'sqlite':
+        os.environ['SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+
+    db = instalar(FirestoreFalso(latencia=args.latencia_ms / 1000, semilla=args.semilla))
+    import app as aplicacion
+
+    grupos = aplicacion.GRUPOS
+    ids = sembrar(db, grupos, args.por_grupo, args.anios, args.mes, args.year, args.layout, args.semilla)
+    if args.almacenamiento == 'sqlite':
+        aplicacion.repositorio().importar(aplicacion.RepositorioFirestore().exportar())
+        db.reiniciar_contadores()
+    cliente = aplicacion.app.test_client()
+
+    resultado = {
+        'config': {
+            'por_grupo': args.por_grupo,
+            'grupos': len(grupos),
+            'anios': args.anios,
+            'layout': args.layout,
+            'almacenamiento': args.almacenamiento,
+            'latencia_ms': args.latencia_ms,
+            'iteraciones': args.iteraciones,
+            'semilla': args.semilla
+        },
+        'entorno': {'python': platform.python_version(), 'maquina': platform.machine()},
+        'escenarios': {}
+    }
+    for nombre, preparar, peticion in escenarios(aplicacion, ids, args.mes, args.year):
+        if args.solo and nombre not in args.solo:
+            continue
+        resultado['escenarios'][nombre] = medir(cliente, db, preparar, peticion, args.iteraciones)
+        print(f'✓ {nombre}', file=sys.stderr)
+
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
+    if args.salida:
+        os.makedirs(os.path.dirname(args.salida) or '.', exist_ok=True)
+        with open(args.salida, 'w') as archivo:
+            json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+            archivo.write('\n')
+
+    if args.comparar:
+        with open(args.comparar) as archivo:
+            base = json.load(archivo)
+        if base.get('config') != resultado['config']:
+            print('⚠ La configuración no coincide con la de referencia', file=sys.stderr)
+        regresiones = comparar(resultado, base, args.tolerancia)
+        for regresion in regresiones:
+            print(f'✗ {regresion}', file=sys.stderr)
+        if regresiones:
+            sys.exit(1)
+        print('✓ Sin regresiones frente a la referencia', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
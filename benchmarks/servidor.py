@@ -0,0 +1,38 @@
+"""La aplicación sobre el Firestore falso sembrado, para loadtest.py sin proyecto de Firebase
+
+Uso:
+    BENCH_LATENCIA_MS=5 gunicorn -c gunicorn.conf.py benchmarks.servidor:app
+    python loadtest.py --url http://127.0.0.1:8080 --mes 12 --year 2024
+
+Siembra la misma congregación que python -m benchmarks.run (BENCH_POR_GRUPO,
+BENCH_ANIOS, BENCH_LAYOUT y BENCH_SEMILLA, hasta diciembre de 2024) y reconstruye
+Rollups/Reports. BENCH_LATENCIA_MS simula el viaje de red de cada llamada.
+"""
+import os
+
+from benchmarks.fake_firestore import FirestoreFalso, instalar
+from benchmarks.run import sembrar
+
+MES, YEAR = 12, 2024
+POR_GRUPO = int(os.getenv('BENCH_POR_GRUPO', '40'))
+ANIOS = int(os.getenv('BENCH_ANIOS', '3'))
+LAYOUT = os.getenv('BENCH_LAYOUT', 'array')
+SEMILLA = int(os.getenv('BENCH_SEMILLA', '42'))
+LATENCIA_MS = float(os.getenv('BENCH_LATENCIA_MS', '0'))
+
+# Configuración fija antes de importar app (load_dotenv no sobrescribe)
+os.environ['HOURS_LAYOUT'] = LAYOUT
+os.environ['PUBLISHERS_SNAPSHOT'] = 'false'
+os.environ['STORAGE_BACKEND'] = 'firestore'
+
+db = instalar(FirestoreFalso(semilla=SEMILLA))
+
+import app as aplicacion  # noqa: E402
+from rebuild_rollups import reconstruir  # noqa: E402
+
+sembrar(db, aplicacion.GRUPOS, POR_GRUPO, ANIOS, MES, YEAR, LAYOUT, SEMILLA)
+reconstruir(aplicacion.meses_en_rango((1, YEAR - ANIOS + 1), (MES, YEAR)))
+# La latencia simulada solo para las peticiones, no para la siembra
+db.latencia = LATENCIA_MS / 1000
+
+app = aplicacion.app
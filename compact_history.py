@@ -0,0 +1,27 @@
+"""Compactar el historial de Publishers en archivos Arrow IPC para consultas de varios años
+
+Uso:
+    python compact_history.py [--directorio /data/historial]
+
+Pensado para ejecutarse cada noche (cron o una máquina programada de Fly.io). Lee
+Publishers una sola vez y escribe un archivo por año en HISTORIAL_DIR, que
+después consulta GET /api/historial sin tocar Firestore. Requiere pyarrow.
+"""
+import argparse
+import sys
+
+from app import HISTORIAL_DIR, compactar_historial, modulo_pyarrow
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--directorio', default=HISTORIAL_DIR, help='Destino de los archivos (por defecto HISTORIAL_DIR)')
+    args = parser.parse_args()
+
+    if modulo_pyarrow() is None:
+        sys.exit('✗ pyarrow no está instalado: pip install pyarrow')
+
+    manifiesto = compactar_historial(args.directorio)
+    for year, filas in manifiesto['anios'].items():
+        print(f"- {year}: {filas} registros")
+    print(f"✓ Historial compactado en {args.directorio}")
@@ -0,0 +1,34 @@
+"""Configuración de Gunicorn
+
+Por defecto usa un proceso con varios hilos (gthread): la aplicación pasa casi todo
+el tiempo esperando a Firestore, y con un solo proceso las caches en memoria y la
+réplica de Publishers son coherentes. Con GUNICORN_WORKER_CLASS=gevent cada worker
+atiende muchas peticiones concurrentes con greenlets.
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+
+# gthread: hilos por worker
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+
+# gevent: conexiones simultáneas por worker
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '200'))
+
+# Las exportaciones grandes pueden tardar varios segundos
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    """Preparar gRPC (cliente de Firestore) para funcionar con gevent"""
+    if worker_class == 'gevent':
+        import grpc.experimental.gevent as grpc_gevent
+        grpc_gevent.init_gevent()
@@ -0,0 +1,40 @@
+"""Importar publishers y sus registros mensuales desde un CSV o XLSX
+
+Uso:
+    python import_publishers.py publishers.csv [--dry-run]
+    python import_publishers.py historial.xlsx [--dry-run]
+
+Columnas (en cualquier orden, con o sin acentos): name, groupID, state, year, month,
+hours, estudios, Participo, Comentario. Cada fila se asocia por nombre a un publisher
+existente o crea uno nuevo; las filas con year y month guardan el registro de ese mes.
+Los XLSX requieren openpyxl.
+"""
+import argparse
+import os
+import sys
+
+from app import filas_archivo, importar_filas, modulo_openpyxl
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('archivo', help='Archivo .csv o .xlsx')
+    parser.add_argument('--dry-run', action='store_true', help='Validar y contar sin escribir')
+    args = parser.parse_args()
+
+    formato = os.path.splitext(args.archivo)[1].lstrip('.').lower()
+    if formato not in ('csv', 'xlsx'):
+        parser.error('El archivo debe ser .csv o .xlsx')
+    if formato == 'xlsx' and modulo_openpyxl() is None:
+        sys.exit('✗ openpyxl no está instalado: pip install openpyxl')
+
+    with open(args.archivo, 'rb') as archivo:
+        informe = importar_filas(filas_archivo(archivo, formato), dry_run=args.dry_run)
+
+    for error in informe['errores']:
+        print(f"✗ Fila {error['fila']} ({error['name']}): {error['error']}")
+    accion = 'se crearían' if args.dry_run else 'creados'
+    print(f"- {informe['filas']} filas: {informe['creados']} publishers {accion}, {informe['registros']} registros mensuales")
+    if informe['errores']:
+        sys.exit(1)
+    print('✓ Importación completa' if not args.dry_run else '✓ Archivo válido')
@@ -0,0 +1,91 @@
+"""Prueba de carga local de los endpoints de informes y exportación
+
+Uso:
+    gunicorn -c gunicorn.conf.py app:app
+    gunicorn -c gunicorn.conf.py benchmarks.servidor:app   # sin Firebase: Firestore falso sembrado
+    python loadtest.py --url http://127.0.0.1:8080 --concurrencia 16 --duracion 30
+
+Lanza clientes concurrentes que piden en bucle el informe, el PDF y el Excel de un
+grupo/mes y muestra el throughput y los percentiles de latencia por endpoint.
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.estadistica import percentil
+
+
+def cliente(base, rutas, fin, resultados, lock, numero):
+    """Pedir las rutas en bucle hasta el instante fin"""
+    i = numero
+    while time.monotonic() < fin:
+        nombre, ruta = rutas[i % len(rutas)]
+        i += 1
+        inicio = time.perf_counter()
+        try:
+            with urllib.request.urlopen(base + ruta, timeout=120) as respuesta:
+                respuesta.read()
+                ok = respuesta.status < 400
+        except (urllib.error.URLError, TimeoutError):
+            ok = False
+        duracion = (time.perf_counter() - inicio) * 1000
+        with lock:
+            resultados[nombre]['latencias'].append(duracion)
+            if not ok:
+                resultados[nombre]['errores'] += 1
+
+
+def ejecutar(base, concurrencia, duracion, grupo, mes, year):
+    rutas = [
+        ('reporte', f'/api/reporte/{grupo}/{mes}/{year}'),
+        ('pdf', f'/api/export/pdf/{grupo}/{mes}/{year}'),
+        ('excel', f'/api/export/excel/{grupo}/{mes}/{year}'),
+        ('personas', f'/api/personas/{grupo}'),
+    ]
+    resultados = {nombre: {'latencias': [], 'errores': 0} for nombre, _ in rutas}
+    lock = threading.Lock()
+
+    fin = time.monotonic() + duracion
+    inicio = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        for numero in range(concurrencia):
+            pool.submit(cliente, base, rutas, fin, resultados, lock, numero)
+    total_segundos = time.monotonic() - inicio
+
+    resumen = {'concurrencia': concurrencia, 'duracion_s': round(total_segundos, 2), 'endpoints': {}}
+    total_peticiones = 0
+    for nombre, datos in resultados.items():
+        latencias = datos['latencias']
+        total_peticiones += len(latencias)
+        resumen['endpoints'][nombre] = {
+            'peticiones': len(latencias),
+            'errores': datos['errores'],
+            'rps': round(len(latencias) / total_segundos, 2),
+            'media_ms': round(statistics.fmean(latencias), 1) if latencias else 0.0,
+            'p50_ms': round(percentil(latencias, 50), 1),
+            'p95_ms': round(percentil(latencias, 95), 1),
+            'p99_ms': round(percentil(latencias, 99), 1),
+        }
+    resumen['rps_total'] = round(total_peticiones / total_segundos, 2)
+    return resumen
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8080', help='URL base del servidor')
+    parser.add_argument('--concurrencia', type=int, default=16, help='Clientes simultáneos')
+    parser.add_argument('--duracion', type=float, default=30, help='Segundos de prueba')
+    parser.add_argument('--grupo', type=int, default=1)
+    parser.add_argument('--mes', type=int, default=time.localtime().tm_mon)
+    parser.add_argument('--year', type=int, default=time.localtime().tm_year)
+    args = parser.parse_args()
+
+    print(json.dumps(
+        ejecutar(args.url.rstrip('/'), args.concurrencia, args.duracion, args.grupo, args.mes, args.year),
+        indent=2
+    ))
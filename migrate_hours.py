@@ -0,0 +1,62 @@
+"""Migrar los registros mensuales de la lista hours al mapa months (YYYY-MM)
+
+Uso:
+    python migrate_hours.py [--dry-run] [--drop-hours]
+
+Después de migrar todos los documentos, iniciar la aplicación con HOURS_LAYOUT=map.
+"""
+import argparse
+
+from firebase_admin import firestore
+
+from app import BATCH_SIZE, get_db, hours_a_months, marca_tiempo
+
+
+def migrar(dry_run=False, drop_hours=False):
+    """Agregar el mapa months a cada Publisher a partir de su lista hours"""
+    db = get_db()
+    batch = db.batch()
+    pendientes = 0
+    migrados = 0
+    omitidos = 0
+
+    for doc in db.collection('Publishers').stream():
+        persona_data = doc.to_dict()
+        hours_array = persona_data.get('hours')
+        if hours_array is None:
+            omitidos += 1
+            continue
+
+        # Conservar los meses que ya estuvieran en el mapa
+        months = hours_a_months(hours_array)
+        months.update(persona_data.get('months', {}))
+
+        # updatedAt hace que los navegadores con copia offline vuelvan a descargarlo
+        cambios = {'months': months, 'updatedAt': marca_tiempo()}
+        if drop_hours:
+            cambios['hours'] = firestore.DELETE_FIELD
+
+        migrados += 1
+        if dry_run:
+            print(f"- {doc.id} ({persona_data.get('name', 'Sin nombre')}): {len(months)} meses")
+            continue
+
+        batch.update(doc.reference, cambios)
+        pendientes += 1
+        if pendientes == BATCH_SIZE:
+            batch.commit()
+            batch = db.batch()
+            pendientes = 0
+
+    if pendientes:
+        batch.commit()
+
+    print(f"✓ {migrados} publishers migrados, {omitidos} sin lista hours")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dry-run', action='store_true', help='Mostrar los cambios sin escribir')
+    parser.add_argument('--drop-hours', action='store_true', help='Eliminar la lista hours tras migrar')
+    args = parser.parse_args()
+    migrar(dry_run=args.dry_run, drop_hours=args.drop_hours)
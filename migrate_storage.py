@@ -0,0 +1,42 @@
+"""Copiar los publishers y sus registros mensuales entre Firestore y SQLite
+
+Uso:
+    python migrate_storage.py --desde firestore --hacia sqlite [--sqlite reports.db] [--dry-run]
+    python migrate_storage.py --desde sqlite --hacia firestore [--sqlite reports.db] [--dry-run]
+
+Conserva los ids. Al copiar hacia Firestore, los rollups y totales mensuales se
+rehacen después con rebuild_rollups.py.
+"""
+import argparse
+
+from app import crear_repositorio, registros_persona
+
+
+def migrar(desde, hacia, ruta_sqlite=None, dry_run=False):
+    """Leer todas las personas de un almacenamiento y escribirlas en el otro"""
+    origen = crear_repositorio(desde, ruta_sqlite)
+    personas = list(origen.exportar())
+    registros = sum(len(registros_persona(persona_data)) for persona_data in personas)
+    print(f"- {len(personas)} publishers y {registros} registros mensuales en {desde}")
+
+    if dry_run:
+        return 0
+
+    destino = crear_repositorio(hacia, ruta_sqlite)
+    copiados = destino.importar(personas)
+    print(f"✓ {copiados} publishers copiados a {hacia}")
+    if hacia == 'firestore':
+        print("  Ejecuta rebuild_rollups.py para rehacer Rollups y Reports de los meses necesarios")
+    return copiados
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--desde', choices=['firestore', 'sqlite'], required=True)
+    parser.add_argument('--hacia', choices=['firestore', 'sqlite'], required=True)
+    parser.add_argument('--sqlite', help='Archivo SQLite (por defecto SQLITE_PATH)')
+    parser.add_argument('--dry-run', action='store_true', help='Contar lo que se copiaría sin escribir')
+    args = parser.parse_args()
+    if args.desde == args.hacia:
+        parser.error('--desde y --hacia deben ser distintos')
+    migrar(args.desde, args.hacia, ruta_sqlite=args.sqlite, dry_run=args.dry_run)
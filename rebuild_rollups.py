@@ -0,0 +1,66 @@
+"""Reconstruir los rollups (Rollups/) y totales (Reports/) mensuales desde Publishers
+
+Uso:
+    python rebuild_rollups.py --desde 2024-09 --hasta 2025-08 [--dry-run]
+
+Ambos documentos se mantienen solos en cada escritura de horas; este script sirve
+para llenarlos con el historial existente o para corregirlos.
+"""
+import argparse
+
+from app import (
+    BATCH_SIZE, GRUPOS, agregar_reporte, datos_rollup, datos_totales_reporte, get_db,
+    fila_rollup, meses_en_rango, parsear_clave_mes, registro_mes, rollup_ref, totales_ref
+)
+
+
+def reconstruir(meses, dry_run=False):
+    """Leer Publishers una sola vez y reescribir rollups y totales de los meses indicados"""
+    db = get_db()
+    filas = {(grupo_id, mes, year): {} for grupo_id in GRUPOS for mes, year in meses}
+    personas_por_grupo = {grupo_id: [] for grupo_id in GRUPOS}
+
+    for doc in db.collection('Publishers').stream():
+        persona_data = doc.to_dict()
+        grupo_id = persona_data.get('groupID')
+        if grupo_id in personas_por_grupo:
+            personas_por_grupo[grupo_id].append(persona_data)
+        state = persona_data.get('state', 'Publicador')
+        for mes, year in meses:
+            registro = registro_mes(persona_data, mes, year)
+            if registro is not None and (grupo_id, mes, year) in filas:
+                filas[(grupo_id, mes, year)][doc.id] = fila_rollup(persona_data, state, registro)
+
+    batch = db.batch()
+    pendientes = 0
+    for (grupo_id, mes, year), personas in filas.items():
+        datos = agregar_reporte(personas_por_grupo[grupo_id], grupo_id, mes, year)
+        if dry_run:
+            print(f"- Grupo {grupo_id} {year}-{mes:02d}: {len(personas)} personas, "
+                  f"{datos['total_general']} horas, {datos['total_estudios_general']} estudios")
+            continue
+
+        batch.set(rollup_ref(grupo_id, mes, year), datos_rollup(grupo_id, mes, year, personas))
+        batch.set(totales_ref(grupo_id, mes, year), datos_totales_reporte(datos))
+        pendientes += 2
+        if pendientes >= BATCH_SIZE - 1:
+            batch.commit()
+            batch = db.batch()
+            pendientes = 0
+
+    if pendientes:
+        batch.commit()
+
+    print(f"✓ {len(filas)} rollups y totales reconstruidos")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--desde', required=True, help='Primer mes (YYYY-MM)')
+    parser.add_argument('--hasta', required=True, help='Último mes (YYYY-MM)')
+    parser.add_argument('--dry-run', action='store_true', help='Mostrar los rollups sin escribir')
+    args = parser.parse_args()
+    reconstruir(
+        meses_en_rango(parsear_clave_mes(args.desde), parsear_clave_mes(args.hasta)),
+        dry_run=args.dry_run
+    )
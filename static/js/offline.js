@@ -0,0 +1,219 @@
+// Almacén offline: copia de Publishers en IndexedDB y cola de cambios sin conexión
+//
+// La copia se mantiene al día con /api/sync?since=<versión>, que devuelve solo lo
+// cambiado desde la última sincronización. Los cambios hechos sin conexión se
+// guardan en la cola y se envían juntos con POST /api/sync al recuperarla.
+
+const OFFLINE_DB_NOMBRE = 'informes-offline';
+const OFFLINE_DB_VERSION = 1;
+
+let offlineDbPromesa = null;
+let sincronizando = null;
+
+// IndexedDB puede no existir (navegadores antiguos, algunos modos privados)
+function offlineDisponible() {
+    return typeof indexedDB !== 'undefined';
+}
+
+function abrirOfflineDb() {
+    if (!offlineDbPromesa) {
+        offlineDbPromesa = new Promise((resolve, reject) => {
+            const peticion = indexedDB.open(OFFLINE_DB_NOMBRE, OFFLINE_DB_VERSION);
+            peticion.onupgradeneeded = () => {
+                const db = peticion.result;
+                const publishers = db.createObjectStore('publishers', { keyPath: 'id' });
+                publishers.createIndex('groupID', 'groupID');
+                db.createObjectStore('meta', { keyPath: 'clave' });
+                // Un cambio pendiente por persona y mes: volver a editar sustituye al anterior
+                db.createObjectStore('pendientes', { keyPath: 'clave' });
+            };
+            peticion.onsuccess = () => resolve(peticion.result);
+            peticion.onerror = () => reject(peticion.error);
+        });
+        offlineDbPromesa.catch(() => { offlineDbPromesa = null; });
+    }
+    return offlineDbPromesa;
+}
+
+// Ejecutar operaciones en una transacción y esperar a que se confirme
+async function transaccionOffline(stores, modo, operaciones) {
+    const db = await abrirOfflineDb();
+    return new Promise((resolve, reject) => {
+        const tx = db.transaction(stores, modo);
+        let resultado;
+        Promise.resolve(operaciones(tx)).then(valor => { resultado = valor; }, reject);
+        tx.oncomplete = () => resolve(resultado);
+        tx.onerror = () => reject(tx.error);
+        tx.onabort = () => reject(tx.error);
+    });
+}
+
+function resultadoPeticion(peticion) {
+    return new Promise((resolve, reject) => {
+        peticion.onsuccess = () => resolve(peticion.result);
+        peticion.onerror = () => reject(peticion.error);
+    });
+}
+
+// Aplicar state y el registro de un mes a una persona (layout hours o months)
+function aplicarRegistroPersona(persona, state, hoursData) {
+    persona.state = state;
+    if (persona.months) {
+        persona.months[claveMes(hoursData.month, hoursData.year)] = hoursData;
+        return persona;
+    }
+    if (!persona.hours) {
+        persona.hours = [];
+    }
+    const horasIndex = persona.hours.findIndex(h =>
+        h.month === hoursData.month && h.year === hoursData.year
+    );
+    if (horasIndex !== -1) {
+        persona.hours[horasIndex] = hoursData;
+    } else {
+        persona.hours.push(hoursData);
+    }
+    return persona;
+}
+
+// Personas de un grupo desde la copia local
+function personasGrupoOffline(grupoId) {
+    return transaccionOffline(['publishers'], 'readonly', tx =>
+        resultadoPeticion(tx.objectStore('publishers').index('groupID').getAll(grupoId))
+    );
+}
+
+// ¿Hay ya una copia local (al menos una sincronización completa)?
+function copiaOfflineLista() {
+    return transaccionOffline(['meta'], 'readonly', tx =>
+        resultadoPeticion(tx.objectStore('meta').get('version'))
+    ).then(meta => meta !== undefined);
+}
+
+// Actualizar la copia local de una persona tras guardarla (o encolarla)
+function guardarPersonaOffline(personaId, state, hoursData) {
+    return transaccionOffline(['publishers'], 'readwrite', async tx => {
+        const store = tx.objectStore('publishers');
+        const persona = await resultadoPeticion(store.get(personaId));
+        if (persona) {
+            store.put(aplicarRegistroPersona(persona, state, hoursData));
+        }
+    });
+}
+
+// Encolar un cambio hecho sin conexión (la copia local se actualiza con guardarPersonaOffline)
+function encolarCambio(personaId, grupoId, data) {
+    return transaccionOffline(['pendientes'], 'readwrite', tx => {
+        tx.objectStore('pendientes').put({
+            clave: `${personaId}|${claveMes(data.hours.month, data.hours.year)}`,
+            id: personaId,
+            grupo: grupoId,
+            state: data.state,
+            hours: data.hours
+        });
+    });
+}
+
+function contarPendientes() {
+    return transaccionOffline(['pendientes'], 'readonly', tx =>
+        resultadoPeticion(tx.objectStore('pendientes').count())
+    );
+}
+
+// Enviar la cola con POST /api/sync; devuelve { guardados, fallidos, pendientes }
+async function enviarPendientes() {
+    const pendientes = await transaccionOffline(['pendientes'], 'readonly', tx =>
+        resultadoPeticion(tx.objectStore('pendientes').getAll())
+    );
+    if (!pendientes.length) return { guardados: 0, fallidos: 0, pendientes: 0 };
+
+    const response = await fetch('/api/sync', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ cambios: pendientes.map(({ clave, ...cambio }) => cambio) })
+    });
+    const result = await response.json();
+    if (!result.resultados) {
+        throw new Error(result.error || 'Error al enviar los cambios pendientes');
+    }
+
+    // Quitar de la cola los guardados y los rechazados; los que fallaron por un
+    // error del servidor (reintentar) se quedan para el próximo envío
+    const resueltos = pendientes.filter((pendiente, i) => {
+        const resultado = result.resultados[i];
+        return resultado && (resultado.success || !resultado.reintentar);
+    });
+    await transaccionOffline(['pendientes'], 'readwrite', tx => {
+        const store = tx.objectStore('pendientes');
+        resueltos.forEach(pendiente => store.delete(pendiente.clave));
+    });
+
+    const guardados = result.resultados.filter(resultado => resultado.success).length;
+    const reintentables = result.resultados.filter(resultado => !resultado.success && resultado.reintentar).length;
+    return {
+        guardados: guardados,
+        fallidos: result.resultados.length - guardados - reintentables,
+        pendientes: reintentables
+    };
+}
+
+// Traer de /api/sync lo cambiado desde la última versión
+async function sincronizarPublishers() {
+    const meta = await transaccionOffline(['meta'], 'readonly', tx =>
+        resultadoPeticion(tx.objectStore('meta').get('version'))
+    );
+    const url = meta ? `/api/sync?since=${meta.valor}` : '/api/sync';
+    const response = await fetch(url);
+    const result = await response.json();
+    if (!response.ok) {
+        throw new Error(result.error || 'Error al sincronizar');
+    }
+
+    await transaccionOffline(['publishers', 'meta'], 'readwrite', tx => {
+        const store = tx.objectStore('publishers');
+        if (result.completo) {
+            store.clear();
+        }
+        result.publishers.forEach(persona => store.put(persona));
+        result.eliminados.forEach(id => store.delete(id));
+        tx.objectStore('meta').put({ clave: 'version', valor: result.version });
+    });
+    return result;
+}
+
+// Enviar la cola y después traer los cambios; una sola sincronización a la vez
+function sincronizarOffline() {
+    if (!sincronizando) {
+        sincronizando = (async () => {
+            const envio = await enviarPendientes();
+            await sincronizarPublishers();
+            return envio;
+        })().finally(() => { sincronizando = null; });
+    }
+    return sincronizando;
+}
+
+// Al recuperar la conexión, enviar lo guardado sin ella
+async function sincronizarAlConectar() {
+    if (!offlineDisponible() || !navigator.onLine) return;
+    try {
+        if (!(await contarPendientes())) return;
+        const envio = await sincronizarOffline();
+        if (envio.guardados) {
+            showToast(`${envio.guardados} cambios sin conexión guardados`, true);
+        }
+        if (envio.fallidos) {
+            showToast(`${envio.fallidos} cambios sin conexión no se pudieron guardar`, false);
+        }
+        if (envio.pendientes) {
+            showToast(`${envio.pendientes} cambios sin conexión se volverán a enviar más tarde`, false);
+        }
+    } catch (error) {
+        console.error('Error al enviar los cambios pendientes:', error);
+    }
+}
+
+window.addEventListener('online', sincronizarAlConectar);
+document.addEventListener('DOMContentLoaded', sincronizarAlConectar);
@@ -5,6 +5,15 @@ let yearSeleccionado = new Date().getFullYear();
 let personasData = [];
 let modoAdmin = false;
 
+// Paginación del listado de administración
+const ADMIN_PAGINA = 50;
+const ADMIN_CAMPOS = 'name,groupID,state';
+let adminSiguiente = null;
+let adminBusquedaTimer = null;
+
+// La lista de grupos no cambia: se pide una sola vez
+let gruposPromesa = null;
+
 // Inicializar la aplicación
 document.addEventListener('DOMContentLoaded', () => {
     // Establecer el mes actual por defecto
@@ -32,25 +41,40 @@ function volverMenu() {
     personasData = [];
 }
 
-// Cargar todos los publishers para administración
-async function cargarTodosPublishersAdmin() {
+// Cargar la primera página de publishers para administración (o la siguiente si continuar)
+async function cargarTodosPublishersAdmin(continuar = false) {
     try {
         showLoading(true);
-        const response = await fetch('/api/publishers/all');
-        let publishers = await response.json();
-        
-        // Ordenar por groupID
-        publishers.sort((a, b) => (a.groupID || 0) - (b.groupID || 0));
-        
-        personasData = publishers;
+        const busqueda = document.getElementById('admin-search-all').value.trim();
+        let pagina;
+        if (busqueda) {
+            // Índice de nombres del servidor: sin acentos ni mayúsculas y con nombres parecidos
+            const params = new URLSearchParams({ q: busqueda, limit: ADMIN_PAGINA });
+            const response = await fetch(`/api/publishers/search?${params}`);
+            pagina = { personas: await response.json(), siguiente: null };
+        } else {
+            const params = new URLSearchParams({ fields: ADMIN_CAMPOS, limit: ADMIN_PAGINA });
+            if (continuar && adminSiguiente) {
+                params.set('start_after', adminSiguiente);
+            }
+            const response = await fetch(`/api/publishers/all?${params}`);
+            pagina = await response.json();
+        }
         
         const personasContainer = document.getElementById('admin-all-personas-container');
-        personasContainer.innerHTML = '';
+        if (!continuar) {
+            personasData = [];
+            personasContainer.innerHTML = '';
+        }
         
-        publishers.forEach((persona, index) => {
+        pagina.personas.forEach((persona, index) => {
             const personaCard = crearAdminPersonaCardConEliminar(persona, index);
             personasContainer.appendChild(personaCard);
         });
+        personasData = personasData.concat(pagina.personas);
+        
+        adminSiguiente = pagina.siguiente;
+        document.getElementById('admin-cargar-mas').style.display = adminSiguiente ? 'inline-flex' : 'none';
         
         showLoading(false);
     } catch (error) {
@@ -60,12 +84,27 @@ async function cargarTodosPublishersAdmin() {
     }
 }
 
+function cargarMasPublishersAdmin() {
+    cargarTodosPublishersAdmin(true);
+}
+
+function obtenerGrupos() {
+    if (!gruposPromesa) {
+        gruposPromesa = fetch('/api/grupos')
+            .then(response => response.json())
+            .catch(error => {
+                gruposPromesa = null;
+                throw error;
+            });
+    }
+    return gruposPromesa;
+}
+
 // Cargar grupos para administración (mantener para compatibilidad)
 async function cargarGrupos() {
     try {
         showLoading(true);
-        const response = await fetch('/api/grupos');
-        const grupos = await response.json();
+        const grupos = await obtenerGrupos();
         
         const gruposGrid = document.getElementById('grupos-grid');
         gruposGrid.innerHTML = '';
@@ -95,8 +134,7 @@ async function cargarGrupos() {
 async function cargarGruposAdmin() {
     try {
         showLoading(true);
-        const response = await fetch('/api/grupos');
-        const grupos = await response.json();
+        const grupos = await obtenerGrupos();
         
         const gruposGrid = document.getElementById('admin-grupos-grid');
         gruposGrid.innerHTML = '';
@@ -133,7 +171,7 @@ function seleccionarGrupoAdmin(grupoId) {
 async function cargarPersonasAdmin(grupoId) {
     try {
         showLoading(true);
-        const response = await fetch(`/api/personas/${grupoId}`);
+        const response = await fetch(`/api/personas/${grupoId}?fields=${ADMIN_CAMPOS}`);
         personasData = await response.json();
         
         const personasContainer = document.getElementById('admin-personas-container');
@@ -353,8 +391,7 @@ async function cargarPersonas() {
     
     try {
         showLoading(true);
-        const response = await fetch(`/api/personas/${grupoSeleccionado}`);
-        personasData = await response.json();
+        personasData = await obtenerPersonasGrupo(grupoSeleccionado);
         
         const meses = ['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio', 
                       'Julio', 'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre'];
@@ -379,6 +416,46 @@ async function cargarPersonas() {
     }
 }
 
+// Personas del grupo desde la copia offline, sincronizada antes si hay conexión
+async function obtenerPersonasGrupo(grupoId) {
+    if (offlineDisponible()) {
+        try {
+            await sincronizarOffline();
+            return await personasGrupoOffline(grupoId);
+        } catch (error) {
+            // Sin conexión: servir la copia local si ya existe
+            console.warn('Sincronización no disponible:', error);
+            try {
+                if (await copiaOfflineLista()) {
+                    return await personasGrupoOffline(grupoId);
+                }
+            } catch (errorLocal) {
+                console.warn('Copia offline no disponible:', errorLocal);
+            }
+        }
+    }
+    const response = await fetch(`/api/personas/${grupoId}`);
+    return response.json();
+}
+
+// Clave YYYY-MM del mapa months
+function claveMes(month, year) {
+    return `${year}-${String(month).padStart(2, '0')}`;
+}
+
+// Buscar el registro del mes seleccionado (mapa months o lista hours)
+function obtenerRegistroMes(persona) {
+    if (persona.months) {
+        return persona.months[claveMes(mesSeleccionado, yearSeleccionado)];
+    }
+    if (persona.hours) {
+        return persona.hours.find(h => 
+            h.month === mesSeleccionado && h.year === yearSeleccionado
+        );
+    }
+    return undefined;
+}
+
 // Crear tarjeta de persona
 function crearPersonaCard(persona, index) {
     const card = document.createElement('div');
@@ -396,17 +473,13 @@ function crearPersonaCard(persona, index) {
     let comentarioActual = '';
     let tieneRegistro = false;
     
-    if (persona.hours) {
-        const horasMes = persona.hours.find(h => 
-            h.month === mesSeleccionado && h.year === yearSeleccionado
-        );
-        if (horasMes) {
-            tieneRegistro = true;
-            horasActuales = horasMes.hours || 0;
-            participo = horasMes.Participo !== undefined ? horasMes.Participo : true;
-            estudiosActuales = horasMes.estudios || 0;
-            comentarioActual = horasMes.Comentario || '';
-        }
+    const horasMes = obtenerRegistroMes(persona);
+    if (horasMes) {
+        tieneRegistro = true;
+        horasActuales = horasMes.hours || 0;
+        participo = horasMes.Participo !== undefined ? horasMes.Participo : true;
+        estudiosActuales = horasMes.estudios || 0;
+        comentarioActual = horasMes.Comentario || '';
     }
     
     const estados = [
@@ -540,9 +613,8 @@ function crearPersonaCard(persona, index) {
     return card;
 }
 
-// Guardar cambios de persona
-async function guardarPersona(personaId) {
-    const persona = personasData.find(p => p.id === personaId);
+// Leer del formulario el estado y el registro del mes de una persona
+function leerDatosPersona(personaId) {
     const state = document.getElementById(`state-${personaId}`).value;
     const esPublicador = state === 'Publicador';
     
@@ -562,13 +634,61 @@ async function guardarPersona(personaId) {
         hoursData.hours = 0;
     }
     
-    const data = {
+    return {
         hours: hoursData,
         state: state
     };
+}
+
+// Actualizar los datos locales y la tarjeta de una persona ya guardada
+function actualizarPersonaLocal(personaId, state, hoursData) {
+    const personaIndex = personasData.findIndex(p => p.id === personaId);
+    if (personaIndex === -1) return;
+    
+    aplicarRegistroPersona(personasData[personaIndex], state, hoursData);
+    if (offlineDisponible()) {
+        guardarPersonaOffline(personaId, state, hoursData).catch(error => {
+            console.warn('No se pudo actualizar la copia offline:', error);
+        });
+    }
+    
+    // Recrear la tarjeta para mostrar el check actualizado
+    const container = document.getElementById('personas-container');
+    const cards = container.querySelectorAll('.persona-card');
+    const cardIndex = Array.from(cards).findIndex(card => card.querySelector(`#state-${personaId}`));
+    
+    if (cardIndex !== -1) {
+        const newCard = crearPersonaCard(personasData[personaIndex], cardIndex);
+        cards[cardIndex].replaceWith(newCard);
+    }
+}
+
+// Guardar en la cola offline los cambios de varias personas
+async function guardarSinConexion(personas) {
+    for (const persona of personas) {
+        await encolarCambio(persona.id, grupoSeleccionado, persona);
+        actualizarPersonaLocal(persona.id, persona.state, persona.hours);
+    }
+    const mensaje = personas.length === 1 ? 'Guardado sin conexión' : `${personas.length} personas guardadas sin conexión`;
+    showToast(`${mensaje}: se enviará al recuperar la conexión`, true);
+}
+
+// Un fallo de red en fetch es un TypeError; con él, los cambios van a la cola
+function esErrorDeRed(error) {
+    return !navigator.onLine || error instanceof TypeError;
+}
+
+// Guardar cambios de persona
+async function guardarPersona(personaId) {
+    const data = leerDatosPersona(personaId);
     
     try {
         showLoading(true);
+        if (offlineDisponible() && !navigator.onLine) {
+            await guardarSinConexion([{ id: personaId, ...data }]);
+            showLoading(false);
+            return;
+        }
         const response = await fetch(`/api/persona/${personaId}`, {
             method: 'PUT',
             headers: {
@@ -581,45 +701,84 @@ async function guardarPersona(personaId) {
         
         if (result.success) {
             showToast('Cambios guardados correctamente', true);
-            
-            // Actualizar datos locales
-            const personaIndex = personasData.findIndex(p => p.id === personaId);
-            if (personaIndex !== -1) {
-                personasData[personaIndex].state = state;
-                if (!personasData[personaIndex].hours) {
-                    personasData[personaIndex].hours = [];
-                }
-                const horasIndex = personasData[personaIndex].hours.findIndex(h => 
-                    h.month === mesSeleccionado && h.year === yearSeleccionado
-                );
-                if (horasIndex !== -1) {
-                    personasData[personaIndex].hours[horasIndex] = hoursData;
-                } else {
-                    personasData[personaIndex].hours.push(hoursData);
-                }
-                
-                // Recrear la tarjeta para mostrar el check actualizado
-                const container = document.getElementById('personas-container');
-                const cards = container.querySelectorAll('.persona-card');
-                const cardIndex = Array.from(cards).findIndex(card => card.querySelector(`#state-${personaId}`));
-                
-                if (cardIndex !== -1) {
-                    const newCard = crearPersonaCard(personasData[personaIndex], cardIndex);
-                    cards[cardIndex].replaceWith(newCard);
-                }
-            }
+            actualizarPersonaLocal(personaId, data.state, data.hours);
         } else {
             showToast('Error al guardar cambios', false);
         }
         
         showLoading(false);
     } catch (error) {
+        if (offlineDisponible() && esErrorDeRed(error)) {
+            await guardarSinConexion([{ id: personaId, ...data }]).catch(errorLocal => {
+                console.error('Error al guardar sin conexión:', errorLocal);
+                showToast('Error al guardar cambios', false);
+            });
+            showLoading(false);
+            return;
+        }
         console.error('Error al guardar persona:', error);
         showToast('Error al guardar cambios', false);
         showLoading(false);
     }
 }
 
+// Guardar todas las personas del grupo en una sola petición
+async function guardarTodos() {
+    if (!grupoSeleccionado || !mesSeleccionado) return;
+    
+    const personas = personasData.map(persona => ({
+        id: persona.id,
+        ...leerDatosPersona(persona.id)
+    }));
+    
+    try {
+        showLoading(true);
+        if (offlineDisponible() && !navigator.onLine) {
+            await guardarSinConexion(personas);
+            showLoading(false);
+            return;
+        }
+        const response = await fetch(`/api/reporte/${grupoSeleccionado}/${mesSeleccionado}/${yearSeleccionado}/bulk`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ personas: personas })
+        });
+        
+        const result = await response.json();
+        
+        if (result.resultados) {
+            result.resultados.forEach((resultado, i) => {
+                if (resultado.success) {
+                    actualizarPersonaLocal(personas[i].id, personas[i].state, personas[i].hours);
+                }
+            });
+        }
+        
+        if (result.success) {
+            showToast(`${result.guardados} personas guardadas correctamente`, true);
+        } else {
+            const fallidos = result.resultados ? result.resultados.length - result.guardados : personas.length;
+            showToast(`Error al guardar ${fallidos} personas`, false);
+        }
+        
+        showLoading(false);
+    } catch (error) {
+        if (offlineDisponible() && esErrorDeRed(error)) {
+            await guardarSinConexion(personas).catch(errorLocal => {
+                console.error('Error al guardar sin conexión:', errorLocal);
+                showToast('Error al guardar cambios', false);
+            });
+            showLoading(false);
+            return;
+        }
+        console.error('Error al guardar el grupo:', error);
+        showToast('Error al guardar cambios', false);
+        showLoading(false);
+    }
+}
+
 // Actualizar campos cuando cambia el estado
 function actualizarCamposPersona(personaId) {
     const personaIndex = personasData.findIndex(p => p.id === personaId);
@@ -675,6 +834,22 @@ async function exportarPDF() {
     }
 }
 
+// Exportar todos los grupos (PDF y Excel en un ZIP)
+async function exportarCongregacion() {
+    if (!mesSeleccionado) return;
+    
+    try {
+        showLoading(true);
+        window.location.href = `/api/export/congregacion/${mesSeleccionado}/${yearSeleccionado}`;
+        showLoading(false);
+        showToast('Exportando todos los grupos...', true);
+    } catch (error) {
+        console.error('Error al exportar la congregación:', error);
+        showToast('Error al exportar todos los grupos', false);
+        showLoading(false);
+    }
+}
+
 // Funciones de navegación
 function cambiarSeccion(seccionId) {
     const secciones = document.querySelectorAll('.section');
@@ -743,7 +918,8 @@ function cerrarModalNuevo() {
     document.getElementById('modal-nuevo').classList.remove('active');
 }
 
-async function crearNuevoPublisher() {
+// Crear el publisher; con confirmar se crea aunque haya otros con un nombre parecido
+async function crearNuevoPublisher(confirmar = false) {
     const name = document.getElementById('nuevo-name').value.trim();
     const groupID = parseInt(document.getElementById('nuevo-groupid').value);
     const state = document.getElementById('nuevo-state').value;
@@ -757,7 +933,8 @@ async function crearNuevoPublisher() {
         name: name,
         groupID: groupID,
         state: state,
-        hours: []
+        hours: [],
+        confirmar: confirmar
     };
     
     try {
@@ -772,6 +949,12 @@ async function crearNuevoPublisher() {
         
         const result = await response.json();
         
+        if (response.status === 409 && result.duplicados) {
+            showLoading(false);
+            confirmarDuplicado(name, result.duplicados);
+            return;
+        }
+        
         if (result.success) {
             showToast('Publisher creado correctamente', true);
             cerrarModalNuevo();
@@ -788,6 +971,24 @@ async function crearNuevoPublisher() {
     }
 }
 
+// Preguntar antes de crear un publisher con el nombre de otro ya existente
+function confirmarDuplicado(name, duplicados) {
+    const parecidos = duplicados
+        .slice(0, 3)
+        .map(persona => `"${persona.name}" (Grupo ${persona.groupID})`)
+        .join(', ');
+    document.getElementById('confirm-message').textContent =
+        `Ya existe ${parecidos}. ¿Deseas crear a "${name}" de todos modos?`;
+    document.getElementById('modal-confirmar').classList.add('active');
+    
+    const btnConfirm = document.getElementById('btn-confirm-action');
+    btnConfirm.innerHTML = '<i class="fas fa-user-plus"></i> Crear';
+    btnConfirm.onclick = function() {
+        cerrarModalConfirmar();
+        crearNuevoPublisher(true);
+    };
+}
+
 // Confirmar y eliminar publisher
 function confirmarEliminarPublisher(publisherId, publisherName) {
     // Mostrar modal de confirmación
@@ -796,6 +997,7 @@ function confirmarEliminarPublisher(publisherId, publisherName) {
     
     // Configurar el botón de confirmación
     const btnConfirm = document.getElementById('btn-confirm-action');
+    btnConfirm.innerHTML = '<i class="fas fa-trash"></i> Eliminar';
     btnConfirm.onclick = function() {
         cerrarModalConfirmar();
         eliminarPublisher(publisherId);
@@ -830,19 +1032,10 @@ async function eliminarPublisher(publisherId) {
     }
 }
 
-// Filtrar publishers en administración
+// Filtrar publishers en administración: búsqueda en el índice de nombres del servidor
 function filtrarPublishersAdmin() {
-    const searchTerm = document.getElementById('admin-search-all').value.toLowerCase();
-    const cards = document.querySelectorAll('#admin-all-personas-container .admin-persona-card');
-    
-    cards.forEach(card => {
-        const nombre = card.getAttribute('data-nombre');
-        if (nombre.includes(searchTerm)) {
-            card.style.display = 'block';
-        } else {
-            card.style.display = 'none';
-        }
-    });
+    clearTimeout(adminBusquedaTimer);
+    adminBusquedaTimer = setTimeout(() => cargarTodosPublishersAdmin(), 300);
 }
 
 // Funciones de UI
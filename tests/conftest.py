@@ -0,0 +1,33 @@
+"""App sobre el Firestore falso de los benchmarks, con una congregación sembrada
+
+    python -m pytest tests
+"""
+import os
+
+import pytest
+
+os.environ.setdefault('PUBLISHERS_SNAPSHOT', 'false')
+os.environ.setdefault('STORAGE_BACKEND', 'firestore')
+
+from benchmarks.fake_firestore import FirestoreFalso, instalar  # noqa: E402
+
+instalar(FirestoreFalso())
+
+import app as aplicacion  # noqa: E402
+from benchmarks.run import sembrar  # noqa: E402
+from rebuild_rollups import reconstruir  # noqa: E402
+
+MES, YEAR = 12, 2024
+MESES = aplicacion.meses_en_rango((10, 2024), (MES, YEAR))
+
+
+@pytest.fixture(params=['array', 'map'])
+def cliente(request, monkeypatch):
+    """Cliente de la app con Publishers sembrados y Rollups/Reports reconstruidos"""
+    db = FirestoreFalso()
+    monkeypatch.setattr(aplicacion, '_db', db)
+    monkeypatch.setattr(aplicacion, 'HOURS_LAYOUT', request.param)
+    aplicacion.invalidar_reporte()
+    sembrar(db, aplicacion.GRUPOS, 8, 1, MES, YEAR, request.param, 7)
+    reconstruir(MESES)
+    return aplicacion.app.test_client()
@@ -0,0 +1,17 @@
+"""Importar app cabe en el presupuesto de arranque y no carga los módulos diferidos
+
+Como python -m benchmarks.arranque: mide con los .pyc al día (compileall) para no
+contar la compilación de app.py.
+"""
+import statistics
+
+from benchmarks.arranque import MODULOS_DIFERIDOS, PRESUPUESTO_MS, medir_arranque
+
+
+def test_arranque():
+    medidas = [medir_arranque() for _ in range(3)]
+    assert statistics.median(m['import_ms'] for m in medidas) <= PRESUPUESTO_MS
+    # ReportLab, XlsxWriter, pyarrow, Firebase... esperan al primer uso
+    assert {'reportlab', 'xlsxwriter', 'pyarrow'} <= set(MODULOS_DIFERIDOS)
+    for medida in medidas:
+        assert medida['cargados'] == []
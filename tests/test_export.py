@@ -0,0 +1,34 @@
+"""El PDF de la congregación reutiliza el de cada grupo que no cambió"""
+import app as aplicacion
+from tests.conftest import MES, YEAR
+
+
+def test_solo_se_maqueta_el_grupo_editado(cliente, monkeypatch):
+    monkeypatch.setattr(aplicacion, 'EXPORT_PROCESOS', 1)
+    monkeypatch.setattr(aplicacion, 'pdf_cache', aplicacion.CacheLRU(32, 60))
+
+    maquetados = []
+    pdf_grupo = aplicacion.pdf_grupo
+
+    def contar(datos):
+        maquetados.append(datos['grupo'])
+        return pdf_grupo(datos)
+    monkeypatch.setattr(aplicacion, 'pdf_grupo', contar)
+
+    url = f'/api/export/congregacion/{MES}/{YEAR}?formato=pdf'
+    antes = cliente.get(url)
+    assert antes.status_code == 200
+    assert sorted(maquetados) == sorted(aplicacion.GRUPOS)
+
+    maquetados.clear()
+    registro = {'month': MES, 'year': YEAR, 'hours': 0, 'estudios': 0, 'Participo': False, 'Comentario': ''}
+    assert cliente.put('/api/persona/pub-3-0001', json={'hours': registro}).status_code == 200
+    despues = cliente.get(url)
+    assert despues.status_code == 200
+    assert maquetados == [3]
+    assert despues.data != antes.data
+
+    # La exportación del grupo sin cambios sale de la misma cache
+    maquetados.clear()
+    assert cliente.get(f'/api/export/pdf/1/{MES}/{YEAR}').status_code == 200
+    assert maquetados == []
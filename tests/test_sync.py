@@ -0,0 +1,28 @@
+"""POST /api/sync distingue los cambios rechazados de los que hay que reenviar"""
+import app as aplicacion
+from tests.conftest import MES, YEAR
+
+REGISTRO = {'month': MES, 'year': YEAR, 'hours': 3, 'estudios': 0, 'Participo': True, 'Comentario': ''}
+
+
+def test_error_de_transaccion_se_reintenta(cliente, monkeypatch):
+    def abortar(*args):
+        raise RuntimeError('Aborted')
+    monkeypatch.setattr(aplicacion, 'guardar_lote_mes_txn', abortar)
+    
+    respuesta = cliente.post('/api/sync', json={'cambios': [
+        {'id': 'pub-1-0001', 'grupo': 1, 'hours': REGISTRO},
+        {'id': 'pub-1-0001', 'grupo': 1, 'hours': REGISTRO},
+        {'id': 'pub-1-0002'}
+    ]}).get_json()
+    assert [r['success'] for r in respuesta['resultados']] == [False, False, False]
+    assert [r.get('reintentar', False) for r in respuesta['resultados']] == [True, True, False]
+
+
+def test_rechazo_no_se_reintenta(cliente):
+    respuesta = cliente.post('/api/sync', json={'cambios': [
+        {'id': 'pub-3-0001', 'grupo': 1, 'hours': REGISTRO},
+        {'id': 'pub-1-0001', 'grupo': 1, 'hours': REGISTRO}
+    ]}).get_json()
+    assert [r['success'] for r in respuesta['resultados']] == [False, True]
+    assert not any(r.get('reintentar') for r in respuesta['resultados'])
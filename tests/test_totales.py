@@ -0,0 +1,130 @@
+"""Los totales del dashboard (Reports/) coinciden con /api/reporte tras cada escritura"""
+import app as aplicacion
+from tests.conftest import MES, MESES, YEAR
+
+
+def totales(datos):
+    """Totales de un informe o de un grupo del dashboard, con los ceros explícitos"""
+    return {
+        'totales': {estado: datos['totales'].get(estado, 0) for estado in aplicacion.ESTADOS},
+        'totales_estudios': {
+            estado: datos['totales_estudios'].get(estado, 0) for estado in aplicacion.ESTADOS[1:]
+        },
+        'total_general': datos['total_general'],
+        'total_estudios_general': datos['total_estudios_general']
+    }
+
+
+def comprobar_totales(cliente):
+    for mes, year in MESES:
+        dashboard = cliente.get(f'/api/dashboard/{mes}/{year}').get_json()
+        for grupo in dashboard['grupos']:
+            reporte = cliente.get(f"/api/reporte/{grupo['grupo']}/{mes}/{year}").get_json()
+            assert totales(grupo) == totales(reporte), (grupo['grupo'], mes, year)
+
+
+def comprobar_rollups(cliente):
+    rango = cliente.get(f'/api/reporte/rango/0?desde=2024-10&hasta={YEAR}-{MES:02d}').get_json()
+    personas = {persona['id']: persona for persona in aplicacion.RepositorioFirestore().exportar()}
+    assert {persona['id'] for persona in rango['personas']} == set(personas)
+    for persona in rango['personas']:
+        assert persona['grupo'] == personas[persona['id']]['groupID']
+        assert persona['nombre'] == personas[persona['id']]['name']
+
+
+def test_cambio_de_estado(cliente):
+    persona_id = 'pub-1-0001'
+    estado = aplicacion.get_db().collection('Publishers').document(persona_id).get().to_dict()['state']
+    nuevo = next(e for e in ('Precursor Regular', 'Publicador') if e != estado)
+    assert cliente.put(f'/api/persona/{persona_id}', json={'state': nuevo}).status_code == 200
+    comprobar_totales(cliente)
+
+
+def test_cambio_de_estado_y_horas(cliente):
+    persona_id = 'pub-2-0003'
+    respuesta = cliente.put(f'/api/persona/{persona_id}', json={
+        'state': 'Precursor Auxiliar',
+        'hours': {'month': 11, 'year': 2024, 'hours': 30, 'estudios': 2, 'Participo': True, 'Comentario': ''}
+    })
+    assert respuesta.status_code == 200
+    comprobar_totales(cliente)
+
+
+def test_cambio_de_grupo_y_estado_en_administracion(cliente):
+    respuesta = cliente.put('/api/persona/admin/pub-3-0002', json={
+        'name': 'Nombre Cambiado', 'groupID': 5, 'state': 'Precursor Regular'
+    })
+    assert respuesta.status_code == 200
+    comprobar_totales(cliente)
+    comprobar_rollups(cliente)
+
+
+def test_eliminar(cliente):
+    assert cliente.delete('/api/publishers/pub-4-0005').status_code == 200
+    comprobar_totales(cliente)
+    comprobar_rollups(cliente)
+
+
+def test_guardado_en_bloque(cliente):
+    personas = [
+        {'id': 'pub-6-0001', 'state': 'Precursor Regular',
+         'hours': {'hours': 40, 'estudios': 1, 'Participo': True, 'Comentario': ''}},
+        {'id': 'pub-6-0002', 'hours': {'hours': 5, 'estudios': 0, 'Participo': True, 'Comentario': ''}},
+        {'id': 'pub-6-0002', 'hours': {'hours': 7, 'estudios': 2, 'Participo': True, 'Comentario': ''}},
+        {'id': 'pub-6-0003', 'state': 'Publicador'},
+        {'id': 'pub-1-0001', 'hours': {'hours': 1}}
+    ]
+    resultados = cliente.post(f'/api/reporte/6/{MES}/{YEAR}/bulk', json={'personas': personas}).get_json()
+    assert [r['success'] for r in resultados['resultados']] == [True, True, True, True, False]
+    comprobar_totales(cliente)
+    comprobar_rollups(cliente)
+
+
+def test_guardar_con_las_dos_copias_de_los_registros(cliente, monkeypatch):
+    """Con hours y months a la vez (migración sin --drop-hours o vuelta a la lista) manda HOURS_LAYOUT"""
+    from migrate_hours import migrar
+    
+    if aplicacion.HOURS_LAYOUT == 'array':
+        migrar()
+    else:
+        monkeypatch.setattr(aplicacion, 'HOURS_LAYOUT', 'array')
+    
+    persona_id = 'pub-2-0004'
+    registro = {'month': 11, 'year': 2024, 'hours': 33, 'estudios': 3, 'Participo': True, 'Comentario': 'nuevo'}
+    assert cliente.put(f'/api/persona/{persona_id}', json={'hours': registro}).status_code == 200
+    
+    nombre = aplicacion.get_db().collection('Publishers').document(persona_id).get().to_dict()['name']
+    
+    def fila(mes, year):
+        reporte = cliente.get(f'/api/reporte/2/{mes}/{year}').get_json()
+        return next(f for estado in reporte['reporte'].values() for f in estado if f['nombre'] == nombre)
+    
+    assert fila(11, 2024)['horas'] == 33
+    # Los demás meses siguen ahí
+    assert fila(MES, YEAR)['comentario'] != 'nuevo'
+    comprobar_totales(cliente)
+
+
+def test_horas_que_no_son_numeros(cliente):
+    """Como en el informe, lo que no es un número cuenta 0 y no estropea el resto del lote"""
+    registro = {'month': 11, 'year': 2024, 'hours': '7', 'estudios': None, 'Participo': True, 'Comentario': ''}
+    assert cliente.put('/api/persona/pub-2-0001', json={'state': 'Precursor Regular', 'hours': registro}).status_code == 200
+    assert cliente.put('/api/persona/pub-2-0002', json={'hours': dict(registro, hours=None)}).status_code == 200
+    
+    personas = [
+        {'id': 'pub-5-0001', 'hours': {'hours': 'siete', 'estudios': '1', 'Participo': True}},
+        {'id': 'pub-5-0002', 'hours': {'hours': 12, 'estudios': 2, 'Participo': True}}
+    ]
+    resultados = cliente.post(f'/api/reporte/5/{MES}/{YEAR}/bulk', json={'personas': personas}).get_json()
+    assert [r['success'] for r in resultados['resultados']] == [True, True]
+    comprobar_totales(cliente)
+    comprobar_rollups(cliente)
+
+
+def test_mes_fuera_de_rango(cliente):
+    personas = [{'id': 'pub-1-0001', 'hours': {'hours': 3, 'estudios': 0, 'Participo': True}}]
+    assert cliente.post(f'/api/reporte/1/13/{YEAR}/bulk', json={'personas': personas}).status_code == 400
+    assert cliente.post(f'/api/reporte/1/0/{YEAR}/bulk', json={'personas': personas}).status_code == 400
+    assert cliente.get(f'/api/dashboard/0/{YEAR}').status_code == 400
+    assert cliente.get(f'/api/dashboard/13/{YEAR}').status_code == 400
+    assert not [r for r in aplicacion.get_db().collection('Rollups').stream() if r.id.endswith('-13')]